@@ -26,21 +26,1602 @@ Notes:          1. This code is a modified version of "convert_gui.py" by Rohan
 """
 
 #Import Libraries
+#tkinter, matplotlib, the spc submodules and the profiling, csv and process pool modules are imported where first used, so headless
+#runs, watchers, the server and workers only load what they need
 from __future__ import division, absolute_import, unicode_literals, print_function
-from tkinter import *
-#from tkinter import Tk, StringVar, DISABLED, NORMAL, END, W, E, N, S, Menu
-from tkinter.ttk import Frame, Label, Button, Radiobutton, Entry, Progressbar
-from tkinter import filedialog
 import spc
 import os
-import math
+import sys
+import glob
+import json
+import time
+import shutil
+import argparse
+from collections import OrderedDict
 import numpy as np
-import matplotlib.patches as mpatches
-import matplotlib.pyplot as plt
+
+try:
+    import resource
+except ImportError:
+    #Not available on Windows
+    resource = None
+
+#Import the tkinter names of AnalyzeSPC into this module, themed widgets where tkinter.ttk has them. Called when the GUI opens, so no
+#other run loads tkinter. Raises ImportError if Python was built without Tk
+def import_gui():
+
+    global Tk, Toplevel, Menu, Message, Checkbutton, StringVar, IntVar, DoubleVar, DISABLED, NORMAL, W, E, N, S, filedialog
+    global Frame, Label, Button, Radiobutton, Entry, Progressbar
+
+    from tkinter import Tk, Toplevel, Menu, Message, Checkbutton, StringVar, IntVar, DoubleVar, DISABLED, NORMAL, W, E, N, S, filedialog
+    from tkinter.ttk import Frame, Label, Button, Radiobutton, Entry, Progressbar
+
+#Output file extension and delimiter for a format choice ('txt', 'csv' or 'spc')
+def output_format( fmt ):
+
+    if fmt == 'txt':
+        return '.txt', '\t'
+
+    #Binary SPC, readable by the instrument software
+    if fmt == 'spc':
+        return '.spc', None
+
+    #Default is CSV
+    return '.csv', ','
+
+#Get ( grain, measurement ) from SomeFileName_GrainNumber_MeasurementNumberOnGrain.spc, None if not in that format
+def grain_key( fname ):
+
+    #Check extension
+    if not fname.lower().endswith('spc'):
+        return None
+
+    #Split file name by underscores
+    f_split = os.path.splitext( fname )[0].split("_")
+
+    #Ensure correct format for tracking
+    if len( f_split ) < 2:
+        return None
+
+    try:
+        return int( f_split[-2] ), int( f_split[-1] )
+    except ValueError:
+        return None
+
+#Write the plot and/or data file of an averaged grain
+#probe ( see spc.instrument ) is charged the 'plot' and 'write' time. Plots of 'max' normalized data ( see normalize_measurements ) are
+#drawn from 0 to just above normalized_to, others are scaled to fit
+def write_grain_outputs( out_dir, grain, x, y, sem, normalized_to, output_plot, output_data, exten, delim, probe = None,
+                         normalize = 'max' ):
+
+    if probe is None:
+        probe = spc.instrument.null_probe
+
+    #If plot, save plot data as PNG
+    if output_plot:
+
+        import matplotlib.patches as mpatches
+        import matplotlib.pyplot as plt
+
+        #Plot normalized and averaged values
+        figsize = ( 16, 9 )
+        plt.figure( figsize = figsize, dpi = 600 )
+
+        plt.plot( x, y, color = '#000099', lw = 0.5 )
+
+        #Calc total SEM Values
+        sem_above = []
+        sem_below = []
+
+        for k in range( len( sem ) ):
+
+            sem_above.append( y[k] + sem[k] )
+            sem_below.append( y[k] - sem[k] )
+
+        #Plot +/- SEM
+        plt.fill_between( x, sem_below, sem_above, facecolor = '#9999FF', interpolate = True )
+
+        plt.xlabel( 'cm^-1' )
+        plt.xticks( np.arange( min( x ), max( x )+1, 500.) )
+
+        if normalize == 'max':
+            plt.ylabel( 'Intensity (Normalized to {})'.format( normalized_to ) )
+
+            plt.ylim( 0., normalized_to*1.1 )
+            plt.yticks( np.arange( 0., normalized_to*1.1, step = 0.2*normalized_to ) )
+
+        else:
+            plt.ylabel( 'Intensity (Normalized, {})'.format( normalize ) )
+
+        data_line = mpatches.Patch(color='#000099', label='Averaged Data' )
+        sem_colors = mpatches.Patch(color='#9999FF', label='SEM Range')
+
+        plt.legend(handles=[data_line, sem_colors])
+
+        plt.title( "Averaged Data in Grain {}".format( grain ) )
+
+        plt.grid(True)
+
+        plt.savefig( os.path.join(out_dir, "Grain {} - Averaged_RAMAN.png".format( grain )) )
+
+        #Release the figure, watch mode re-plots the same grain many times
+        plt.close()
+
+        probe.mark( 'plot' )
+
+    #Average and SEM as the two subfiles of an SPC file
+    if output_data and exten == '.spc':
+
+        spc.save( os.path.join(out_dir, "Grain {} - Averaged_RAMAN{}".format( grain, exten )), np.array( [ y, sem ] ), x,
+                  comment = "Grain {} averaged, subfile 1: average, subfile 2: SEM".format( grain ) )
+
+        probe.mark( 'write' )
+
+    #If output type enabled, output data type
+    elif output_data:
+
+        #Open File
+        fle     = open( os.path.join(out_dir, "Grain {} - Averaged_RAMAN{}".format( grain, exten )) , 'w' )
+
+        #Create Header
+        header  = "x" + delim + "y-Ave" + delim + "y-SEM\n"
+        fle.write( header )
+
+        #Cycle through 'x' values for SEM and
+        for l in range( len( sem ) ):
+            line = str( x[l] )
+            line += delim + str( y[l] )
+            line += delim + str( sem[l] )
+            line += "\n"
+            fle.write( line )
+
+        #Close File
+        fle.close()
+
+        probe.mark( 'write' )
+
+#Find the peaks of every grain in the averaged ( n_grains, n_points ) matrix means and fit them over the windows of peaks ( see
+#peak_settings ), weighting each point by its SEM. grains labels the rows. Writes 'Peaks.csv' ( every peak found ) and, with windows,
+#'Peak Fits.csv' ( positions, heights, widths and areas with their errors ) into out_dir. Windows holding none of the 'x' values are
+#reported and skipped
+def write_peak_tables( out_dir, grains, x, means, sems, peaks, probe = None ):
+
+    if probe is None:
+        probe = spc.instrument.null_probe
+
+    windows = []
+
+    for lo, hi in peaks['windows']:
+
+        if ( ( x >= min( lo, hi ) ) & ( x <= max( lo, hi ) ) ).any():
+            windows.append( ( lo, hi ) )
+        else:
+            print( "Peak window {}:{} holds none of the 'x' values ({} to {}), skipped".format( lo, hi, x.min(), x.max() ) )
+
+    found, fitted = spc.peaks.characterize( x, means, sems, windows, peaks['prominence'], peaks['width'], peaks['shape'] )
+
+    import csv
+
+    for name, table in ( ( "Peaks.csv", found ), ( "Peak Fits.csv", fitted ) ):
+
+        if table is None:
+            continue
+
+        with open( os.path.join( out_dir, name ), 'w', newline = '' ) as fle:
+
+            writer = csv.writer( fle )
+            writer.writerow( table._fields )
+
+            for row in spc.peaks.rows( table, grains ):
+
+                if 'window' in row:
+                    row['window'] = "{}:{}".format( *windows[ row['window'] ] )
+
+                writer.writerow( row.values() )
+
+    probe.mark( 'peaks' )
+
+#Sort the SPC files of a folder by grain: { grain : [ paths in measurement order ] }
+#folder may be a zip or tar archive, whose members ( at any depth ) get paths inside it, see spc.archive
+def scan_grains( folder ):
+
+    grains = {}
+
+    if spc.archive.is_archive( folder ):
+        paths = spc.archive.list_spc( folder )
+    else:
+        paths = [ os.path.join( folder, f ) for f in os.listdir( folder ) ]
+
+    for path in paths:
+
+        key = grain_key( os.path.basename( path ) )
+
+        if key is not None:
+            grains.setdefault( key[0], [] ).append( ( key[1], path ) )
+
+    return { g : [ path for m, path in sorted( m_list ) ] for g, m_list in grains.items() }
+
+#Decoded measurements kept between jobs of a long-running process ( see AnalysisServer ), least recently used dropped first.
+#Keyed on path, size and modification time as well as the load options, so changed files are read again. Off while max_items is 0
+class MeasurementCache:
+
+    def __init__( self, max_items = 0 ):
+
+        self.max_items  = max_items
+        self.items      = OrderedDict()
+        self.hits       = 0
+        self.misses     = 0
+        self.lock       = None          #Made by enable, so loading the module does not import threading
+        self.enable( max_items )
+
+    def enable( self, max_items ):
+
+        if max_items and self.lock is None:
+            import threading
+            self.lock = threading.Lock()
+
+        self.max_items = max_items
+
+    def key( self, path, xrange, dtype = np.float64 ):
+
+        st = spc.archive.stat( path )
+        return ( os.path.abspath( path ), st.st_size, st.st_mtime_ns, xrange, np.dtype( dtype ).str )
+
+    def get( self, key ):
+
+        with self.lock:
+
+            value = self.items.get( key )
+
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.items.move_to_end( key )
+
+            return value
+
+    def put( self, key, value ):
+
+        with self.lock:
+
+            self.items[ key ] = value
+
+            while len( self.items ) > self.max_items:
+                self.items.popitem( last = False )
+
+measurement_cache = MeasurementCache()
+
+#Pool initializer of the server's workers
+def enable_measurement_cache( max_items ):
+    measurement_cache.enable( max_items )
+
+#Load, despike and normalize a single measurement, optionally only the points inside xrange. Returns 'x' and 'y' arrays, 'y' in dtype
+#( np.float32 halves the memory of spectra and caches ), normalizing is left to normalize_measurements. probe ( see spc.instrument )
+#is charged the 'load' and 'sanitize' time. The returned arrays may be shared through measurement_cache
+#and must not be modified. If fields is a dict, the index columns of the file ( see spc.index.file_fields ) are put in fields[ path ],
+#unless xrange cut its 'x' values or it came from the cache
+def load_measurement( path, xrange = None, probe = None, dtype = np.float64, fields = None ):
+
+    if probe is None:
+        probe = spc.instrument.null_probe
+
+    if measurement_cache.max_items:
+
+        key = measurement_cache.key( path, xrange, dtype )
+        hit = measurement_cache.get( key )
+
+        if hit is not None:
+            probe.mark( 'load' )
+            probe.count( 'cached' )
+            probe.count( 'files' )
+            probe.count( 'spectra' )
+            probe.count( 'points', len( hit[1] ) )
+            return hit
+
+    #Arrays straight from the decoder, 'y' stays in dtype from here on
+    f    = spc.File( spc.archive.source( path ), xrange = xrange, dtype = dtype )
+    x, y = f.data_arrays()
+    x, y = np.asarray( x ), np.array( y, dtype = dtype )
+    probe.mark( 'load' )
+
+    if fields is not None and xrange is None:
+        fields[ path ] = spc.index.file_fields( f )
+
+    spc.cube.despike( y, x )
+    probe.mark( 'sanitize' )
+
+    probe.count( 'files' )
+    probe.count( 'spectra' )
+    probe.count( 'points', len( y ) )
+
+    result = x, y
+
+    if measurement_cache.max_items:
+        measurement_cache.put( key, result )
+
+    return result
+
+#'x' values of a measurement, without despiking or normalizing
+def measurement_x( path, xrange = None ):
+    return np.asarray( spc.File( spc.archive.source( path ), xrange = xrange ).data_arrays()[0] )
+
+#Normalize sanitized 'y' arrays with their 'x' values, smoothing them and removing their baselines first if smooth and baseline are
+#given. Spectra on the same 'x' values are processed as one stack, so spc.smooth and spc.baseline reuse their cached coefficients and
+#matrices across them. normalize is a spc.normalize spec ( 'max', 'area', 'band:LO:HI', 'l2' or 'snv' ) and max_h the value its
+#statistic is scaled to, baseline a spc.baseline spec such as 'als', smooth a spc.smooth spec such as 'savgol:11:3'. names ( e.g. the
+#paths ) identify the spectra in the ValueError raised for one that cannot be normalized, such as a flat spectrum under 'max'.
+#Returns the new arrays in the order given, and the ( scale, offset ) of each, y = ( smoothed y_in - baseline - offset )*scale
+def normalize_measurements( xs, ys, max_h, normalize = 'max', baseline = None, probe = None, smooth = None, names = None ):
+
+    if probe is None:
+        probe = spc.instrument.null_probe
+
+    mode, n_params = spc.normalize.parse( normalize )
+
+    if smooth is not None:
+        s_method, s_params = spc.smooth.parse( smooth )
+
+    if baseline is not None:
+        method, b_params = spc.baseline.parse( baseline )
+
+    #Shared 'x' arrays are usually the same object
+    by_x = OrderedDict()
+    for i, x in enumerate( xs ):
+        by_x.setdefault( ( len( x ), np.asarray( x ).tobytes() ), [] ).append( i )
+
+    out    = [ None ]*len( ys )
+    scales = [ None ]*len( ys )
+
+    for idx in by_x.values():
+
+        stack = np.stack( [ ys[i] for i in idx ] )
+
+        if smooth is not None:
+            stack = spc.smooth.smooth( stack, s_method, xs[ idx[0] ], **s_params )
+            probe.mark( 'smooth' )
+
+        if baseline is not None:
+            stack = spc.baseline.correct( stack, method, **b_params )
+            probe.mark( 'baseline' )
+
+        result = spc.normalize.normalize( stack, mode, max_h, xs[ idx[0] ], names = None if names is None else [ names[i] for i in idx ],
+                                          **n_params )
+        probe.mark( 'normalize' )
+
+        for k, i in enumerate( idx ):
+            out[i]    = result.y[k]
+            scales[i] = ( float( result.scale[k] ), float( result.offset[k] ) )
+
+    return out, scales
+
+#Average measurements of one grain in a single pass, a chunk of spectra at a time, keeping 'y' values in dtype.
+#Spectra whose 'x' values differ from grid ( default: the first one ) are resampled onto it in one batched step. The chunk is
+#normalized as a stack first, smoothed and with its baselines removed if smooth and baseline specs are given, see normalize_measurements.
+#Every spectrum of the chunk is held until it is folded into the Accumulator, so memory grows with len( paths ) ( FolderRun's chunk ),
+#not with the number of measurements on the grain.
+#Returns ( grid, Accumulator, resampled count, { path : ( scale, offset ) }, { path : index columns } ), the last only filled with records
+#( see load_measurement )
+def accumulate_files( paths, max_h, grid = None, xrange = None, probe = None, dtype = np.float64, baseline = None,
+                      normalize = 'max', smooth = None, records = False ):
+
+    if probe is None:
+        probe = spc.instrument.null_probe
+
+    xs     = []
+    ys     = []
+    fields = {}
+
+    for path in paths:
+
+        m_x, m_y = load_measurement( path, xrange, probe, dtype, fields if records else None )
+        xs.append( m_x )
+        ys.append( m_y )
+
+    ys, scales = normalize_measurements( xs, ys, max_h, normalize, baseline, probe, smooth, paths )
+
+    if grid is None:
+        grid = xs[0]
+
+    stack = spc.resample( xs, ys, grid )
+    n_mismatched = spc.grid.mismatched( xs, grid )
+    probe.mark( 'resample' )
+
+    acc = spc.Accumulator( dtype = dtype )
+    acc.add_stack( stack )
+    probe.mark( 'average' )
+
+    return grid, acc, n_mismatched, dict( zip( paths, scales ) ), fields
+
+#'x', mean and SEM of a grain at the points where at least one of its measurements has a value. Measurements resampled onto 'x' values
+#beyond their own range have none there ( see spc.resample ), and the Accumulator leaves those points out of its per point counts
+def covered( x, acc ):
+
+    keep = acc.n > 0
+
+    if keep.all():
+        return x, acc.mean, acc.sem()
+
+    return x[ keep ], acc.mean[ keep ], acc.sem()[ keep ]
+
+#Run accumulate_files on one chunk of a grain, in this or a worker process. Returns ( result, extras ) where extras holds
+#   'timings':      phase times and counts of the chunk, if timed
+#   'parse':        the worker's spc.instrument statistics, if instrumented, to be merged into the main registry
+#   'profile':      profile_path, where the chunk's cProfile stats were dumped, if given
+#   'traced_peak':  tracemalloc peak in bytes while profiling, and 'allocations' the largest allocation sites
+def accumulate_job( paths, max_h, grid = None, xrange = None, timed = False, instrumented = False, profile_path = None, dtype = np.float64,
+                    baseline = None, normalize = 'max', smooth = None, records = False ):
+
+    extras = {}
+    probe  = spc.instrument.Probe() if timed else spc.instrument.null_probe
+
+    if profile_path is not None:
+
+        import cProfile
+        import tracemalloc
+
+        #Leave tracing to whoever started it
+        own_trace = not tracemalloc.is_tracing()
+        if own_trace:
+            tracemalloc.start()
+        else:
+            tracemalloc.reset_peak()
+
+        prof = cProfile.Profile()
+        prof.enable()
+
+    if instrumented:
+        with spc.instrument.recording() as registry:
+            result = accumulate_files( paths, max_h, grid, xrange, probe, dtype, baseline, normalize, smooth, records )
+
+        extras['parse'] = registry.snapshot()
+
+    else:
+        result = accumulate_files( paths, max_h, grid, xrange, probe, dtype, baseline, normalize, smooth, records )
+
+    if profile_path is not None:
+
+        prof.disable()
+        prof.dump_stats( profile_path )
+
+        extras['profile']       = profile_path
+        extras['traced_peak']   = tracemalloc.get_traced_memory()[1]
+        extras['allocations']   = [ str( st ) for st in tracemalloc.take_snapshot().statistics( 'lineno' )[:10] ]
+
+        if own_trace:
+            tracemalloc.stop()
+
+    if timed:
+        extras['timings'] = probe.as_dict()
+
+    return result, extras
+
+#Peak resident memory of this process and of its finished worker processes in MB, None if unknown
+def peak_memory_mb():
+
+    if resource is None:
+        return None, None
+
+    #Kilobytes on Linux, bytes on macOS
+    scale = 1./( 1 << 20 ) if sys.platform == 'darwin' else 1./1024
+
+    return ( resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss*scale,
+             resource.getrusage( resource.RUSAGE_CHILDREN ).ru_maxrss*scale )
+
+#How a run splits its time between phases, with per grain timings and counts, peak memory and, for the profile_grains
+#slowest grains, cProfile stats and tracemalloc peaks. Pass to analyze_folder or analyze_map, then write() next to the outputs
+class RunReport:
+
+    PHASES = ( 'scan', 'load', 'sanitize', 'smooth', 'baseline', 'normalize', 'resample', 'average', 'sem', 'plot', 'write', 'peaks' )
+
+    def __init__( self, profile_grains = 0 ):
+
+        self.started        = time.time()
+        self.profile_grains = profile_grains
+        self.settings       = {}
+        self.phases         = {}
+        self.counters       = {}
+        self.grains         = {}
+        self.scales         = {}            #path -> ( scale, offset ) each measurement was normalized with
+
+        #Scratch folder for the cProfile dump of every chunk, only the slowest grains are kept
+        self.profile_dir    = None
+
+        if profile_grains:
+            import tempfile
+            self.profile_dir = tempfile.mkdtemp( prefix = "spc_profile_" )
+
+    #cProfile dump path for job n of grain, None if not profiling
+    def profile_path( self, grain, n ):
+
+        if self.profile_dir is None:
+            return None
+
+        return os.path.join( self.profile_dir, "{}_{}.prof".format( grain, n ) )
+
+    #Add a Probe record ( spc.instrument.Probe.as_dict ) to the run, and to grain if given
+    def add( self, timings, grain = None ):
+
+        targets = [ ( self.phases, self.counters ) ]
+
+        if grain is not None:
+            g = self.grain( grain )
+            targets.append( ( g['phases'], g['counters'] ) )
+
+        for phases, counters in targets:
+
+            for k, v in timings['phases'].items():
+                phases[k] = phases.get( k, 0. ) + v
+
+            for k, v in timings['counters'].items():
+                counters[k] = counters.get( k, 0 ) + v
+
+    #Add the extras of an accumulate_job chunk
+    def add_job( self, grain, extras ):
+
+        if 'timings' in extras:
+            self.add( extras['timings'], grain )
+
+        if 'profile' in extras:
+            g = self.grain( grain )
+            g['profiles'].append( extras['profile'] )
+            g['traced_peak'] = max( g['traced_peak'], extras['traced_peak'] )
+            g['allocations'].extend( extras['allocations'] )
+
+    def grain( self, grain ):
+        return self.grains.setdefault( grain, { 'phases' : {}, 'counters' : {}, 'profiles' : [], 'traced_peak' : 0, 'allocations' : [] } )
+
+    #Grains, slowest first
+    def slowest( self ):
+        return sorted( self.grains, key = lambda g: -sum( self.grains[g]['phases'].values() ) )
+
+    #Write 'Run Report.json' ( totals, phases, slowest grains ) and 'Run Report.csv' ( one row per grain ) into out_dir,
+    #and 'Grain N - Profile.prof' for the profiled grains. Returns the JSON path
+    def write( self, out_dir ):
+
+        rss, rss_workers    = peak_memory_mb()
+        busy                = sum( self.phases.values() )
+
+        order               = self.slowest()
+        slow                = []
+
+        for g in order[:self.profile_grains]:
+
+            info = self.grains[g]
+            prof = None
+
+            if info['profiles']:
+                import pstats
+
+                prof = os.path.join( out_dir, "Grain {} - Profile.prof".format( g ) )
+                pstats.Stats( *info['profiles'] ).dump_stats( prof )
+
+            slow.append( { 'grain'          : g,
+                           'seconds'        : sum( info['phases'].values() ),
+                           'traced_peak_mb' : info['traced_peak']/1e6,
+                           'allocations'    : info['allocations'],
+                           'profile'        : prof } )
+
+        if self.profile_dir is not None:
+            shutil.rmtree( self.profile_dir, ignore_errors = True )
+            self.profile_dir = None
+
+        phases = [ p for p in self.PHASES if p in self.phases ] + sorted( p for p in self.phases if p not in self.PHASES )
+
+        out = { 'settings'              : self.settings,
+                'wall_seconds'          : time.time() - self.started,
+                'phase_seconds'         : busy,
+                'grains'                : len( self.grains ),
+                'counters'              : self.counters,
+                'peak_rss_mb'           : rss,
+                'peak_rss_workers_mb'   : rss_workers,
+                'phases'                : { p : { 'seconds' : self.phases[p], 'share' : self.phases[p]/busy if busy else 0. } for p in phases },
+                'slowest'               : slow,
+                'scales'                : self.scales }
+
+        #Parser breakdown of the load phase
+        if spc.instrument.enabled:
+            out['parse'] = spc.instrument.registry.report()
+
+        import csv
+
+        json_path = os.path.join( out_dir, "Run Report.json" )
+
+        with open( json_path, 'w' ) as fle:
+            json.dump( out, fle, indent = 1 )
+
+        with open( os.path.join( out_dir, "Run Report.csv" ), 'w', newline = '' ) as fle:
+
+            writer = csv.writer( fle )
+            writer.writerow( [ 'grain', 'files', 'spectra', 'points', 'seconds' ] + list( self.PHASES[1:] ) )
+
+            for g in sorted( self.grains ):
+
+                info = self.grains[g]
+                writer.writerow( [ g ] + [ info['counters'].get( k, 0 ) for k in ( 'files', 'spectra', 'points' ) ] +
+                                 [ sum( info['phases'].values() ) ] + [ info['phases'].get( p, 0. ) for p in self.PHASES[1:] ] )
+
+        return json_path
+
+#Parse a grid choice: 'first', 'union' or START:STOP:STEP
+def parse_grid( text ):
+
+    if text in ( 'first', 'union' ):
+        return text
+
+    try:
+        start, stop, step = [ float( v ) for v in text.split( ':' ) ]
+    except ValueError:
+        raise argparse.ArgumentTypeError( "grid must be first, union or START:STOP:STEP" )
+
+    return start, stop, step
+
+#Parse an 'x' range: LO:HI
+def parse_xrange( text ):
+
+    try:
+        lo, hi = [ float( v ) for v in text.split( ':' ) ]
+    except ValueError:
+        raise argparse.ArgumentTypeError( "xrange must be LO:HI" )
+
+    return lo, hi
+
+#Check a baseline spec ( 'als', 'als:LAM:P', 'poly:DEG', 'rollingball:RADIUS', see spc.baseline.parse ), None for 'none'
+def parse_baseline( text ):
+
+    if text is None or text.lower() == 'none':
+        return None
+
+    try:
+        spc.baseline.parse( text )
+    except ValueError as e:
+        raise argparse.ArgumentTypeError( str( e ) )
+
+    return text
+
+#Check a smoothing spec ( 'savgol', 'savgol:WINDOW:ORDER', 'savgol:WINDOW:ORDER:DERIV' or 'moving:WINDOW', see spc.smooth.parse ),
+#None for 'none'
+def parse_smooth( text ):
+
+    if text is None or text.lower() == 'none':
+        return None
+
+    try:
+        spc.smooth.parse( text )
+    except ValueError as e:
+        raise argparse.ArgumentTypeError( str( e ) )
+
+    return text
+
+#Check a normalization spec ( 'max', 'area', 'band:LO:HI', 'l2' or 'snv', see spc.normalize.parse )
+def parse_normalize( text ):
+
+    try:
+        spc.normalize.parse( text )
+    except ValueError as e:
+        raise argparse.ArgumentTypeError( str( e ) )
+
+    return text
+
+#Check a peak detection spec PROMINENCE[:WIDTH], the least prominence ( in normalized 'y' units ) and width ( in 'x' units ) of a peak
+def parse_peaks( text ):
+
+    try:
+        peak_settings( text )
+    except ValueError:
+        raise argparse.ArgumentTypeError( "peaks must be PROMINENCE[:WIDTH], e.g. 0.05 or 0.05:4" )
+
+    return text
+
+#Peak settings of a run from a PROMINENCE[:WIDTH] spec, the ( LO, HI ) windows to fit and the peak shape ( 'lorentzian' or 'voigt' ),
+#None if spec is None. Raises ValueError if unusable, or if a window lies outside the xrange the run is restricted to
+def peak_settings( spec, windows = (), shape = 'lorentzian', xrange = None ):
+
+    if spec is None:
+        return None
+
+    values = [ float( v ) for v in spec.split( ':' ) ]
+
+    if not 1 <= len( values ) <= 2:
+        raise ValueError( "peaks must be PROMINENCE[:WIDTH]" )
+
+    if shape not in spc.peaks.shapes:
+        raise ValueError( "peak shape must be {}".format( ' or '.join( spc.peaks.shapes ) ) )
+
+    for lo, hi in windows if xrange is not None else ():
+
+        if max( lo, hi ) < min( xrange ) or min( lo, hi ) > max( xrange ):
+            raise ValueError( "peak window {}:{} is outside the xrange {}:{}".format( lo, hi, *xrange ) )
+
+    return { 'prominence' : values[0], 'width' : values[1] if len( values ) > 1 else None,
+             'windows' : [ tuple( w ) for w in windows ], 'shape' : shape }
+
+#One input folder of a run: splits its grains into chunks of files, merges their partial results and writes each grain
+#once all its chunks are in. grid picks the common 'x' values: 'first' file of each grain, 'union' of the folder, or ( start, stop, step ).
+#dtype is the precision 'y' values are decoded, averaged and written in, smooth the spec of the smoothing of each spectrum, baseline that
+#of the baseline removed from it and normalize that of its normalization ( see normalize_measurements ). The ( scale, offset ) of every
+#measurement ends up in scales. With records, the index columns of the files are collected while loading them, for add_to_index
+class FolderRun:
+    def __init__( self, folder, out_folder, output_plot = True, output_data = True, fmt = 'csv', normalized_to = 1.0,
+                  chunk = 32, grid = 'first', xrange = None, progress = None, report = None, dtype = np.float64, baseline = None,
+                  normalize = 'max', smooth = None, records = False ):
+
+        self.folder         = folder
+        self.out_folder     = out_folder
+        self.output_plot    = output_plot
+        self.output_data    = output_data
+        self.fmt            = fmt
+        self.exten, \
+            self.delim      = output_format( fmt )
+        self.normalized_to  = normalized_to
+        self.chunk          = chunk
+        self.grid           = grid
+        self.xrange         = xrange
+        self.dtype          = np.dtype( dtype )
+        self.baseline       = baseline
+        self.normalize      = normalize
+        self.smooth         = smooth
+        self.progress       = progress
+        self.report         = report
+        self.records        = records
+
+        self.grains         = {}            #grain -> paths
+        self.jobs           = []            #( grain, paths, common 'x' values or None )
+        self.remaining      = {}            #grain -> chunks not yet merged
+        self.results        = {}            #grain -> [ x, Accumulator, resampled count ]
+        self.scales         = {}            #path -> ( scale, offset )
+        self.fields         = {}            #path -> index columns, with records
+        self.error          = None          #Why the folder failed, if it did
+        self.started        = None
+        self.seconds        = None
+
+    def new_probe( self ):
+        return spc.instrument.Probe() if self.report is not None else spc.instrument.null_probe
+
+    #Scan the folder and split its grains into chunks, so large grains are spread over the workers
+    def plan( self ):
+
+        self.started = time.time()
+        probe        = self.new_probe()
+
+        self.grains  = scan_grains( self.folder )
+
+        #Common 'x' values for the whole folder
+        if self.grid == 'union':
+            run_grid = spc.common_grid( [ measurement_x( p, self.xrange ) for g in self.grains for p in self.grains[g] ], 'union' )
+        elif self.grid != 'first':
+            run_grid = spc.common_grid( None, self.grid )
+        else:
+            run_grid = None
+
+        for g in sorted( self.grains ):
+
+            g_grid = run_grid
+
+            for k in range( 0, len( self.grains[g] ), self.chunk ):
+
+                #Later chunks of a grain are put on the 'x' values of its first file
+                if k > 0 and g_grid is None:
+                    g_grid = measurement_x( self.grains[g][0], self.xrange )
+
+                self.jobs.append( ( g, self.grains[g][k:k + self.chunk], g_grid ) )
+                self.remaining[g] = self.remaining.get( g, 0 ) + 1
+
+        probe.mark( 'scan' )
+        if self.report is not None:
+            self.report.add( probe.as_dict() )
+
+        return self.jobs
+
+    #Arguments of accumulate_job for job n
+    def job_args( self, n, instrumented = False ):
+
+        g, paths, g_grid = self.jobs[n]
+        profile_path     = self.report.profile_path( g, n ) if self.report is not None else None
+
+        return ( paths, self.normalized_to, g_grid, self.xrange, self.report is not None, instrumented, profile_path, self.dtype,
+                 self.baseline, self.normalize, self.smooth, self.records )
+
+    #Take the ( result, extras ) of an accumulate_job chunk of grain g
+    def collect( self, g, result, extras ):
+
+        if 'parse' in extras:
+            spc.instrument.registry.merge( extras['parse'] )
+
+        if self.report is not None:
+            self.report.add_job( g, extras )
+
+        self.finish( g, *result )
+
+    def finish( self, g, x, acc, n_resampled, scales, fields ):
+
+        self.scales.update( scales )
+        self.fields.update( fields )
+        if self.report is not None:
+            self.report.scales.update( scales )
+
+        if g in self.results:
+            self.results[g][1].merge( acc )
+            self.results[g][2] += n_resampled
+        else:
+            self.results[g] = [ x, acc, n_resampled ]
+
+        self.remaining[g] -= 1
+
+        #All chunks of this grain are in, write it out
+        if self.remaining[g] == 0:
+
+            x, acc, n_resampled = self.results[g]
+
+            if n_resampled:
+                print( "Grain {}: {} of {} measurements resampled onto common 'x' values".format( g, n_resampled, acc.count ) )
+
+            probe = self.new_probe()
+
+            x, mean, sem = covered( x, acc )
+            probe.mark( 'sem' )
+
+            write_grain_outputs( self.out_folder, g, x, mean, sem, self.normalized_to, self.output_plot, self.output_data,
+                                 self.exten, self.delim, probe, self.normalize )
+
+            if self.report is not None:
+                self.report.add( probe.as_dict(), g )
+
+            n_done = sum( 1 for r in self.remaining.values() if r == 0 )
+
+            if n_done == len( self.grains ):
+                self.seconds = time.time() - self.started
+
+            if self.progress is not None:
+                self.progress( n_done, len( self.grains ) )
+
+    #{ grain : measurement count } of the grains written so far
+    def counts( self ):
+        return { g : self.results[g][1].count for g in sorted( self.results ) if self.remaining[g] == 0 }
+
+    #( grains, x, means, sems ) of the grains written so far, one row per grain, resampled onto the 'x' values of the first that every
+    #grain covers ( see covered ). Raises ValueError if the grains share no 'x' values
+    def averages( self ):
+
+        grains = list( self.counts() )
+        parts  = [ covered( *self.results[g][:2] ) for g in grains ]
+        xs     = [ p[0] for p in parts ]
+
+        lo     = max( np.min( x ) for x in xs )
+        hi     = min( np.max( x ) for x in xs )
+        x      = xs[0][ ( xs[0] >= lo ) & ( xs[0] <= hi ) ]
+
+        if not len( x ):
+            raise ValueError( "the grains share no 'x' values" )
+
+        return ( grains, x, spc.resample( xs, [ p[1] for p in parts ], x ), spc.resample( xs, [ p[2] for p in parts ], x ) )
+
+    #Write the peak tables of the grains written so far, see write_peak_tables
+    def write_peaks( self, peaks ):
+
+        if not self.counts():
+            return
+
+        try:
+            averages = self.averages()
+        except ValueError as e:
+            print( "Peak tables of {} skipped: {}".format( self.folder, e ) )
+            return
+
+        probe = self.new_probe()
+        write_peak_tables( self.out_folder, *averages, peaks = peaks, probe = probe )
+
+        if self.report is not None:
+            self.report.add( probe.as_dict() )
+
+    #Analysis parameters, as recorded in a spc.Index
+    def params( self ):
+        return { 'normalized_to' : self.normalized_to, 'grid' : self.grid, 'xrange' : self.xrange, 'chunk' : self.chunk,
+                 'precision' : self.dtype.name, 'smooth' : self.smooth, 'baseline' : self.baseline, 'normalize' : self.normalize,
+                 'format' : self.fmt, 'plot' : self.output_plot, 'data' : self.output_data }
+
+    #Record this run, its grains, their measurements and output files in a spc.Index. Files whose index columns were collected while
+    #loading them ( records ) are not parsed again
+    def add_to_index( self, index ):
+
+        grains = []
+
+        for g in self.counts():
+
+            x    = covered( *self.results[g][:2] )[0]
+            name = os.path.join( self.out_folder, "Grain {} - Averaged_RAMAN".format( g ) )
+
+            grains.append( { 'grain'     : g,
+                             'files'     : self.grains[g],
+                             'xmin'      : float( np.min( x ) ),
+                             'xmax'      : float( np.max( x ) ),
+                             'data_path' : name + self.exten if self.output_data else None,
+                             'plot_path' : name + ".png" if self.output_plot else None } )
+
+        return index.add_run( self.folder, self.out_folder, self.params(), grains, self.fields )
+
+#Run the chunks of one or more planned FolderRuns on pool, on a pool of workers of our own, or in this process.
+#Chunks of the largest grains go first, so no worker is left finishing a big grain at the end.
+#With isolate, a chunk that fails marks its folder as failed ( run.error ) and the other folders carry on, otherwise the error is raised
+def run_folders( runs, workers = 1, pool = None, isolate = False ):
+
+    #Parse statistics of worker processes are collected here when instrumentation is on
+    instrumented = spc.instrument.enabled and ( workers > 1 or pool is not None )
+
+    #Sorting is stable, so chunks of a grain keep their order
+    tasks = [ ( run, n ) for run in runs if run.error is None for n in range( len( run.jobs ) ) ]
+    tasks.sort( key = lambda t: -len( t[0].grains[ t[0].jobs[ t[1] ][0] ] ) )
+
+    def collect( run, n, get_result ):
+
+        #Chunks of a failed folder are dropped
+        if run.error is not None:
+            return
+
+        try:
+            run.collect( run.jobs[n][0], *get_result() )
+
+        except Exception as e:
+
+            if not isolate:
+                raise
+
+            run.error = "{}: {}".format( type( e ).__name__, e )
+            print( "{} failed: {}".format( run.folder, run.error ) )
+
+    def run_on( pool ):
+
+        from concurrent.futures import as_completed
+
+        futures = { pool.submit( accumulate_job, *run.job_args( n, instrumented ) ) : ( run, n ) for run, n in tasks }
+
+        for fut in as_completed( futures ):
+            collect( *futures[fut], get_result = fut.result )
+
+    if pool is not None:
+        run_on( pool )
+
+    elif workers > 1:
+
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor( max_workers = workers ) as own_pool:
+            run_on( own_pool )
+
+    else:
+        for run, n in tasks:
+            collect( run, n, lambda: accumulate_job( *run.job_args( n, instrumented ) ) )
+
+#Analyze every grain of a folder without the GUI. Returns { grain : measurement count }. The run is recorded in index ( a spc.Index ) if given
+#grid picks the common 'x' values: 'first' file of each grain, 'union' of the whole run, or ( start, stop, step ). dtype np.float32
+#keeps 'y' values in single precision from decoding to output. smooth ( e.g. 'savgol:11:3', see parse_smooth ) smooths each spectrum
+#and baseline ( e.g. 'als', see parse_baseline ) removes its baseline before it is normalized by normalize ( 'max', 'area',
+#'band:LO:HI', 'l2' or 'snv', see parse_normalize ) to normalized_to. peaks ( see peak_settings ) writes the peak tables of the grains
+def analyze_folder( folder, out_folder, output_plot = True, output_data = True, fmt = 'csv',
+                    normalized_to = 1.0, workers = 1, chunk = 32, grid = 'first', xrange = None, progress = None, report = None,
+                    pool = None, index = None, dtype = np.float64, baseline = None, normalize = 'max', smooth = None, peaks = None ):
+
+    if report is not None:
+        report.settings.update( folder = folder, out_folder = out_folder, workers = workers, chunk = chunk,
+                                grid = grid, xrange = xrange, precision = np.dtype( dtype ).name, smooth = smooth, baseline = baseline,
+                                normalize = normalize, peaks = peaks, fmt = fmt, plot = output_plot, data = output_data )
+
+    run = FolderRun( folder, out_folder, output_plot, output_data, fmt, normalized_to, chunk, grid, xrange, progress, report, dtype,
+                     baseline, normalize, smooth, records = index is not None )
+    run.plan()
+
+    run_folders( [ run ], workers, pool )
+
+    if peaks is not None:
+        run.write_peaks( peaks )
+
+    #Searchable record of the run, see spc.Index
+    if index is not None:
+        run.add_to_index( index )
+
+    return run.counts()
+
+#Input folders ( or zip/tar archives ) from names or glob patterns, and from a job file listing one per line ( '#' starts a comment,
+#relative paths are relative to the job file ). Patterns that match nothing are kept, so they are reported as failed
+def expand_folders( patterns = (), job_file = None ):
+
+    patterns = list( patterns )
+
+    if job_file:
+
+        base = os.path.dirname( os.path.abspath( job_file ) )
+
+        with open( job_file ) as fle:
+            for line in fle:
+
+                line = line.split( '#' )[0].strip()
+
+                if line:
+                    patterns.append( os.path.join( base, os.path.expanduser( line ) ) )
+
+    folders = []
+
+    for p in patterns:
+
+        matches = sorted( m for m in glob.glob( p ) if os.path.isdir( m ) or spc.archive.is_archive( m ) ) if any( c in p for c in "*?[" ) else [ p ]
+
+        for m in matches or [ p ]:
+
+            m = os.path.abspath( m )
+
+            if m not in folders:
+                folders.append( m )
+
+    return folders
+
+#Analyze several folders on one shared worker pool, largest grains first. The outputs of each folder go to a subfolder of out_root
+#named after it ( archives without their extension; default root: the folders' common parent, so outputs land in the input folders ),
+#and 'Batch Summary.csv' and
+#'Batch Summary.json' in out_root list every folder with its grain and file counts, time and error, if any.
+#A folder that fails does not stop the others. report writes a RunReport per folder, profiling its profile slowest grains.
+#Each folder is recorded in index ( a spc.Index ) if given.
+#Returns { folder : { grain : measurement count } }, failed folders keep the grains they finished
+def analyze_batch( folders, out_root = None, output_plot = True, output_data = True, fmt = 'csv', normalized_to = 1.0,
+                   workers = 1, chunk = 32, grid = 'first', xrange = None, progress = None, report = False, profile = 0, pool = None,
+                   index = None, dtype = np.float64, baseline = None, normalize = 'max', smooth = None, peaks = None ):
+
+    started  = time.time()
+    folders  = [ os.path.abspath( f ) for f in folders ]
+    out_root = os.path.abspath( out_root or os.path.commonpath( [ os.path.dirname( f ) for f in folders ] ) )
+
+    runs     = []
+    names    = set()
+
+    for folder in folders:
+
+        #Unique output subfolder per input folder
+        name = spc.archive.strip_extension( os.path.basename( folder.rstrip( os.sep ) ) ) or 'folder'
+        base, k = name, 1
+
+        while name in names:
+            k   += 1
+            name = "{}_{}".format( base, k )
+
+        names.add( name )
+
+        run = FolderRun( folder, os.path.join( out_root, name ), output_plot, output_data, fmt, normalized_to, chunk, grid, xrange,
+                         report = RunReport( profile ) if ( report or profile ) else None, dtype = dtype, baseline = baseline,
+                         normalize = normalize, smooth = smooth, records = index is not None )
+
+        try:
+            if not ( os.path.isdir( folder ) or spc.archive.is_archive( folder ) ):
+                raise ValueError( "not a folder or archive" )
+
+            if not run.plan():
+                raise ValueError( "no SPC files named *_<grain>_<measurement>.spc" )
+
+            os.makedirs( run.out_folder, exist_ok = True )
+
+        except Exception as e:
+            run.error = "{}: {}".format( type( e ).__name__, e )
+            print( "{} skipped: {}".format( folder, run.error ) )
+
+        runs.append( run )
+
+    #Progress over the grains of every folder
+    total    = sum( len( run.grains ) for run in runs if run.error is None )
+    finished = [ 0 ]
+
+    def grain_done( done, n ):
+        finished[0] += 1
+        if progress is not None:
+            progress( finished[0], total )
+
+    for run in runs:
+        run.progress = grain_done
+
+    run_folders( runs, workers, pool, isolate = True )
+
+    #Consolidated summary
+    rows = []
+
+    for run in runs:
+
+        counts = run.counts()
+
+        if peaks is not None and run.error is None:
+            run.write_peaks( peaks )
+
+        if run.report is not None and run.error is None:
+            run.report.settings.update( folder = run.folder, out_folder = run.out_folder, workers = workers, chunk = chunk,
+                                        grid = grid, xrange = xrange, precision = run.dtype.name, smooth = smooth, baseline = baseline,
+                                        normalize = normalize, peaks = peaks, fmt = fmt, plot = output_plot, data = output_data )
+            run.report.write( run.out_folder )
+
+        #Failed folders are recorded with the grains they finished
+        if index is not None and counts:
+            run.add_to_index( index )
+
+        rows.append( { 'folder'     : run.folder,
+                       'output'     : run.out_folder,
+                       'status'     : 'ok' if run.error is None else 'failed',
+                       'grains'     : len( counts ),
+                       'files'      : sum( counts.values() ),
+                       'seconds'    : run.seconds,
+                       'error'      : run.error } )
+
+    os.makedirs( out_root, exist_ok = True )
+
+    with open( os.path.join( out_root, "Batch Summary.json" ), 'w' ) as fle:
+        json.dump( { 'seconds' : time.time() - started, 'workers' : workers, 'folders' : rows }, fle, indent = 1 )
+
+    import csv
+
+    with open( os.path.join( out_root, "Batch Summary.csv" ), 'w', newline = '' ) as fle:
+
+        writer = csv.DictWriter( fle, fieldnames = [ 'folder', 'output', 'status', 'grains', 'files', 'seconds', 'error' ] )
+        writer.writeheader()
+        writer.writerows( rows )
+
+    return { run.folder : run.counts() for run in runs }
+
+#Analyze a multi-subfile SPC map. Every region_size consecutive spectra are averaged as one pseudo-grain. Returns { grain : spectrum count }
+def analyze_map( path, out_folder, output_plot = True, output_data = True, fmt = 'csv',
+                 normalized_to = 1.0, region_size = 1, xrange = None, progress = None, report = None, dtype = np.float64, baseline = None,
+                 normalize = 'max', smooth = None, peaks = None ):
+
+    exten, delim = output_format( fmt )
+
+    if report is not None:
+        report.settings.update( map = path, out_folder = out_folder, region_size = region_size, xrange = xrange,
+                                precision = np.dtype( dtype ).name, smooth = smooth, baseline = baseline, normalize = normalize, peaks = peaks,
+                                fmt = fmt, plot = output_plot, data = output_data )
+
+    def new_probe():
+        return spc.instrument.Probe() if report is not None else spc.instrument.null_probe
+
+    probe = new_probe()
+
+    #Subfiles go into an on-disk cube, processed a chunk of spectra at a time
+    cube = spc.SpectralCube( path, dtype = dtype, xrange = xrange )
+    probe.mark( 'load' )
+
+    try:
+        cube.despike()
+        probe.mark( 'sanitize' )
+
+        if smooth is not None:
+            cube.smooth( smooth )
+            probe.mark( 'smooth' )
+
+        if baseline is not None:
+            cube.baseline( baseline )
+            probe.mark( 'baseline' )
+
+        mode, params = spc.normalize.parse( normalize )
+        scales = cube.normalize( normalized_to, mode, **params )
+        probe.mark( 'normalize' )
+
+        stats = cube.region_stats( np.arange( cube.n_spectra )//region_size + 1 )
+        probe.mark( 'average' )
+
+        probe.count( 'files' )
+        if report is not None:
+            report.add( probe.as_dict() )
+            report.scales.update( ( "{}[{}]".format( path, i ), ( float( s ), float( o ) ) ) for i, ( s, o ) in enumerate( zip( *scales ) ) )
+
+        sems = []
+
+        for n, g in enumerate( sorted( stats ) ):
+
+            acc   = stats[g]
+            probe = new_probe()
+
+            sem = acc.sem()
+            sems.append( sem )
+            probe.mark( 'sem' )
+
+            write_grain_outputs( out_folder, int( g ), cube.x, acc.mean, sem, normalized_to, output_plot, output_data, exten, delim, probe,
+                                 normalize )
+
+            probe.count( 'spectra', acc.count )
+            probe.count( 'points', acc.count*cube.n_points )
+            if report is not None:
+                report.add( probe.as_dict(), int( g ) )
+
+            if progress is not None:
+                progress( n + 1, len( stats ) )
+
+        if peaks is not None:
+
+            probe = new_probe()
+            write_peak_tables( out_folder, [ int( g ) for g in sorted( stats ) ], cube.x, np.array( [ stats[g].mean for g in sorted( stats ) ] ),
+                               np.array( sems ), peaks, probe )
+
+            if report is not None:
+                report.add( probe.as_dict() )
+
+    finally:
+        cube.close()
+
+    return { int( g ) : stats[g].count for g in sorted( stats ) }
+
+#Processes spectra as the spectrometer writes them into a folder
+class GrainWatcher:
+    def __init__( self, folder, out_folder, output_plot = True, output_data = True, fmt = 'csv',
+                  normalized_to = 1.0, poll = 1.0, settle = 2.0, debounce = 5.0, grid = 'first', xrange = None, dtype = np.float64,
+                  baseline = None, normalize = 'max', smooth = None ):
+
+        self.folder         = os.path.abspath( folder )
+        self.out_folder     = os.path.abspath( out_folder or folder )
+        self.output_plot    = output_plot
+        self.output_data    = output_data
+        self.exten, \
+            self.delim      = output_format( fmt )
+        self.normalized_to  = normalized_to
+
+        #Fixed common 'x' values, otherwise each grain keeps those of its first file
+        self.grid           = None if grid == 'first' else spc.common_grid( None, grid )
+        self.xrange         = xrange
+        self.dtype          = dtype
+        self.baseline       = baseline
+        self.normalize      = normalize
+        self.smooth         = smooth
+
+        self.poll           = poll          #Seconds between folder scans
+        self.settle         = settle        #Seconds a file size must stay unchanged before it is read
+        self.debounce       = debounce      #Seconds without new files on a grain before its outputs are re-emitted
+
+        self.pending        = {}            #path -> ( size, mtime, time of last change )
+        self.done           = set()         #Paths already added to a grain
+        self.skipped        = {}            #path -> ( size, mtime ) of empty or unreadable files, retried once they change
+        self.grains         = {}            #grain -> [ x, Accumulator ]
+        self.dirty          = {}            #grain -> time the last measurement was added
+
+    #Look for new files, add the finished ones and emit quiet grains. Returns True if anything is still happening
+    def poll_once( self, now = None ):
+
+        if now is None:
+            now = time.time()
+
+        seen = set()
+
+        for entry in os.scandir( self.folder ):
+
+            if entry.path in self.done or not entry.is_file() or grain_key( entry.name ) is None:
+                continue
+
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+
+            seen.add( entry.path )
+
+            #Unchanged since it was last skipped
+            if self.skipped.get( entry.path ) == ( st.st_size, st.st_mtime ):
+                continue
+
+            prev = self.pending.get( entry.path )
+
+            #New file, or still being written
+            if prev is None or prev[0] != st.st_size or prev[1] != st.st_mtime:
+                self.pending[ entry.path ] = ( st.st_size, st.st_mtime, now )
+                continue
+
+            #Size has stopped changing
+            if now - prev[2] >= self.settle:
+                if st.st_size > 0:
+                    self.add_file( entry.path, now )
+                else:
+                    self.skip_file( entry.path, "empty file" )
+
+        #Forget files that vanished or were renamed before they were read
+        for path in list( self.pending ):
+            if path not in seen:
+                del self.pending[ path ]
+
+        for path in list( self.skipped ):
+            if path not in seen:
+                del self.skipped[ path ]
+
+        #Re-emit grains that have been quiet for the debounce period
+        for grain, last in list( self.dirty.items() ):
+            if now - last >= self.debounce:
+                self.emit( grain )
+
+        return bool( self.pending ) or bool( self.dirty )
+
+    def add_file( self, path, now ):
+
+        grain = grain_key( os.path.basename( path ) )[0]
+
+        try:
+            m_x, m_y = load_measurement( path, self.xrange, dtype = self.dtype )
+            m_y      = normalize_measurements( [ m_x ], [ m_y ], self.normalized_to, self.normalize, self.baseline,
+                                               smooth = self.smooth, names = [ path ] )[0][0]
+
+            #First measurement sets the 'x' values of the grain
+            if grain not in self.grains:
+                self.grains[ grain ] = [ m_x if self.grid is None else self.grid, spc.Accumulator( dtype = self.dtype ) ]
+
+            x, acc = self.grains[ grain ]
+            acc.add( spc.resample( [ m_x ], [ m_y ], x )[0] )
+
+        except Exception as e:
+            self.skip_file( path, e )
+            return
+
+        del self.pending[ path ]
+        self.skipped.pop( path, None )
+        self.done.add( path )
+        self.dirty[ grain ] = now
+
+    #Set a settled file aside until it is written again
+    def skip_file( self, path, reason ):
+
+        size, mtime, _       = self.pending.pop( path )
+        self.skipped[ path ] = ( size, mtime )
+
+        print( "Skipping {}: {}".format( path, reason ) )
+
+    def emit( self, grain ):
+
+        x, mean, sem = covered( *self.grains[ grain ] )
+        write_grain_outputs( self.out_folder, grain, x, mean, sem, self.normalized_to,
+                             self.output_plot, self.output_data, self.exten, self.delim, normalize = self.normalize )
+        self.dirty.pop( grain, None )
+
+        print( "Grain {}: {} measurements".format( grain, self.grains[ grain ][1].count ) )
+
+    #Emit every grain that has unwritten measurements
+    def flush( self ):
+
+        for grain in sorted( self.dirty ):
+            self.emit( grain )
+
+    #Watch until interrupted, or until nothing has happened for idle_exit seconds
+    def run( self, idle_exit = None ):
+
+        last_activity = time.time()
+
+        try:
+            while True:
+
+                now = time.time()
+                if self.poll_once( now ):
+                    last_activity = now
+
+                elif idle_exit is not None and now - last_activity >= idle_exit:
+                    break
+
+                time.sleep( self.poll )
+
+        except KeyboardInterrupt:
+            pass
+
+        finally:
+            #Acquisition is over, write whatever is still waiting on the debounce
+            self.flush()
+
+#Long-running local analysis server. Accepts analysis jobs over HTTP on localhost and runs them on a persistent worker pool,
+#so repeated calls skip interpreter startup and imports, and keep the decoded measurement and interpolation caches warm.
+#
+#   POST /analyze   JSON job { "folder", "output", "format", "raw", "plot", "grid", "xrange", "precision", "smooth", "baseline",
+#                   "normalize", "normalized_to", "peaks", "peak_windows", "peak_shape", "report" }.
+#                   The response streams one JSON object per line: { "event" : "progress", "done", "total" } for each
+#                   grain, then { "event" : "done", "grains", "files", "seconds" } or { "event" : "error", "message" }
+#   GET  /status    Jobs served, cache size and hit counts
+#
+#Jobs run one at a time, in order of arrival; each one uses the whole pool
+class AnalysisServer:
+    def __init__( self, host = '127.0.0.1', port = 8765, workers = 1, cache = 4096 ):
+
+        import threading
+        from http.server import ThreadingHTTPServer
+        from concurrent.futures import ProcessPoolExecutor
+
+        #Plots are drawn on request threads, with no display
+        import matplotlib
+        matplotlib.use( 'Agg' )
+
+        self.workers    = workers
+        self.cache      = cache
+        self.jobs       = 0
+        self.job_lock   = threading.Lock()
+
+        #Chunks run in this process with one worker, so every job shares its cache
+        if workers > 1:
+            self.pool   = ProcessPoolExecutor( max_workers = workers, initializer = enable_measurement_cache, initargs = ( cache, ) )
+        else:
+            self.pool   = None
+            enable_measurement_cache( cache )
+
+        self.httpd      = ThreadingHTTPServer( ( host, port ), analysis_handler( self ) )
+        self.address    = self.httpd.server_address
+
+    #Check a job and fill in defaults. Returns the keyword arguments of analyze_folder, raises ValueError if the job is unusable
+    def job_kwargs( self, job ):
+
+        folder = job.get( 'folder' )
+
+        if not folder or not ( os.path.isdir( folder ) or spc.archive.is_archive( folder ) ):
+            raise ValueError( "folder {!r} not found".format( folder ) )
+
+        #Outputs of an archive go next to it
+        out_folder = job.get( 'output' ) or ( os.path.dirname( folder ) if spc.archive.is_archive( folder ) else folder )
+
+        if not os.path.isdir( out_folder ):
+            raise ValueError( "output folder {!r} not found".format( out_folder ) )
+
+        fmt = job.get( 'format', 'csv' )
+
+        if fmt not in ( 'csv', 'txt', 'spc' ):
+            raise ValueError( "format must be csv, txt or spc" )
+
+        precision = job.get( 'precision', 'float64' )
+
+        if precision not in ( 'float64', 'float32' ):
+            raise ValueError( "precision must be float64 or float32" )
+
+        grid   = job.get( 'grid', 'first' )
+        xrange = job.get( 'xrange' )
+
+        try:
+            if not isinstance( grid, str ):
+                grid = tuple( float( v ) for v in grid )
+            else:
+                grid = parse_grid( grid )
+
+            if isinstance( xrange, str ):
+                xrange = parse_xrange( xrange )
+            elif xrange is not None:
+                xrange = tuple( float( v ) for v in xrange )
+
+            smooth    = parse_smooth( job.get( 'smooth' ) )
+            baseline  = parse_baseline( job.get( 'baseline' ) )
+            normalize = parse_normalize( job.get( 'normalize', 'max' ) )
+
+            windows   = [ parse_xrange( w ) if isinstance( w, str ) else tuple( float( v ) for v in w ) for w in job.get( 'peak_windows' ) or [] ]
+            peaks     = peak_settings( job.get( 'peaks' ) or ( '0.05' if windows else None ), windows, job.get( 'peak_shape', 'lorentzian' ), xrange )
+
+            normalized_to = float( job.get( 'normalized_to', 1.0 ) )
+
+        except ( TypeError, argparse.ArgumentTypeError ) as e:
+            raise ValueError( str( e ) )
+
+        return dict( folder = os.path.abspath( folder ), out_folder = os.path.abspath( out_folder ),
+                     output_plot = bool( job.get( 'plot', True ) ), output_data = bool( job.get( 'raw', False ) ), fmt = fmt,
+                     normalized_to = normalized_to, workers = self.workers, grid = grid, xrange = xrange,
+                     dtype = np.dtype( precision ), baseline = baseline, normalize = normalize, smooth = smooth, peaks = peaks )
+
+    #Run a job, passing each event dict to emit
+    def run_job( self, job, emit ):
+
+        #The response has started by now, so every problem with the job goes back as an error event
+        try:
+            kwargs = self.job_kwargs( job )
+        except ValueError as e:
+            emit( { 'event' : 'error', 'message' : str( e ) } )
+            return
+        except Exception as e:
+            emit( { 'event' : 'error', 'message' : "{}: {}".format( type( e ).__name__, e ) } )
+            return
+
+        with self.job_lock:
+
+            start  = time.time()
+            report = RunReport() if job.get( 'report' ) else None
+
+            try:
+                counts = analyze_folder( progress = lambda done, total: emit( { 'event' : 'progress', 'done' : done, 'total' : total } ),
+                                         report = report, pool = self.pool, **kwargs )
+
+                if report is not None:
+                    report.write( kwargs['out_folder'] )
+
+            except Exception as e:
+                emit( { 'event' : 'error', 'message' : "{}: {}".format( type( e ).__name__, e ) } )
+                return
+
+            finally:
+                self.jobs += 1
+
+            emit( { 'event' : 'done', 'grains' : counts, 'files' : sum( counts.values() ), 'seconds' : time.time() - start } )
+
+    def status( self ):
+
+        #Worker processes keep their own caches, only this process' counts are known here
+        if self.pool is not None:
+            cache = { 'max_items' : self.cache, 'per_worker' : True }
+        else:
+            cache = { 'max_items' : self.cache, 'items' : len( measurement_cache.items ),
+                      'hits' : measurement_cache.hits, 'misses' : measurement_cache.misses }
+
+        return { 'jobs' : self.jobs, 'workers' : self.workers, 'cache' : cache }
+
+    #Serve until interrupted
+    def serve_forever( self ):
+
+        try:
+            self.httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+
+    def close( self ):
+
+        self.httpd.server_close()
+
+        if self.pool is not None:
+            self.pool.shutdown()
+
+#Request handler class bound to an AnalysisServer
+def analysis_handler( server ):
+
+    from http.server import BaseHTTPRequestHandler
+
+    class AnalysisHandler( BaseHTTPRequestHandler ):
+
+        #Responses end when the connection closes, so progress can stream without a length
+        protocol_version = 'HTTP/1.0'
+
+        def send_json( self, code, obj ):
+
+            body = ( json.dumps( obj ) + "\n" ).encode( 'utf8' )
+
+            self.send_response( code )
+            self.send_header( 'Content-Type', 'application/json' )
+            self.send_header( 'Content-Length', str( len( body ) ) )
+            self.end_headers()
+            self.wfile.write( body )
+
+        def do_GET( self ):
+
+            if self.path.rstrip( '/' ) == '/status':
+                self.send_json( 200, server.status() )
+            else:
+                self.send_json( 404, { 'event' : 'error', 'message' : "unknown path {}".format( self.path ) } )
+
+        def do_POST( self ):
+
+            if self.path.rstrip( '/' ) != '/analyze':
+                self.send_json( 404, { 'event' : 'error', 'message' : "unknown path {}".format( self.path ) } )
+                return
+
+            try:
+                length = int( self.headers.get( 'Content-Length', 0 ) )
+                job    = json.loads( self.rfile.read( length ).decode( 'utf8' ) or '{}' )
+
+                if not isinstance( job, dict ):
+                    raise ValueError( "job must be a JSON object" )
+
+            except ValueError as e:
+                self.send_json( 400, { 'event' : 'error', 'message' : "bad job: {}".format( e ) } )
+                return
+
+            self.send_response( 200 )
+            self.send_header( 'Content-Type', 'application/x-ndjson' )
+            self.end_headers()
+
+            #One JSON line per event, flushed as it happens. A client that hung up does not stop the job
+            def emit( event ):
+                try:
+                    self.wfile.write( ( json.dumps( event ) + "\n" ).encode( 'utf8' ) )
+                    self.wfile.flush()
+                except OSError:
+                    pass
+
+            server.run_job( job, emit )
+
+        #Quieter than the default per-request stderr line
+        def log_message( self, format, *args ):
+            print( "{} {}".format( self.address_string(), format % args ) )
+
+    return AnalysisHandler
 
 class AnalyzeSPC:
     def __init__( self, master ):
-        
+
+        #tkinter names used below, see import_gui
+        import_gui()
+
         #Set Master TK Window from intiation (root)
         self.master             = master
 
@@ -79,6 +1660,7 @@ class AnalyzeSPC:
         self.output_folder      = StringVar()
         self.output_plots       = IntVar( value = 1 )
         self.output_fmt_bool    = IntVar( value = 0 )
+        self.output_report      = IntVar( value = 0 )
         self.progress_var       = DoubleVar( )
 
         #Set Initial Output Information for User
@@ -95,6 +1677,7 @@ class AnalyzeSPC:
         self.fmt_csv            = Radiobutton( self.mf, text = "CSV", variable = self.output_fmt, value = 'csv', state = DISABLED )
         self.fmt_plot           = Checkbutton( self.mf, text = "Plot Data", variable = self.output_plots, onvalue = 1, offvalue = 0 )
         self.fmt_bool           = Checkbutton( self.mf, text =  "Output Raw Data", variable = self.output_fmt_bool, onvalue = 1, offvalue = 0, command = self.output_enable)
+        self.fmt_report         = Checkbutton( self.mf, text = "Write Run Report", variable = self.output_report, onvalue = 1, offvalue = 0 )
         
         #Progressbar
         self.p_bar              = Progressbar( self.mf, length = 300, mode = 'determinate', variable = self.progress_var, maximum = 100. )
@@ -116,6 +1699,7 @@ class AnalyzeSPC:
         self.sel_folder.grid(        row = 1, column = 3, sticky = W )                      #Input Folder Directory Button
 
         self.fmt_bool.grid(          row = 2, column = 0, sticky = W, columnspan = 2 )      #Boolean that allows raw data output
+        self.fmt_report.grid(        row = 2, column = 2, sticky = W, columnspan = 2 )      #Boolean that writes a timing report of the run
 
         self.output_fmt_label.grid(  row = 3, column = 0, sticky = E )                      #Output Format type (TXT, CSV Radio buttons Label)
         self.fmt_txt.grid(           row = 3, column = 1, sticky = W )                      #Output Format type TXT button
@@ -151,8 +1735,6 @@ class AnalyzeSPC:
         self.fol_val        = str( self.folder.get() )
         self.fol_out_val    = str( self.output_folder.get() )
 
-        ffn_out             = os.path.abspath(self.fol_out_val)
-
         #Get output format (txt or csv)
         self.fmt_val        = str( self.output_fmt.get() )
 
@@ -162,85 +1744,25 @@ class AnalyzeSPC:
         #Inform user of starting conversions
         print( "Analyzing {} with {} ext".format(self.fol_val, self.fmt_val) )
 
-        #Figure output file extension and delimiter
-        if self.fmt_val == 'txt':
-            exten = '.txt'
-            delim = '\t'
-        else:
-            #Default is CSV
-            exten = '.csv'
-            delim = ','
-
-        #Initiate grain and measurement indices
-        self.grain          = 0
-        self.measurement    = 0
-
-        #Build list for files
-        flist = []
-
-        #Get file directory from folder value
-        ffn = os.path.abspath( self.fol_val )
+        #Get file directory from folder value. Several folders or glob patterns, separated by ';', are analyzed as one batch
+        folders = expand_folders( [ f.strip() for f in self.fol_val.split( ';' ) if f.strip() ] )
+        ffn     = folders[0] if folders else os.path.abspath( self.fol_val )
 
         #Check for output folder location. If none, default to Input folder
         out_str = self.fol_out_val.replace(" ","")
 
+        #A batch writes into subfolders named after each input folder
+        if len( folders ) > 1:
+            ffn_out = os.path.abspath( self.fol_out_val ) if out_str else None
+
         #If No output folder selected
-        if out_str == "":
+        elif out_str == "":
             #Default to input folder
             self.fol_out_val = self.fol_val
             self.output_folder.set( value = self.fol_out_val )
 
-        #Find how many grain files exist in folder
-        self.grain_count = 0
-        for f in os.listdir( ffn ):
-
-            #Check extension
-            if f.lower().endswith('spc'):
-
-                #Split file name by underscores
-                f_split = f.split("_")
-                
-                #Ensure correct format for tracking
-                if len(f_split) >= 2:
-
-                    #Look at second to last in split ( SomeFileName_1_1.spc )
-                    if int( f_split[-2] ) > self.grain_count:
-                        self.grain_count = int( f_split[-2] )
-
-        #Consider grain count
-        if self.grain_count == 0:
-            self.output_message("Input Folder Empty", "Your input folder is either empty or the spc files are not configured correctly.", "Close", None)
-
-        #Cycle through each grain count and append files
-        for i in range(self.grain_count):
-
-            #Build Measurements list
-            mlist = []
-            
-            #Append sorted files to the filelist
-            for f in os.listdir( ffn ):
-
-                #Check extension
-                if f.lower().endswith('spc'):
-                    
-                    fl = f
-
-                    #Split file name to find current
-                    f_split = fl.split("_")
-
-                    #Ensure correct format for tracking
-                    if len(f_split) >= 2:
-
-                        #Check if current file is the current grain
-                        if int( f_split[-2] ) == i+1:
-                            #print( f )
-                            #Add to measurement list
-                            mlist.append( os.path.join( ffn , f) )
-
-            #Append grain i+1 files
-            flist.append( mlist )
-
-        ######  STOPPED HERE! FILES SORTED BY GRAIN. START ANALYZING ######
+        if len( folders ) <= 1:
+            ffn_out = os.path.abspath( self.fol_out_val )
 
         #Check if any output is selected. If not, make a silly message
         output_data = bool( self.output_fmt_bool.get() )
@@ -250,111 +1772,29 @@ class AnalyzeSPC:
         if (not output_data) and (not output_plot):
             self.output_message( "What are you doing?", "... You have to select some output method...\n\nI mean, I could analyze this for you but you won't see it.", "Oh yeah, duh!", None  )
 
+        #Consider grain count
+        elif len( folders ) <= 1 and not scan_grains( ffn ):
+            self.output_message("Input Folder Empty", "Your input folder is either empty or the spc files are not configured correctly.", "Close", None)
+
         #Else, continue analyzing
         else:
-            prog_incr = 100./len( flist )
-
-            #Look at grain i
-
-            #Loop through i grains
-            for i in range( len( flist ) ):                     #3
-
-                tot_grain_data_list     = []                    #All unanalyzed grain data
-                ave_grain_data_list     = []                    #Averaged data per grain
-                sem_grain_data_list     = []                    #SEM data per grain
-
-                #Loop through j measurements   
-                for j in range( len( flist[i] ) ):              #5
-
-                    #Open file into array
-                    f       = spc.File( flist[i][j] )
-                    xy_data = f.data_list()                     #xy data for grain i, measurement j
-
-                    #Append collected data to the grain_data_list for later processing
-                    tot_grain_data_list.append( xy_data )
-
-                #print( len(tot_grain_data_list) )    #total measurements
-                #print( len(tot_grain_data_list[0]) ) #x and y
 
-                #Average arrays (function? OUT = Single array)
-                normalized_to = 1.0
-
-                ave_grain_data_list.append( self.grain_average( tot_grain_data_list, normalized_to ) )
-
-                #Find SEM in arrays (function? OUT = Single array of +/-)
-                sem_grain_data_list.append( self.SEM_calc( tot_grain_data_list, ave_grain_data_list[0] ) )
-
-                #print( sem_grain_data_list[0][0][:5] )
-
-                #if i==0:
-                #    print( sem_grain_data_list[0][0][:10] )
-
-                #If plot, save plot data as PNG
-                if output_plot:
-                    
-                    #Plot normalized and averaged values
-                    figsize = ( 16, 9 )
-                    plt.figure( figsize = figsize, dpi = 600 )
-
-                    plt.plot( ave_grain_data_list[0][0], ave_grain_data_list[0][1], color = '#000099', lw = 0.5 )
-
-                    #Calc total SEM Values
-                    sem_above = []
-                    sem_below = []
-
-                    
-
-                    for k in range( len( sem_grain_data_list[0][0] ) ):
-
-                        sem_above.append( ave_grain_data_list[0][1][k] + sem_grain_data_list[0][1][k] )
-                        sem_below.append( ave_grain_data_list[0][1][k] + sem_grain_data_list[0][0][k] )
-
-                    #Plot +/- SEM
-                    plt.fill_between( ave_grain_data_list[0][0], sem_below, sem_above, facecolor = '#9999FF', interpolate = True )
-
-                    plt.xlabel( 'cm^-1' )
-                    plt.ylabel( 'Intensity (Normalized to {})'.format( normalized_to ) )
-
-                    plt.ylim( 0., normalized_to*1.1 )
-
-                    plt.xticks( np.arange( min( ave_grain_data_list[0][0] ), max( ave_grain_data_list[0][0] )+1, 500.) )
-                    plt.yticks( np.arange( 0., normalized_to*1.1, step = 0.2*normalized_to ) ) 
-
-                    data_line = mpatches.Patch(color='#000099', label='Averaged Data' )
-                    sem_colors = mpatches.Patch(color='#9999FF', label='SEM Range')
-
-                    plt.legend(handles=[data_line, sem_colors])
-
-                    plt.title( "Averaged Data in Grain {}".format( ( i+1 ) ) )
-
-                    plt.grid(True)
-
-                    plt.savefig( os.path.join(ffn_out, "Grain {} - Averaged_RAMAN.png".format( (i+1) )) )
-                        
-                #If output type enabled, output data type
-                if output_data:
+            #Update Progress bar after each grain
+            def progress( done, total ):
+                self.progress_var.set( 100.*done/total )
+                self.mf.update_idletasks()
 
-                    #Open File
-                    fle     = open( os.path.join(ffn_out, "Grain {} - Averaged_RAMAN{}".format( (i+1), exten )) , 'w' )
+            if len( folders ) > 1:
+                analyze_batch( folders, ffn_out, output_plot, output_data, self.fmt_val, progress = progress, report = bool( self.output_report.get() ) )
 
-                    #Create Header
-                    header  = "x" + delim + "y-Ave" + delim + "y-SEM\n"
-                    fle.write( header )
+            else:
+                #Timing report of the run, next to the outputs
+                report = RunReport() if self.output_report.get() else None
 
-                    #Cycle through 'x' values for SEM and
-                    for l in range( len( sem_grain_data_list[0][0] ) ):
-                        line = str( ave_grain_data_list[0][0][l] )
-                        line += delim + str( ave_grain_data_list[0][1][l] )
-                        line += delim + str( sem_grain_data_list[0][1][l] )
-                        line += "\n"
-                        fle.write( line )
-                    
-                    #Close File
-                    fle.close()
+                analyze_folder( ffn, ffn_out, output_plot, output_data, self.fmt_val, progress = progress, report = report )
 
-                #Update Progress bar
-                self.progress_var.set( prog_incr*(i+1) )
-                self.mf.update_idletasks()
+                if report is not None:
+                    print( "Run report written to {}".format( report.write( ffn_out ) ) )
 
             self.progress_var.set( 0. )
             self.mf.update_idletasks()
@@ -380,119 +1820,6 @@ class AnalyzeSPC:
             else:
                 print('%s not spc file, skipping' % fpath)
         '''
-    #Removes stray data points that aren't real measurements
-    def sanitize_list(self, m_data, slope_threshold = 50. ):
-
-        #Check data for large unwanted slopes
-        
-        for i in range( len( m_data[1] ) ):
-
-            #If on first point, set the previous point
-            if not i == 0:
-                slope = abs( (m_data[1][i] - m_data[1][i-1] )/( m_data[0][i-1] - m_data[0][i] ) )
-
-                #If the slope is too large, remove the point
-                if slope >= slope_threshold:
-                    
-                    #If not the 2nd to last point
-                    if not i == ( len( m_data[1] ) - 2 ):
-                        
-                        #Remove the large point and replace with an average
-                        point_ave       = ( m_data[1][i-1] + m_data[1][i+1] )/2.
-                        m_data[1][i]    = point_ave
-        
-        #Return the resultant list
-        return m_data
-
-    #Normalize given data to given max height
-    def measurement_normalized( self, m_data, max_h, m_count):
-
-        #Remove nasty stray data points
-        clean_list = self.sanitize_list( m_data )
-
-        #Find maximum value in list
-        max_val = 0.
-
-        #Cycle through 'y' values
-        for i in range( len( clean_list[1] ) ):
-
-            if  clean_list[1][i] > max_val:
-
-                max_val =  clean_list[1][i]
-
-        #Calculate Normalizing value
-        norm_val = max_h/( max_val*m_count )
-
-        #Normalize system to max_h/m_count
-        for i in range( len( clean_list[1] ) ):
-            
-            clean_list[1][i] *= norm_val
-
-        #Return Normalized data
-        return clean_list
-
-    #Average given data
-    def grain_average( self, g_data, n_to ):
-        #g_data = [ 
-        #           [ [x,x,x,x], [y,y,y,y] ], 
-        #           [ [x,x,x,x], [y,y,y,y] ], 
-        #           [ [x,x,x,x], [y,y,y,y] ], 
-        #          ... ]
-
-        ave_grain_list = []
-
-        #Cycle through each measurement on this grain
-        for i in range( len( g_data ) ): #5
-
-            #m_list = [ [x,x,x,x], [y,y,y,y] ]
-            m_list = g_data[i]
-
-            norm_m_list = self.measurement_normalized( m_list, n_to, len( g_data ) )  #( [[x],[y]], 1.0, 5 )
-
-            #If first loop
-            if i == 0:
-                ave_grain_list.append( norm_m_list )
-
-            #Else, add the list y-elements
-            else:
-                for j in range( len( ave_grain_list[0][1] ) ):
-                    ave_grain_list[0][1][j] += norm_m_list[1][j]
-
-        #Return Final List
-        return ave_grain_list[0]
-
-    #Standard Error of the Mean Calculation
-    def SEM_calc(self, g_data, ave_g_data):
-
-        p_sem = []
-        m_sem = []
-
-        sem_l = []
-
-        #Cycle through each 'x' value
-        for i in range( len( ave_g_data[0] ) ):
-
-            #SEM at point i
-            sem = 0.
-
-            #Cycle through each 'y' value at the given 'x'
-            count = len( g_data )           #5
-            for j in range( count ):
-
-                sem += math.pow( ( ave_g_data[1][i] - g_data[j][1][i] ) , 2. )
-
-            sem = math.sqrt( sem )
-
-            sem /= (count - 1.)*count
-
-            p_sem.append( sem )
-            m_sem.append( -1.*sem )
-        
-        sem_l.append( m_sem )
-        sem_l.append( p_sem )
-
-        return sem_l
-
     #Ask for directory. (Used in init)
     def ask_dir(self):
         self.folder.set( filedialog.askdirectory() )
@@ -518,12 +1845,146 @@ class AnalyzeSPC:
 
 #Main call
 if __name__ == "__main__":
-    #Initiate TK
-    root = Tk()
 
-    #Initiate main class with root
-    clss = AnalyzeSPC(root)
+    parser = argparse.ArgumentParser( description = "Analyze Rennishaw SPC files. Opens the GUI unless a folder, --watch, --map or --serve is given." )
+    parser.add_argument( "folder",      nargs = "*", help = "Analyze FOLDER ( or a zip/tar archive ) without the GUI. Several folders or glob patterns run as one batch" )
+    parser.add_argument( "--batch",     metavar = "FILE", help = "Job file listing input folders or glob patterns, one per line, run as one batch" )
+    parser.add_argument( "--watch",     metavar = "FOLDER", help = "Process spectra in FOLDER as the spectrometer writes them" )
+    parser.add_argument( "--map",       metavar = "FILE", help = "Analyze a multi-subfile SPC map" )
+    parser.add_argument( "--region-size", type = int, default = 1, help = "Consecutive map spectra averaged per grain" )
+    parser.add_argument( "-o", "--output", default = "", help = "Output folder (default: input folder)" )
+    parser.add_argument( "--format",    choices = [ 'csv', 'txt', 'spc' ], default = 'csv', help = "Output data format" )
+    parser.add_argument( "--raw",       action = "store_true", help = "Output averaged data files" )
+    parser.add_argument( "--no-plot",   action = "store_true", help = "Do not write PNG plots" )
+    parser.add_argument( "--grid",      type = parse_grid, default = 'first', help = "Common 'x' values: first (file of each grain), union (of all files) or START:STOP:STEP" )
+    parser.add_argument( "--xrange",    type = parse_xrange, default = None, help = "Only load points with 'x' in LO:HI, e.g. 100:1800" )
+    parser.add_argument( "--precision", choices = [ 'float64', 'float32' ], default = 'float64', help = "Precision of 'y' values from decoding to output; float32 halves memory on large runs" )
+    parser.add_argument( "--smooth",    type = parse_smooth, default = None, help = "Smooth each spectrum before removing its baseline: savgol[:WINDOW[:ORDER[:DERIV]]] (Savitzky-Golay, default 11:3) or moving[:WINDOW] (default none)" )
+    parser.add_argument( "--baseline",  type = parse_baseline, default = None, help = "Remove each spectrum's baseline before normalizing: als[:LAM[:P]], poly[:DEG] or rollingball[:RADIUS] (default none)" )
+    parser.add_argument( "--normalize", type = parse_normalize, default = 'max', help = "Scale each spectrum by its max, area, band:LO:HI (highest point in the band), l2 (vector norm) or snv (default max)" )
+    parser.add_argument( "--peaks",     type = parse_peaks, default = None, metavar = "PROMINENCE[:WIDTH]", help = "Find the peaks of every averaged grain ( least prominence and width ) and write 'Peaks.csv'" )
+    parser.add_argument( "--peak-window", type = parse_xrange, action = "append", default = [], metavar = "LO:HI", help = "Fit the peaks in LO:HI of every grain into 'Peak Fits.csv' (repeatable, implies --peaks 0.05)" )
+    parser.add_argument( "--peak-shape", choices = ( 'lorentzian', 'voigt' ), default = 'lorentzian', help = "Fitted peak shape: lorentzian or voigt (pseudo-Voigt)" )
+    parser.add_argument( "--workers",   type = int, default = 1, help = "Worker processes for loading and averaging" )
+    parser.add_argument( "--poll",      type = float, default = 1.0, help = "Seconds between folder scans" )
+    parser.add_argument( "--settle",    type = float, default = 2.0, help = "Seconds a file must stop growing before it is read" )
+    parser.add_argument( "--debounce",  type = float, default = 5.0, help = "Seconds without new files before a grain is re-emitted" )
+    parser.add_argument( "--idle-exit", type = float, default = None, help = "Stop watching after this many idle seconds" )
+    parser.add_argument( "--parse-stats", metavar = "FILE", help = "Write time per SPC parse phase, bytes and subfiles read to FILE (JSON)" )
+    parser.add_argument( "--report",    action = "store_true", help = "Write 'Run Report.json' and 'Run Report.csv' (time per phase and grain, counts, peak memory) next to the outputs" )
+    parser.add_argument( "--profile",   type = int, default = 0, metavar = "N", help = "Also capture cProfile stats and tracemalloc peaks of the N slowest grains (implies --report)" )
+    parser.add_argument( "--serve",     metavar = "[HOST:]PORT", help = "Run an analysis server on HOST:PORT (default host 127.0.0.1), see Submit_RAMAN_Job.py" )
+    parser.add_argument( "--cache",     type = int, default = 4096, help = "Decoded measurements each server process keeps between jobs" )
+    parser.add_argument( "--index",     metavar = "DB", help = "Record files, grains, parameters and outputs of folder runs in this SQLite index (see python -m spc query)" )
+    args = parser.parse_args()
+
+    #Peak tables of the averaged grains, fitting implies finding
+    try:
+        peaks = peak_settings( args.peaks or ( '0.05' if args.peak_window else None ), args.peak_window, args.peak_shape, args.xrange )
+    except ValueError as e:
+        parser.error( str( e ) )
+
+    #Input folders. More than one, or a job file, makes a batch with outputs in subfolders of --output
+    folders = expand_folders( args.folder, args.batch )
+    batch   = len( folders ) > 1 or bool( args.batch )
+
+    #Outputs go into the input folder by default, next to an archive or map
+    if folders:
+        out_default = os.path.dirname( folders[0] ) if spc.archive.is_archive( folders[0] ) else folders[0]
+    else:
+        out_default = os.path.dirname( args.map or '' )
+
+    if args.parse_stats:
+        spc.instrument.enable()
+
+    if ( folders or args.watch or args.map ) and args.no_plot and not args.raw:
+        parser.error( "Nothing to output, use --raw and/or drop --no-plot" )
+
+    if args.watch and peaks is not None:
+        parser.error( "--peaks works on every averaged grain of a run, not with --watch" )
+
+    if args.watch and args.grid == 'union':
+        parser.error( "--grid union needs every file up front, use first or START:STOP:STEP with --watch" )
+
+    #Searchable record of folder runs
+    index = spc.Index( args.index ) if args.index and folders else None
+
+    #Batches write a report per folder
+    report = RunReport( args.profile ) if ( args.report or args.profile ) and ( folders or args.map ) and not batch else None
+
+    if args.map:
+
+        counts = analyze_map( os.path.abspath( args.map ), os.path.abspath( args.output or os.path.dirname( args.map ) ),
+                              output_plot = not args.no_plot, output_data = args.raw, fmt = args.format,
+                              region_size = args.region_size, xrange = args.xrange, report = report, dtype = np.dtype( args.precision ),
+                              baseline = args.baseline, normalize = args.normalize,
+                              smooth = args.smooth, peaks = peaks )
+
+        print( "{} spectra in {} grains".format( sum( counts.values() ), len( counts ) ) )
+
+    elif batch:
+
+        print( "Analyzing {} folders with {} ext".format( len( folders ), args.format ) )
+
+        results = analyze_batch( folders, args.output or None, output_plot = not args.no_plot, output_data = args.raw, fmt = args.format,
+                                 workers = args.workers, grid = args.grid, xrange = args.xrange,
+                                 report = args.report, profile = args.profile, index = index, dtype = np.dtype( args.precision ),
+                                 baseline = args.baseline, normalize = args.normalize,
+                                 smooth = args.smooth, peaks = peaks )
+
+        print( "{} measurements in {} grains from {} folders".format( sum( sum( c.values() ) for c in results.values() ),
+                                                                      sum( len( c ) for c in results.values() ), len( results ) ) )
+
+    elif folders:
+
+        print( "Analyzing {} with {} ext".format( folders[0], args.format ) )
+
+        counts = analyze_folder( folders[0], os.path.abspath( args.output or out_default ),
+                                 output_plot = not args.no_plot, output_data = args.raw, fmt = args.format,
+                                 workers = args.workers, grid = args.grid, xrange = args.xrange, report = report, index = index,
+                                 dtype = np.dtype( args.precision ), baseline = args.baseline, normalize = args.normalize,
+                                 smooth = args.smooth, peaks = peaks )
+
+        if not counts:
+            print( "Your input folder is either empty or the spc files are not configured correctly." )
+
+    elif args.serve:
+
+        host, _, port = args.serve.rpartition( ':' )
+        server = AnalysisServer( host or '127.0.0.1', int( port ), workers = args.workers, cache = args.cache )
+
+        print( "Serving on http://{}:{} with {} worker(s) (Ctrl+C to stop)".format( server.address[0], server.address[1], args.workers ) )
+        server.serve_forever()
+
+    elif args.watch:
+
+        watcher = GrainWatcher( args.watch, args.output, output_plot = not args.no_plot, output_data = args.raw, fmt = args.format,
+                                poll = args.poll, settle = args.settle, debounce = args.debounce, grid = args.grid,
+                                xrange = args.xrange, dtype = np.dtype( args.precision ), baseline = args.baseline, normalize = args.normalize,
+                                smooth = args.smooth )
+
+        print( "Watching {} (Ctrl+C to stop)".format( watcher.folder ) )
+        watcher.run( idle_exit = args.idle_exit )
+
+    else:
+        try:
+            import_gui()
+        except ImportError:
+            parser.error( "tkinter is not available, give a folder to analyze without the GUI" )
+
+        #Initiate TK
+        root = Tk()
+
+        #Initiate main class with root
+        clss = AnalyzeSPC(root)
+
+        #Set root as mainloop
+        root.config( menu = clss.menubar )
+        root.mainloop()
+
+    #GUI runs included, once the window is closed
+    if args.parse_stats:
+        spc.instrument.registry.dump( args.parse_stats )
 
-    #Set root as mainloop
-    root.config( menu = clss.menubar )
-    root.mainloop()
+    if report is not None:
+        print( "Run report written to {}".format( report.write( os.path.abspath( args.output or out_default ) ) ) )
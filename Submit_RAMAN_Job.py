@@ -0,0 +1,107 @@
+"""
+Name:           Rennishaw RAMAN Job Client
+Description:    Submits a folder to a running analysis server ( Analyze_RAMAN_Data.py --serve PORT ) and prints its progress.
+                Only uses the standard library, so it starts much faster than the analyzer itself
+Notes:          1. Paths are sent as given, they must be valid on the machine running the server
+                2. Exits with status 1 if the job failed
+"""
+
+#Import Libraries
+from __future__ import division, absolute_import, unicode_literals, print_function
+import os
+import sys
+import json
+import argparse
+from urllib.request import Request, urlopen
+from urllib.error import HTTPError, URLError
+
+#Send a job and yield each event the server streams back
+def submit( server, job ):
+
+    req = Request( "http://{}/analyze".format( server ), data = json.dumps( job ).encode( 'utf8' ),
+                   headers = { 'Content-Type' : 'application/json' } )
+
+    try:
+        resp = urlopen( req )
+    except HTTPError as e:
+        #Bad jobs are answered with a single error event
+        resp = e
+
+    with resp:
+        for line in resp:
+            if line.strip():
+                yield json.loads( line.decode( 'utf8' ) )
+
+#Status of the server ( jobs run, cache hits )
+def status( server ):
+
+    with urlopen( "http://{}/status".format( server ) ) as resp:
+        return json.loads( resp.read().decode( 'utf8' ) )
+
+#Main call
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser( description = "Submit a folder of Rennishaw SPC files to an analysis server" )
+    parser.add_argument( "folder",      nargs = "?", help = "Folder to analyze" )
+    parser.add_argument( "--server",    default = "127.0.0.1:8765", help = "HOST:PORT of the server (default 127.0.0.1:8765)" )
+    parser.add_argument( "--status",    action = "store_true", help = "Print the server status and exit" )
+    parser.add_argument( "-o", "--output", default = "", help = "Output folder (default: input folder)" )
+    parser.add_argument( "--format",    choices = [ 'csv', 'txt', 'spc' ], default = 'csv', help = "Output data format" )
+    parser.add_argument( "--raw",       action = "store_true", help = "Output averaged data files" )
+    parser.add_argument( "--no-plot",   action = "store_true", help = "Do not write PNG plots" )
+    parser.add_argument( "--grid",      default = 'first', help = "Common 'x' values: first, union or START:STOP:STEP" )
+    parser.add_argument( "--xrange",    default = None, help = "Only load points with 'x' in LO:HI" )
+    parser.add_argument( "--precision", choices = [ 'float64', 'float32' ], default = 'float64', help = "Precision of 'y' values" )
+    parser.add_argument( "--smooth",    default = None, help = "Smoothing before baseline removal: savgol[:WINDOW[:ORDER[:DERIV]]] or moving[:WINDOW]" )
+    parser.add_argument( "--baseline",  default = None, help = "Baseline removed before normalizing: als[:LAM[:P]], poly[:DEG] or rollingball[:RADIUS]" )
+    parser.add_argument( "--normalize", default = 'max', help = "Normalization: max, area, band:LO:HI, l2 or snv" )
+    parser.add_argument( "--peaks",     default = None, help = "Find the peaks of every grain: PROMINENCE[:WIDTH]" )
+    parser.add_argument( "--peak-window", action = "append", default = [], metavar = "LO:HI", help = "Fit the peaks in LO:HI (repeatable)" )
+    parser.add_argument( "--peak-shape", choices = [ 'lorentzian', 'voigt' ], default = 'lorentzian', help = "Fitted peak shape" )
+    parser.add_argument( "--report",    action = "store_true", help = "Write a run report next to the outputs" )
+    parser.add_argument( "--quiet",     action = "store_true", help = "Only print the result" )
+    args = parser.parse_args()
+
+    try:
+        if args.status:
+            print( json.dumps( status( args.server ), indent = 1 ) )
+            sys.exit( 0 )
+
+        if not args.folder:
+            parser.error( "a folder is needed unless --status is given" )
+
+        job = { 'folder'    : os.path.abspath( args.folder ),
+                'output'    : os.path.abspath( args.output ) if args.output else None,
+                'format'    : args.format,
+                'raw'       : args.raw,
+                'plot'      : not args.no_plot,
+                'grid'      : args.grid,
+                'xrange'    : args.xrange,
+                'precision' : args.precision,
+                'smooth'    : args.smooth,
+                'baseline'  : args.baseline,
+                'normalize' : args.normalize,
+                'peaks'     : args.peaks,
+                'peak_windows' : args.peak_window,
+                'peak_shape' : args.peak_shape,
+                'report'    : args.report }
+
+        failed = True
+
+        for event in submit( args.server, job ):
+
+            if event['event'] == 'progress' and not args.quiet:
+                print( "Grain {} of {}".format( event['done'], event['total'] ) )
+
+            elif event['event'] == 'done':
+                failed = False
+                print( "{} measurements in {} grains, {:.2f} s".format( event['files'], len( event['grains'] ), event['seconds'] ) )
+
+            elif event['event'] == 'error':
+                print( "Error: {}".format( event['message'] ), file = sys.stderr )
+
+    except URLError as e:
+        print( "Cannot reach the server at {}: {}".format( args.server, e.reason ), file = sys.stderr )
+        failed = True
+
+    sys.exit( 1 if failed else 0 )
@@ -0,0 +1,258 @@
+"""
+Parse and analysis benchmarks on a synthetic SPC corpus
+
+Times spc.File construction, data_list and write_file over corpora of every
+supported layout, and the end-to-end grain pipeline of Analyze_RAMAN_Data.
+Each case runs in its own process so that its peak RSS can be reported.
+
+Usage
+-----
+    python benchmarks/bench.py -o results.json
+    python benchmarks/bench.py --baseline results.json
+    python benchmarks/bench.py --full --only map
+"""
+
+from __future__ import division, absolute_import, unicode_literals, print_function
+
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(here))
+
+import numpy as np
+import synth
+
+# points per spectrum, about what a Renishaw grating scan gives
+NPTS = 1015
+
+
+def cases(full=False):
+    """
+    Benchmark cases: (name, fmt, ytype, nsub, nfiles)
+    """
+    out = []
+    for fmt in synth.FORMATS:
+        for ytype in synth.YTYPES:
+            # the old format has no 16 bit y
+            if fmt == 'old' and ytype == 'int16':
+                continue
+            out.append(("{}_{}_single".format(fmt, ytype), fmt, ytype, 1, 200))
+            out.append(("{}_{}_multi10".format(fmt, ytype), fmt, ytype, 10, 50))
+
+    # maps: one file, many subfiles
+    sizes = (1000, 10000, 100000) if full else (1000, 10000)
+    for nsub in sizes:
+        out.append(("gx-y_float_map{}".format(nsub), 'gx-y', 'float', nsub, 1))
+        out.append(("x-y_int16_map{}".format(nsub), 'x-y', 'int16', nsub, 1))
+    return out
+
+
+def peak_rss_mb():
+    """ Peak resident set size of this process in MB, None if unknown """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss / (1 << 20) if sys.platform == 'darwin' else rss / 1024.
+
+
+def best_of(repeat, fn):
+    """ Shortest wall time of repeat calls to fn """
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best
+
+
+def result(case, op, nfiles, nbytes, seconds):
+    return {
+        "case": case,
+        "op": op,
+        "files": nfiles,
+        "bytes": nbytes,
+        "seconds": seconds,
+        "files_per_s": nfiles / seconds if seconds else None,
+        "mb_per_s": nbytes / 1e6 / seconds if seconds else None,
+    }
+
+
+def run_parse_case(name, paths, repeat, write):
+    """ Child process: time File, data_list and write_file on paths """
+    import spc
+
+    nbytes = sum(os.path.getsize(p) for p in paths)
+    out = []
+    quiet = io.StringIO()
+
+    with contextlib.redirect_stdout(quiet):
+        files = []
+
+        def load():
+            del files[:]
+            files.extend(spc.File(p) for p in paths)
+
+        out.append(result(name, "File", len(paths), nbytes, best_of(repeat, load)))
+
+        def data_list():
+            for f in files:
+                f.data_list()
+
+        out.append(result(name, "data_list", len(paths), nbytes, best_of(repeat, data_list)))
+
+        if write:
+            tmp = tempfile.mkdtemp()
+            try:
+                def write_all():
+                    for i, f in enumerate(files):
+                        f.write_file(os.path.join(tmp, "{}.txt".format(i)))
+
+                out.append(result(name, "write_file", len(paths), nbytes, best_of(repeat, write_all)))
+            finally:
+                shutil.rmtree(tmp)
+
+    rss = peak_rss_mb()
+    for r in out:
+        r["peak_rss_mb"] = rss
+    return out
+
+
+def run_pipeline_case(name, folder, repeat, workers):
+    """ Child process: time the analyzer on a grain folder, writing data files only """
+    import Analyze_RAMAN_Data as analyzer
+
+    paths = [os.path.join(folder, f) for f in os.listdir(folder)]
+    nbytes = sum(os.path.getsize(p) for p in paths)
+    out_dir = tempfile.mkdtemp()
+
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            seconds = best_of(repeat, lambda: analyzer.analyze_folder(
+                folder, out_dir, output_plot=False, output_data=True, workers=workers))
+    finally:
+        shutil.rmtree(out_dir)
+
+    r = result(name, "analyze_folder", len(paths), nbytes, seconds)
+    r["workers"] = workers
+    r["peak_rss_mb"] = peak_rss_mb()
+    return [r]
+
+
+def in_child(fn, *args):
+    """ Run fn in a fresh process so peak RSS is per case """
+    ctx = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+        return pool.submit(fn, *args).result()
+
+
+def compare(results, baseline, tolerance):
+    """
+    Print throughput against a baseline run, returns the regressions
+    (cases more than tolerance slower)
+    """
+    base = {(r["case"], r["op"]): r for r in baseline["results"]}
+    slower = []
+
+    print("\n{:<28} {:<15} {:>12} {:>12} {:>8}".format("case", "op", "base MB/s", "MB/s", "ratio"))
+    for r in results:
+        b = base.get((r["case"], r["op"]))
+        if b is None or not b["mb_per_s"] or not r["mb_per_s"]:
+            continue
+        ratio = r["mb_per_s"] / b["mb_per_s"]
+        flag = " <" if ratio < 1. - tolerance else ""
+        print("{:<28} {:<15} {:>12.2f} {:>12.2f} {:>8.2f}{}".format(
+            r["case"], r["op"], b["mb_per_s"], r["mb_per_s"], ratio, flag))
+        if flag:
+            slower.append(r)
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SPC parse and analysis benchmarks")
+    parser.add_argument("-o", "--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed slowdown against the baseline (default 0.2)")
+    parser.add_argument("--repeat", type=int, default=3, help="best of this many runs")
+    parser.add_argument("--full", action="store_true", help="include the 100k subfile map")
+    parser.add_argument("--only", default="", help="run cases whose name contains this")
+    parser.add_argument("--workers", type=int, default=1, help="workers for the pipeline case")
+    parser.add_argument("--corpus", help="keep the generated corpus in this folder")
+    args = parser.parse_args()
+
+    corpus = args.corpus or tempfile.mkdtemp(prefix="spc_corpus_")
+    results = []
+
+    try:
+        for name, fmt, ytype, nsub, nfiles in cases(args.full):
+            if args.only not in name:
+                continue
+
+            paths = synth.write_corpus(os.path.join(corpus, name), fmt, ytype, nsub, NPTS, nfiles)
+            # text output of large maps would dominate the run
+            write = nsub * nfiles <= 1000
+            res = in_child(run_parse_case, name, paths, args.repeat, write)
+            for r in res:
+                print("{:<28} {:<15} {:>10.1f} files/s {:>10.2f} MB/s".format(
+                    r["case"], r["op"], r["files_per_s"], r["mb_per_s"]))
+            results.extend(res)
+
+        name = "pipeline_20grains_x10"
+        if args.only in name:
+            folder = os.path.join(corpus, name)
+            synth.write_corpus(folder, 'gx-y', 'float', 1, NPTS, 200, grains=20)
+            res = in_child(run_pipeline_case, name, folder, args.repeat, args.workers)
+            for r in res:
+                print("{:<28} {:<15} {:>10.1f} files/s {:>10.2f} MB/s".format(
+                    r["case"], r["op"], r["files_per_s"], r["mb_per_s"]))
+            results.extend(res)
+
+    finally:
+        if not args.corpus:
+            shutil.rmtree(corpus)
+
+    report = {
+        "meta": {
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+            "npts": NPTS,
+        },
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            slower = compare(results, json.load(f), args.tolerance)
+        if slower:
+            print("\n{} result(s) slower than the baseline".format(len(slower)))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
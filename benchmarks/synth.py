@@ -0,0 +1,127 @@
+"""
+Synthetic SPC corpus generator for the benchmarks
+
+Builds Raman-like spectra (sloped background, a few Lorentzian peaks and
+noise) and writes them as new format LSB (gx-y, x-y with txvals, -xy with a
+subfile directory, through spc.writer) or old 0x4D files, with float, 32-bit
+or 16-bit integer y data.
+"""
+
+from __future__ import division, absolute_import, unicode_literals, print_function
+
+import os
+import sys
+import time
+import struct
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from spc import writer
+
+old_head_str = "<cchfffcchcccc8shh28s130s30s32s"
+subhead_str = "<cchfffiif4s"
+
+YTYPES = ('float', 'int32', 'int16')
+FORMATS = ('gx-y', 'x-y', '-xy', 'old')
+
+
+def spectra(nsub, npts, first=100., last=3200., seed=0):
+    """ Raman-like test spectra, (nsub, npts) """
+    rng = np.random.default_rng(seed)
+    x = np.linspace(first, last, npts)
+
+    y = 200. + 0.05 * (x - first)
+    for centre, width, height in ((520., 4., 4000.), (1350., 20., 1500.),
+                                  (1580., 15., 2500.), (2700., 40., 800.)):
+        y = y + height / (1. + ((x - centre) / width) ** 2)
+
+    ys = y * rng.uniform(0.8, 1.2, (nsub, 1))
+    ys += rng.normal(0., 15., (nsub, npts))
+    return x, ys
+
+
+def _exponent(values):
+    """ Exponent that leaves the largest value a bit of headroom once scaled to an integer """
+    peak = float(np.max(np.abs(values))) or 1.
+    return int(np.floor(np.log2(peak))) + 2
+
+
+def _subheader(i, exp, npts=0):
+    return struct.pack(subhead_str, b'\x00', bytes([exp]), i % 32768, float(i),
+                       0., 0., npts, 0, 0., b'')
+
+
+def new_format(x, ys, fmt='gx-y', ytype='float'):
+    """ Bytes of a new format (LSB) file, written by spc.writer """
+    ys = np.atleast_2d(ys)
+    date = time.localtime(0)
+
+    if fmt == '-xy':
+        return writer.encode(list(ys), [x] * len(ys), ytype=ytype, date=date)
+    return writer.encode(ys, x, ytype=ytype, date=date, xvals=(fmt == 'x-y'))
+
+
+def old_format(x, ys, ytype='int32'):
+    """ Bytes of an old 0x4D format file, 32-bit integer or float y """
+    ys = np.atleast_2d(ys)
+    nsub, npts = ys.shape
+
+    if ytype == 'float':
+        exp = 128
+        data = [np.asarray(y, '<f4').tobytes() for y in ys]
+    else:
+        exp = _exponent(ys)
+        data = []
+        for y in ys:
+            # 32 bit words stored as two little-endian 16 bit halves, high half first
+            v = np.round(y * 2. ** (32 - exp)).astype(np.int64) & 0xffffffff
+            halves = np.stack([(v >> 16) & 0xffff, v & 0xffff], axis=1)
+            data.append(halves.astype('<u2').tobytes())
+
+    subs = [_subheader(i, exp if ytype == 'float' else 0, npts)
+            for i in range(nsub)]
+
+    head = struct.pack(old_head_str, b'\x00', b'\x4d', exp if exp < 128 else 0,
+                       float(npts), float(x[0]), float(x[-1]), b'\x0d', b'\x00',
+                       0, b'\x00', b'\x00', b'\x00', b'\x00', b'', 0, nsub, b'',
+                       b'', b'', subs[0])
+    out = [head, data[0]]
+    for sub, dat in zip(subs[1:], data[1:]):
+        out.append(sub)
+        out.append(dat)
+    return b''.join(out)
+
+
+def spc_bytes(fmt, ytype, nsub, npts, seed=0):
+    """ Bytes of one synthetic file """
+    x, ys = spectra(nsub, npts, seed=seed)
+    if fmt == 'old':
+        return old_format(x, ys, ytype)
+    return new_format(x, ys, fmt, ytype)
+
+
+def write_corpus(folder, fmt, ytype, nsub, npts, nfiles, grains=None):
+    """
+    Write nfiles synthetic files into folder. With grains, files are named
+    Sample_<grain>_<n>.spc and spread evenly over that many grains.
+
+    Returns
+    -------
+    list:
+        paths of the files written
+    """
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+
+    paths = []
+    for i in range(nfiles):
+        if grains:
+            name = "Sample_{}_{}.spc".format(i % grains + 1, i // grains + 1)
+        else:
+            name = "{}_{}_{}_{}.spc".format(fmt, ytype, nsub, i)
+        path = os.path.join(folder, name)
+        with open(path, 'wb') as f:
+            f.write(spc_bytes(fmt, ytype, nsub, npts, seed=i))
+        paths.append(path)
+    return paths
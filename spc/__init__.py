@@ -1,10 +1,48 @@
 """
 Module for reading, exploring and converting SPC spectroscopic binary data in Python.
+
+Submodules, and numpy with them, are only imported when first used, so
+`import spc` itself is fast.
 """
 
-from .spc import File
+import importlib
+
+# public name -> submodule defining it
+_lazy = {
+    'File': 'spc',
+    'Accumulator': 'stats',
+    'SpectralCube': 'cube',
+    'common_grid': 'grid',
+    'resample': 'grid',
+    'save': 'writer',
+    'peek': 'header',
+    'Index': 'index',
+}
+
+_submodules = ('spc', 'sub', 'global_fun', 'header', 'instrument', 'stats',
+               'cube', 'grid', 'writer', 'index', 'archive', 'baseline', 'normalize',
+               'smooth', 'peaks')
+
+__all__ = sorted(_lazy) + ['instrument', 'archive', 'baseline', 'normalize', 'smooth', 'peaks']
 
 __author__ = "Rohan Isaac"
 __author_email__ = "rohan_isaac@yahoo.com"
 __version__ = "0.4.0"
 __license__ = "GPLv3"
+
+
+def __getattr__(name):
+    if name in _lazy:
+        value = getattr(importlib.import_module('.' + _lazy[name], __name__), name)
+    elif name in _submodules:
+        value = importlib.import_module('.' + name, __name__)
+    else:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+    # later lookups skip __getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy) | set(_submodules))
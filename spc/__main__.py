@@ -0,0 +1,139 @@
+"""
+Command line helpers
+
+    python -m spc peek FILE [FILE ...]
+    python -m spc convert FILE [FILE ...] [-o FOLDER] [--format txt|csv|spc]
+    python -m spc index DB FOLDER [FOLDER ...]
+    python -m spc query DB [--sample NAME] [--x LO:HI] [--since DATE] [--until DATE] [--files]
+
+peek reads only the main header, and no command loads more than the
+parser needs. convert and index also take zip or tar archives, whose SPC
+members are read without extracting them.
+"""
+
+from __future__ import division, absolute_import, unicode_literals, print_function
+
+import os
+import sys
+import argparse
+
+from .header import peek
+
+formats = {'txt': ('.txt', '\t'), 'csv': ('.csv', ','), 'spc': ('.spc', None)}
+
+
+def cmd_peek(args):
+    for path in args.files:
+        print(path)
+        for key, value in peek(path).items():
+            print("    {:<9} {}".format(key, value))
+
+
+def cmd_convert(args):
+    # deferred, so peek never imports numpy
+    import io
+    import contextlib
+    from .spc import File
+    from . import archive
+
+    exten, delim = formats[args.format]
+    failed = 0
+
+    paths = []
+    for path in args.files:
+        paths.extend(archive.list_spc(path) if archive.is_archive(path) else [path])
+
+    for path in paths:
+        # members of an archive are written next to it
+        out_dir = args.output or os.path.dirname(os.path.abspath(archive.split(path)[0]))
+        out = os.path.join(out_dir, os.path.splitext(os.path.basename(path))[0] + exten)
+
+        try:
+            # the parser prints the format of every file
+            with contextlib.redirect_stdout(io.StringIO()):
+                f = File(archive.source(path))
+            if delim is None:
+                f.save(out)
+            else:
+                f.write_file(out, delimiter=delim)
+        except Exception as e:
+            print("{}: {}".format(path, e), file=sys.stderr)
+            failed += 1
+        else:
+            print(out)
+
+    return 1 if failed else 0
+
+
+def cmd_index(args):
+    from .index import Index
+    from . import archive
+
+    paths = []
+    for folder in args.folders:
+        if archive.is_archive(folder):
+            paths.extend(archive.list_spc(folder))
+            continue
+        for root, dirs, names in os.walk(folder):
+            paths.extend(os.path.join(root, n) for n in sorted(names) if n.lower().endswith('.spc'))
+
+    with Index(args.db) as db:
+        ids = db.add_files(paths)
+    print("{} of {} files indexed in {}".format(len(ids), len(paths), args.db))
+
+
+def cmd_query(args):
+    from .index import Index
+
+    x = None
+    if args.x:
+        x = tuple(float(v) for v in args.x.split(':'))
+
+    with Index(args.db) as db:
+        if args.files:
+            rows = db.files(args.sample, x, args.since, args.until)
+            cols = ('path', 'sample', 'grain', 'measurement', 'acquired', 'xmin', 'xmax', 'fnpts')
+        else:
+            rows = db.grains(args.sample, x, args.since, args.until)
+            cols = ('run_id', 'sample', 'grain', 'n_files', 'acquired', 'xmin', 'xmax', 'data_path', 'plot_path')
+
+    print('\t'.join(cols))
+    for r in rows:
+        print('\t'.join('' if r[c] is None else str(r[c]) for c in cols))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m spc", description="SPC file helpers")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    p = commands.add_parser("peek", help="print the main header of SPC files")
+    p.add_argument("files", nargs="+")
+    p.set_defaults(run=cmd_peek)
+
+    p = commands.add_parser("convert", help="convert SPC files to text or new format SPC")
+    p.add_argument("files", nargs="+", help="SPC files, or zip/tar archives of them")
+    p.add_argument("-o", "--output", help="output folder (default: next to each file or archive)")
+    p.add_argument("--format", choices=sorted(formats), default="txt")
+    p.set_defaults(run=cmd_convert)
+
+    p = commands.add_parser("index", help="add the SPC files under folders (or in archives) to a SQLite index")
+    p.add_argument("db")
+    p.add_argument("folders", nargs="+")
+    p.set_defaults(run=cmd_index)
+
+    p = commands.add_parser("query", help="list indexed grains (or files) matching every condition given")
+    p.add_argument("db")
+    p.add_argument("--sample", help="sample name, or a glob pattern such as 'Quartz*'")
+    p.add_argument("--x", metavar="LO:HI", help="x-range (e.g. cm-1) the data must overlap")
+    p.add_argument("--since", metavar="DATE", help="acquired on or after, YYYY-MM-DD")
+    p.add_argument("--until", metavar="DATE", help="acquired before, YYYY-MM-DD")
+    p.add_argument("--files", action="store_true", help="list files instead of analyzed grains")
+    p.set_defaults(run=cmd_query)
+
+    args = parser.parse_args(argv)
+    return args.run(args) or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+"""
+Reading SPC files straight out of zip and tar archives, without extracting
+them
+
+A file inside an archive is addressed by joining the archive path and the
+member name, e.g. /data/run.zip/Quartz_1_1.spc, the way zipimport addresses
+modules. Such paths can be given to read(), stat() and source() like any
+other path.
+
+Zip files and uncompressed tar files are read a member at a time. A
+compressed tar file can only be read front to back, so its members are
+read into memory in one pass the first time any of them is needed.
+"""
+
+from __future__ import division, absolute_import, unicode_literals, print_function
+
+import os
+import tarfile
+import zipfile
+import threading
+import collections
+
+extensions = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+# stat() of a member: its own size, and the times of the archive
+member_stat = collections.namedtuple('member_stat', 'st_size st_mtime st_mtime_ns')
+
+# archives kept open by open_archive(), most recently used last
+_open = collections.OrderedDict()
+_open_max = 8
+_open_lock = threading.Lock()
+
+
+def is_archive(path):
+    """ True if path is an existing file with an archive extension """
+    return str(path).lower().endswith(extensions) and os.path.isfile(path)
+
+
+def strip_extension(name):
+    """ Archive name without its extension, 'run.tar.gz' -> 'run' """
+    for ext in extensions:
+        if name.lower().endswith(ext):
+            return name[:-len(ext)]
+    return name
+
+
+def split(path):
+    """
+    Archive and member name of a path inside an archive
+
+    Returns
+    -------
+    tuple:
+        (archive, member), or (path, None) if path is not inside an archive
+    """
+    if os.path.exists(path):
+        return path, None
+
+    head, member = path, None
+    while True:
+        head, tail = os.path.split(head)
+        if not tail:
+            return path, None
+        member = tail if member is None else tail + '/' + member
+        if is_archive(head):
+            return head, member
+
+
+class Archive:
+    """
+    Zip or tar archive of SPC files
+
+    Examples
+    --------
+    >>> with spc.archive.Archive('/path/to/run.zip') as a:
+    ...     files = [spc.File(a.read(name)) for name in a.names('.spc')]
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.pid = os.getpid()
+        self.stat = os.stat(path)
+        self.lock = threading.Lock()
+        self._data = None
+
+        if zipfile.is_zipfile(path):
+            self._zip = zipfile.ZipFile(path)
+            self._tar = None
+            self._info = {i.filename: i.file_size for i in self._zip.infolist() if not i.is_dir()}
+            self.compressed = False
+            return
+
+        self._zip = None
+        try:
+            self._tar = tarfile.open(path, 'r:')
+            self.compressed = False
+        except tarfile.ReadError:
+            self._tar = tarfile.open(path, 'r:*')
+            self.compressed = True
+
+        # one pass over the headers
+        self._members = {m.name: m for m in self._tar.getmembers() if m.isfile()}
+        self._info = {name: m.size for name, m in self._members.items()}
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+        else:
+            self._tar.close()
+        self._data = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def names(self, extension=None):
+        """ Member file names in archive order, only those ending in extension if given """
+        if extension is None:
+            return list(self._info)
+        return [n for n in self._info if n.lower().endswith(extension.lower())]
+
+    def size(self, name):
+        """ Uncompressed size of a member """
+        return self._info[name]
+
+    def read(self, name):
+        """ Contents of a member as bytes """
+        with self.lock:
+            if self._zip is not None:
+                return self._zip.read(name)
+
+            if not self.compressed:
+                return self._tar.extractfile(self._members[name]).read()
+
+            if self._data is None:
+                # seeking backwards in a compressed stream starts it over,
+                # so read every member in a single forward pass instead
+                self._data = {}
+                with tarfile.open(self.path, 'r|*') as stream:
+                    for m in stream:
+                        if m.isfile():
+                            self._data[m.name] = stream.extractfile(m).read()
+            return self._data[name]
+
+
+def open_archive(path):
+    """
+    Archive at path, kept open for later calls until the archive file
+    changes or too many others have been opened since. Forked worker
+    processes open their own, as a shared file position would mix up reads.
+    """
+    st = os.stat(path)
+    key = os.path.abspath(path)
+
+    with _open_lock:
+        a = _open.get(key)
+        if a is not None and a.pid == os.getpid() and \
+                (a.stat.st_mtime_ns, a.stat.st_size) == (st.st_mtime_ns, st.st_size):
+            _open.move_to_end(key)
+            return a
+
+        a = _open[key] = Archive(path)
+        _open.move_to_end(key)
+        while len(_open) > _open_max:
+            _open.popitem(last=False)[1].close()
+        return a
+
+
+def read(path):
+    """ Contents of a file or archive member """
+    archive, member = split(path)
+    if member is None:
+        with open(path, 'rb') as f:
+            return f.read()
+    return open_archive(archive).read(member)
+
+
+def stat(path):
+    """
+    os.stat() of a file, or the size of an archive member with the times of
+    its archive, so a member counts as changed when its archive does
+    """
+    archive, member = split(path)
+    if member is None:
+        return os.stat(path)
+
+    a = open_archive(archive)
+    return member_stat(a.size(member), a.stat.st_mtime, a.stat.st_mtime_ns)
+
+
+def source(path):
+    """
+    What to give spc.File for path: the path itself for a plain file, so
+    large files are memory mapped, or the bytes of an archive member
+    """
+    archive, member = split(path)
+    if member is None:
+        return path
+    return open_archive(archive).read(member)
+
+
+def list_spc(path):
+    """ Paths of the SPC files in an archive, in archive order """
+    return [os.path.join(path, name) for name in open_archive(path).names('.spc')]
@@ -0,0 +1,365 @@
+"""
+Baseline (background) removal for stacks of spectra
+
+Every method works on a whole (n_spectra, n_points) stack at once and
+returns the baselines, which correct() subtracts:
+
+    als           asymmetric least squares (Eilers and Boelens), a smooth
+                  curve pulled under the peaks
+    polynomial    iterative polynomial fit that clips the peaks away each
+                  pass (modified polyfit, Lieber and Mahadevan-Jansen)
+    rolling_ball  minimum then maximum over a moving window, smoothed with
+                  a moving average of the same width (Kneen and Annegarn)
+
+What only depends on the number of points and the parameters (the ALS
+penalty bands, the polynomial least squares projector) is cached, so stacks
+of the same length reuse it.
+"""
+
+from __future__ import division, absolute_import, unicode_literals, print_function
+
+import numpy as np
+
+# ALS penalty bands per (n_points, lam), polynomial projectors per
+# (n_points, deg), most recently used last
+_penalties = {}
+_projectors = {}
+_cache_max = 16
+
+
+def _cached(cache, key, build):
+    """ cache[key], built on first use; the oldest entry goes when full """
+    value = cache.pop(key, None)
+    if value is None:
+        value = build()
+        while len(cache) >= _cache_max:
+            del cache[next(iter(cache))]
+    cache[key] = value
+    return value
+
+
+def _stack(ys):
+    """ ys as a 2-D float array, and whether it was a single spectrum """
+    ys = np.asarray(ys)
+    if not np.issubdtype(ys.dtype, np.floating):
+        ys = ys.astype(np.float64)
+    return np.atleast_2d(ys), ys.ndim == 1
+
+
+# ------------------------------------------------------------------------
+# Asymmetric least squares
+# ------------------------------------------------------------------------
+
+def penalty_bands(n, lam):
+    """
+    Bands of lam * D'D, D the (n - 2, n) second difference matrix
+
+    Returns
+    -------
+    tuple:
+        (main, first, second) diagonals of the symmetric pentadiagonal
+        matrix, of n, n - 1 and n - 2 values; read-only and shared
+    """
+    def build():
+        d = np.zeros((3, n))
+        # each row of D is [1, -2, 1] at columns i, i + 1, i + 2
+        for k, c in enumerate((1., -2., 1.)):
+            for j, c2 in enumerate((1., -2., 1.)):
+                off = j - k
+                if off >= 0:
+                    d[off, k:n - 2 + k] += c * c2
+        bands = (lam * d[0], lam * d[1, :n - 1], lam * d[2, :n - 2])
+        for b in bands:
+            b.flags.writeable = False
+        return bands
+
+    return _cached(_penalties, (n, float(lam)), build)
+
+
+def _solve_penta(main, first, second, rhs):
+    """
+    Solve A z = rhs for a batch of symmetric pentadiagonal systems that
+    share their off-diagonals, by LDL' factorization, one point at a time
+    over all spectra
+
+    Arguments
+    ---------
+    main: (n, m) array
+        main diagonal of each of the m systems, one column per system
+    first, second: (n - 1,) and (n - 2,) arrays
+        shared off-diagonals
+    rhs: (n, m) array
+
+    Returns
+    -------
+    (n, m) array
+    """
+    n = main.shape[0]
+    d = np.empty_like(main)
+    l1 = np.zeros_like(main)
+    l2 = np.zeros_like(main)
+    z = np.empty_like(rhs)
+
+    for i in range(n):
+        di = main[i].copy()
+        zi = rhs[i].copy()
+        if i >= 2:
+            l2[i] = second[i - 2] / d[i - 2]
+            di -= l2[i] * l2[i] * d[i - 2]
+            zi -= l2[i] * z[i - 2]
+        if i >= 1:
+            a = first[i - 1]
+            if i >= 2:
+                a = a - l2[i] * d[i - 2] * l1[i - 1]
+            l1[i] = a / d[i - 1]
+            di -= l1[i] * l1[i] * d[i - 1]
+            zi -= l1[i] * z[i - 1]
+        d[i] = di
+        z[i] = zi
+
+    z /= d
+    for i in range(n - 2, -1, -1):
+        z[i] -= l1[i + 1] * z[i + 1]
+        if i + 2 < n:
+            z[i] -= l2[i + 2] * z[i + 2]
+
+    return z
+
+
+def als(ys, lam=1e5, p=0.01, niter=10):
+    """
+    Asymmetric least squares baselines
+
+    Each baseline z minimizes sum(w * (y - z)**2) + lam * sum(diff(z, 2)**2),
+    where points above the baseline (peaks) get weight p and points below it
+    1 - p, re-weighted niter times or until no weight changes.
+
+    Arguments
+    ---------
+    ys: (n_spectra, n_points) or (n_points,) array
+    lam: float (default=1e5)
+        smoothness, larger is stiffer
+    p: float (default=0.01)
+        asymmetry, the weight of points above the baseline
+    niter: int (default=10)
+        most re-weighting passes
+
+    Returns
+    -------
+    array:
+        baselines, the same shape as ys
+
+    Example
+    -------
+    >>> flat = ys - spc.baseline.als(ys, lam=1e6, p=0.001)
+    """
+    ys, single = _stack(ys)
+    m, n = ys.shape
+    if n < 3:
+        return (ys[0] if single else ys).copy()
+
+    main_pen, first, second = penalty_bands(n, lam)
+
+    # a column per spectrum, so each step of the solver reads one row
+    y = np.ascontiguousarray(ys.T, dtype=np.float64)
+    w = np.ones_like(y)
+
+    for _ in range(niter):
+        z = _solve_penta(main_pen[:, None] + w, first, second, w * y)
+        w_new = np.where(y > z, p, 1. - p)
+        if np.array_equal(w_new, w):
+            break
+        w = w_new
+
+    z = z.T.astype(ys.dtype, copy=False)
+    return z[0] if single else z
+
+
+# ------------------------------------------------------------------------
+# Polynomial
+# ------------------------------------------------------------------------
+
+def _projector(n, deg):
+    """ Vandermonde matrix V over [-1, 1] and pinv(V).T, shared """
+    def build():
+        t = np.linspace(-1., 1., n)
+        v = np.vander(t, deg + 1)
+        pt = np.linalg.pinv(v).T
+        v.flags.writeable = False
+        pt.flags.writeable = False
+        return v, pt
+
+    return _cached(_projectors, (n, deg), build)
+
+
+def polynomial(ys, deg=3, niter=100, tol=1e-3):
+    """
+    Iterative polynomial baselines: fit, clip each spectrum to the fit, and
+    fit again until the fits change by less than tol (relative)
+
+    The polynomial is in the point index, the same as in x for evenly
+    spaced spectra.
+
+    Arguments
+    ---------
+    ys: (n_spectra, n_points) or (n_points,) array
+    deg: int (default=3)
+        polynomial degree
+    niter: int (default=100)
+        most passes
+    tol: float (default=1e-3)
+
+    Returns
+    -------
+    array:
+        baselines, the same shape as ys
+    """
+    ys, single = _stack(ys)
+    v, pt = _projector(ys.shape[1], deg)
+
+    work = ys.astype(np.float64)
+    fit = (work @ pt) @ v.T
+
+    for _ in range(niter):
+        np.minimum(work, fit, out=work)
+        new = (work @ pt) @ v.T
+        change = np.linalg.norm(new - fit, axis=1) / np.maximum(np.linalg.norm(new, axis=1), 1e-300)
+        fit = new
+        if (change < tol).all():
+            break
+
+    fit = fit.astype(ys.dtype, copy=False)
+    return fit[0] if single else fit
+
+
+# ------------------------------------------------------------------------
+# Rolling ball
+# ------------------------------------------------------------------------
+
+def _window_extreme(ys, radius, op):
+    """ op (np.minimum or np.maximum) over a window of radius points each side """
+    out = ys.copy()
+    for k in range(1, radius + 1):
+        op(out[:, k:], ys[:, :-k], out=out[:, k:])
+        op(out[:, :-k], ys[:, k:], out=out[:, :-k])
+    return out
+
+
+def _moving_mean(ys, radius):
+    """ Mean over a window of radius points each side, shorter at the ends """
+    n = ys.shape[1]
+    c = np.zeros((ys.shape[0], n + 1))
+    np.cumsum(ys, axis=1, out=c[:, 1:])
+
+    i = np.arange(n)
+    lo = np.maximum(i - radius, 0)
+    hi = np.minimum(i + radius + 1, n)
+    return (c[:, hi] - c[:, lo]) / (hi - lo)
+
+
+def rolling_ball(ys, radius=50, smooth=None):
+    """
+    Rolling ball baselines: the lowest point within radius points, then the
+    highest of those, smoothed by a moving average
+
+    Arguments
+    ---------
+    ys: (n_spectra, n_points) or (n_points,) array
+    radius: int (default=50)
+        half width of the ball in points, wider than the widest peak
+    smooth: int (default=None)
+        half width of the smoothing window in points, radius if None
+
+    Returns
+    -------
+    array:
+        baselines, the same shape as ys
+    """
+    ys, single = _stack(ys)
+    radius = int(min(radius, ys.shape[1] - 1))
+    smooth = radius if smooth is None else int(smooth)
+
+    low = _window_extreme(ys, radius, np.minimum)
+    ball = _window_extreme(low, radius, np.maximum)
+    base = _moving_mean(ball, smooth) if smooth > 0 else ball
+
+    # smoothing must not lift the baseline over the data
+    base = np.minimum(base, ys).astype(ys.dtype, copy=False)
+    return base[0] if single else base
+
+
+# ------------------------------------------------------------------------
+# Entry point
+# ------------------------------------------------------------------------
+
+methods = {'als': als, 'poly': polynomial, 'rollingball': rolling_ball}
+
+# positional parameters of each method in a spec, see parse()
+_params = {'als': (('lam', float), ('p', float), ('niter', int)),
+           'poly': (('deg', int), ('niter', int), ('tol', float)),
+           'rollingball': (('radius', int), ('smooth', int))}
+
+
+def parse(spec):
+    """
+    Method and parameters from a spec such as 'als', 'als:1e6:0.001',
+    'poly:4' or 'rollingball:80'; parameters are given in the order of the
+    method's arguments
+
+    Returns
+    -------
+    tuple:
+        (method name, dict of parameters)
+
+    Raises
+    ------
+    ValueError:
+        for an unknown method or a bad parameter
+    """
+    name, _, rest = spec.partition(':')
+    name = name.strip().lower()
+    if name not in methods:
+        raise ValueError("unknown baseline method {!r}, choose from {}".format(name, ', '.join(sorted(methods))))
+
+    values = rest.split(':') if rest else []
+    if len(values) > len(_params[name]):
+        raise ValueError("{} takes at most {} parameters".format(name, len(_params[name])))
+
+    params = {}
+    for (key, kind), value in zip(_params[name], values):
+        try:
+            params[key] = kind(value)
+        except ValueError:
+            raise ValueError("bad {} {!r} for {}".format(key, value, name))
+
+    return name, params
+
+
+def correct(ys, method='als', **params):
+    """
+    Spectra with their baselines subtracted
+
+    Arguments
+    ---------
+    ys: (n_spectra, n_points) or (n_points,) array
+    method: str (default='als')
+        'als', 'poly' or 'rollingball', or a spec for parse()
+    params:
+        parameters of the method, overriding those of a spec
+
+    Returns
+    -------
+    array:
+        new array of the same shape and float dtype as ys
+
+    Example
+    -------
+    >>> flat = spc.baseline.correct(stack, 'als', lam=1e6)
+    >>> flat = spc.baseline.correct(stack, 'rollingball:80')
+    """
+    name, spec_params = parse(method)
+    spec_params.update(params)
+
+    ys, single = _stack(ys)
+    out = ys - methods[name](ys, **spec_params)
+    return out[0] if single else out
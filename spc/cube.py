@@ -0,0 +1,307 @@
+"""
+SpectralCube class: multi-subfile SPC maps as an on-disk (n_spectra, n_points)
+array, processed in chunks
+"""
+
+from __future__ import division, absolute_import, unicode_literals, print_function
+
+import os
+import struct
+import tempfile
+import numpy as np
+
+from .spc import File, even_window, search_window
+from .stats import Accumulator
+from .baseline import correct as correct_baseline
+from .normalize import normalize as normalize_stack
+from .smooth import smooth as smooth_stack
+from .global_fun import flag_bits, subhead_dtype
+
+def despike(ys, x, slope_threshold=50.):
+    """
+    Remove stray points, in place. Going from the second point to the last,
+    a point whose slope from the point before it (as already cleaned) is at
+    least slope_threshold is replaced by the mean of that point and the next
+    one, or by the point before it if it is the last point.
+
+    Every spectrum of a stack is walked at once, one stray point per pass,
+    in the dtype of ys. This is the one despike of the analyzer and of maps.
+
+    Parameters
+    ----------
+    ys: (n_spectra, n_points) or (n_points,) float array, modified in place
+    x: (n_points,) array
+    slope_threshold: float
+
+    Returns
+    -------
+    ys
+    """
+    stack = ys if ys.ndim == 2 else ys[None]
+    n = stack.shape[1]
+    if n < 2:
+        return ys
+
+    dx = np.abs(np.diff(np.asarray(x, dtype=np.float64))).astype(stack.dtype)
+    points = np.arange(1, n)
+    first = np.ones(len(stack), dtype=np.intp)       # first point not yet checked
+    rows = np.arange(len(stack))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        while len(rows):
+            slope = np.abs(np.diff(stack[rows], axis=1)) / dx
+            spike = (slope >= slope_threshold) & (points >= first[rows, None])
+
+            found = spike.any(axis=1)
+            rows = rows[found]
+            i = spike[found].argmax(axis=1) + 1
+
+            after = np.minimum(i + 1, n - 1)
+            prev = stack[rows, i - 1]
+            stack[rows, i] = np.where(i == n - 1, prev, (prev + stack[rows, after]) / 2)
+            first[rows] = i + 1
+
+    return ys
+
+
+class SpectralCube:
+    """
+    Loads every subfile of a new format (LSB or MSB) SPC map into a memory-mapped
+    (n_spectra, n_points) array, so maps with thousands of subfiles can be
+    despiked, normalized and averaged a chunk at a time.
+
+    Data
+    ----
+    x: x-data shared by all spectra
+    y: (n_spectra, n_points) memory-mapped y-data
+    subtime: z (time) value of each spectrum
+    subindx: subfile index of each spectrum
+
+    Examples
+    --------
+    >>> cube = spc.SpectralCube('/path/to/map.spc')
+    >>> cube.despike()
+    >>> cube.normalize()
+    >>> stats = cube.region_stats(np.arange(cube.n_spectra) // 25)
+    """
+
+    def __init__(self, source, path=None, dtype=np.float64, chunk=1024, xrange=None):
+        """
+        Arguments
+        ---------
+        source: str or File
+            path to the SPC map, or an already loaded File
+        path: str (default=None)
+            backing file for the cube, a temporary file is used if not given
+            and removed by close()
+        dtype: numpy dtype (default=np.float64)
+            dtype of the cube
+        chunk: int (default=1024)
+            number of spectra processed at a time
+        xrange: (float, float) (default=None)
+            only keep points with x inside this range
+        """
+        self.chunk = chunk
+        self.temporary = path is None
+
+        if self.temporary:
+            fd, path = tempfile.mkstemp(suffix='.cube')
+            os.close(fd)
+        self.path = path
+
+        try:
+            if isinstance(source, File):
+                self._from_file(source, dtype, xrange)
+            else:
+                self._from_spc(source, dtype, xrange)
+        except BaseException:
+            # do not leave the backing file of a half loaded cube behind
+            self.close()
+            raise
+
+    # ------------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------------
+
+    def _alloc(self, n_spectra, n_points, dtype):
+        self.n_spectra = n_spectra
+        self.n_points = n_points
+        self.y = np.memmap(self.path, dtype=dtype, mode='w+',
+                           shape=(n_spectra, n_points))
+
+    def _from_file(self, f, dtype, xrange):
+        """ Copy the subfiles of a loaded File """
+        if f.dat_fmt.endswith('-xy'):
+            raise ValueError("subfiles have their own x values, cannot build a cube")
+
+        x = np.asarray(f.x)
+        keep = slice(None)
+        if xrange is not None:
+            lo, hi = sorted(xrange)
+            keep = (x >= lo) & (x <= hi)
+            if not keep.any():
+                raise ValueError("xrange {} is outside the x data of the file ({} to {})".format(
+                    xrange, x.min(), x.max()))
+
+        self.x = x[keep]
+        self._alloc(len(f.sub), len(self.x), dtype)
+        self.subtime = np.array(f.subheads['subtime'])
+        self.subindx = np.array(f.subheads['subindx'])
+
+        for i, s in enumerate(f.sub):
+            self.y[i] = s.y[keep]
+
+    def _from_spc(self, filename, dtype, xrange):
+        """ Decode the subfiles straight from disk, without building a File """
+        with open(filename, 'rb') as fin:
+            head = fin.read(File.head_siz)
+
+        if head[1:2] not in (b'\x4b', b'\x4c'):
+            raise ValueError("only new format (LSB or MSB) SPC maps are supported")
+
+        # MSB files differ only in byte order, read through big-endian dtypes
+        order = '<' if head[1:2] == b'\x4b' else '>'
+        items = struct.unpack((File.head_str if order == '<' else File.head_str_msb).encode('utf8'), head)
+        ftflg, fexp, fnpts, ffirst, flast, fnsub = \
+            items[0], ord(items[3]), items[4], items[5], items[6], items[7]
+
+        tsprec, _, tmulti, _, _, _, txyxys, txvals = flag_bits(ftflg)[::-1]
+
+        if txyxys:
+            raise ValueError("subfiles have their own x values, cannot build a cube")
+
+        sub_pos = File.head_siz
+        window = (0, fnpts)
+        if txvals:
+            x = np.memmap(filename, dtype=order + 'f4', mode='r', offset=sub_pos, shape=(fnpts,))
+            if xrange is not None:
+                window = search_window(x, 0, fnpts, xrange, order + 'f')
+            self.x = x[window[0]:window[1]].astype(np.float64)
+            del x
+            sub_pos += 4 * fnpts
+        else:
+            if xrange is not None:
+                window = even_window(ffirst, flast, fnpts, xrange)
+            self.x = np.linspace(ffirst, flast, num=fnpts)[window[0]:window[1]]
+
+        if window[0] == window[1]:
+            raise ValueError("xrange {} is outside the x data of {}".format(xrange, filename))
+
+        # every subfile is a subheader followed by fnpts y values
+        yint = order + ('i2' if tsprec else 'i4')
+        raw = np.memmap(filename, mode='r', offset=sub_pos, shape=(fnsub,),
+                        dtype=np.dtype([('head', subhead_dtype.newbyteorder(order)), ('y', yint, (fnpts,))]))
+        head = raw['head']
+
+        self._alloc(fnsub, len(self.x), dtype)
+        self.subtime = np.array(head['subtime'])
+        self.subindx = np.array(head['subindx'])
+
+        # choose local vs global exponent depending on tmulti
+        exp = head['subexp'].astype(int) if tmulti else np.full(fnsub, fexp)
+        exp[(exp <= -128) | (exp > 128)] = 0
+        bits = 16 if tsprec else 32
+
+        for start, stop in self.chunks():
+            # only the columns of the window are read from disk
+            y_raw = raw['y'][start:stop, window[0]:window[1]]
+            e = exp[start:stop, None]
+
+            scaled = np.ldexp(y_raw.astype(np.float64), e - bits)
+            if not tsprec and (e == 128).any():
+                # floating y-values are stored in the same 4 bytes
+                scaled = np.where(e == 128, y_raw.view(order + 'f4'), scaled)
+            self.y[start:stop] = scaled
+
+        del raw
+
+    # ------------------------------------------------------------------------
+    # Chunked processing
+    # ------------------------------------------------------------------------
+
+    def chunks(self):
+        """ Yield (start, stop) row ranges of at most self.chunk spectra """
+        for start in range(0, self.n_spectra, self.chunk):
+            yield start, min(start + self.chunk, self.n_spectra)
+
+    def despike(self, slope_threshold=50.):
+        """ Remove stray points from every spectrum, see despike() """
+        for start, stop in self.chunks():
+            despike(self.y[start:stop], self.x, slope_threshold)
+
+    def smooth(self, method='savgol', **params):
+        """ Smooth every spectrum, see spc.smooth.smooth """
+        for start, stop in self.chunks():
+            self.y[start:stop] = smooth_stack(self.y[start:stop], method, self.x, **params)
+
+    def baseline(self, method='als', **params):
+        """ Subtract the baseline of every spectrum, see spc.baseline.correct """
+        for start, stop in self.chunks():
+            self.y[start:stop] = correct_baseline(self.y[start:stop], method, **params)
+
+    def normalize(self, max_h=1.0, mode='max', **params):
+        """
+        Normalize every spectrum, by default so its maximum is max_h; see
+        spc.normalize.normalize for the other modes
+
+        Returns
+        -------
+        tuple:
+            (scale, offset) arrays, one value per spectrum
+
+        Raises
+        ------
+        ValueError:
+            naming the index of a spectrum that cannot be normalized
+        """
+        scale = np.empty(self.n_spectra, dtype=self.y.dtype)
+        offset = np.empty(self.n_spectra, dtype=self.y.dtype)
+
+        for start, stop in self.chunks():
+            result = normalize_stack(self.y[start:stop], mode, max_h, self.x,
+                                     names=range(start, stop), **params)
+            self.y[start:stop] = result.y
+            scale[start:stop] = result.scale
+            offset[start:stop] = result.offset
+
+        return scale, offset
+
+    def region_stats(self, labels):
+        """
+        Mean and variance of the spectra in each region of the map
+
+        Arguments
+        ---------
+        labels: (n_spectra,) array
+            region label of each spectrum
+
+        Returns
+        -------
+        dict:
+            label -> Accumulator
+        """
+        labels = np.asarray(labels)
+        stats = {}
+
+        for start, stop in self.chunks():
+            block = self.y[start:stop]
+            lab = labels[start:stop]
+
+            for region in np.unique(lab):
+                acc = stats.get(region)
+                if acc is None:
+                    acc = stats[region] = Accumulator(self.n_points, self.y.dtype)
+                acc.add_stack(block[lab == region])
+
+        return stats
+
+    def flush(self):
+        """ Write pending changes to the backing file """
+        self.y.flush()
+
+    def close(self):
+        """ Release the cube, removing its backing file if temporary """
+        if hasattr(self, 'y'):
+            del self.y
+        if self.temporary and os.path.exists(self.path):
+            os.remove(self.path)
@@ -5,13 +5,27 @@ author: Rohan Isaac
 """
 from __future__ import division, absolute_import, unicode_literals, print_function
 import struct
+import numpy as np
 
 # ------------------------------------------------------------------------
 # Process subfile data
 # ------------------------------------------------------------------------
 
+# subheader layout, same fields as read_subheader
+subhead_dtype = np.dtype([
+    ('subflgs', 'u1'),
+    ('subexp', 'u1'),
+    ('subindx', '<i2'),
+    ('subtime', '<f4'),
+    ('subnext', '<f4'),
+    ('subnois', '<f4'),
+    ('subnpts', '<i4'),
+    ('subscan', '<i4'),
+    ('subwlevel', '<f4'),
+    ('subresv', 'S4')])
 
-def read_subheader(subheader):
+
+def read_subheader(subheader, order='<'):
     """
     Return the subheader as a list
 
@@ -19,6 +33,8 @@ def read_subheader(subheader):
     ----------
     subheader (string):
         32 character string in the subheader format
+    order (string):
+        '<' for little-endian (LSB 1st) files, '>' for big-endian (MSB 1st)
 
     Returns
     -------
@@ -36,7 +52,7 @@ def read_subheader(subheader):
         [9] subresv
     """
 
-    subhead_str = "<cchfffiif4s"
+    subhead_str = order + "cchfffiif4s"
     items = struct.unpack(subhead_str.encode('utf8'), subheader)
 
     item_cpy = [ord(i) for i in items[:2]]
@@ -44,6 +60,44 @@ def read_subheader(subheader):
 
     return item_cpy
 
+
+def read_subheaders(content, positions, order='<'):
+    """
+    Gather the subheaders at several byte positions into one structured
+    array, a record per subheader with the fields of subhead_dtype
+
+    Parameters
+    ----------
+    content (buffer):
+        file contents
+    positions (list of int):
+        byte position of each subheader
+    order (string):
+        '<' for little-endian (LSB 1st) files, '>' for big-endian (MSB 1st),
+        the records keep the byte order of the file
+
+    Returns
+    -------
+    array:
+        (len(positions),) structured array
+
+    Raises
+    ------
+    ValueError:
+        if a subheader does not fit in content
+    """
+    raw = np.frombuffer(content, np.uint8)
+    positions = np.asarray(positions, dtype=np.intp)
+    if len(positions) and (positions.min() < 0 or positions.max() + subhead_dtype.itemsize > len(raw)):
+        raise ValueError("subheader at byte {} is outside the {} bytes of data".format(
+            positions.max() if positions.min() >= 0 else positions.min(), len(raw)))
+
+    idx = np.add.outer(positions, np.arange(subhead_dtype.itemsize))
+
+    heads = np.empty(len(positions), subhead_dtype.newbyteorder(order))
+    heads.view(np.uint8).reshape(-1, subhead_dtype.itemsize)[:] = raw[idx]
+    return heads
+
 # ------------------------------------------------------------------------
 # Decode a character to boolean array
 # ------------------------------------------------------------------------
@@ -0,0 +1,143 @@
+"""
+Resampling of spectra with different x-axes onto one common grid
+"""
+
+from __future__ import division, absolute_import, unicode_literals, print_function
+
+import hashlib
+import numpy as np
+
+# interpolation weights per (source axis, grid), see interp_weights
+_weights = {}
+_weights_max = 64
+
+
+def _digest(a):
+    """ Key identifying the exact values of an array """
+    a = np.ascontiguousarray(a, dtype=np.float64)
+    return hashlib.blake2b(a.tobytes(), digest_size=16).digest()
+
+
+def common_grid(xs, grid='first'):
+    """
+    Build the grid that spectra are resampled onto
+
+    Arguments
+    ---------
+    xs: list of arrays
+        x-axes of the spectra
+    grid: 'first', 'union' or (start, stop, step)
+        'first' uses the first x-axis as is, 'union' spans every x-axis at
+        the finest spacing found among them, and a tuple gives an explicit
+        inclusive range
+
+    Returns
+    -------
+    array:
+        grid x values
+    """
+    if isinstance(grid, str):
+        if grid == 'first':
+            return np.asarray(xs[0], dtype=np.float64)
+
+        if grid == 'union':
+            lo = min(np.min(x) for x in xs)
+            hi = max(np.max(x) for x in xs)
+            step = min(np.median(np.abs(np.diff(x))) for x in xs if len(x) > 1)
+            return np.arange(lo, hi + step / 2., step)
+
+        raise ValueError("unknown grid {!r}".format(grid))
+
+    start, stop, step = grid
+    return np.arange(start, stop + step / 2., step)
+
+
+def interp_weights(x, grid):
+    """
+    Linear interpolation weights from x onto grid, cached so that spectra
+    sharing an x-axis reuse them.
+
+    Returns
+    -------
+    tuple:
+        (lo, hi, w, outside) where a resampled spectrum is
+        y[lo] * (1 - w) + y[hi] * w, and outside marks grid points beyond
+        the range of x
+    """
+    key = (_digest(x), _digest(grid))
+    hit = _weights.get(key)
+    if hit is not None:
+        return hit
+
+    x = np.asarray(x, dtype=np.float64)
+    grid = np.asarray(grid, dtype=np.float64)
+
+    # x-axes may run either way
+    order = np.argsort(x, kind='stable')
+    xs = x[order]
+
+    j = np.clip(np.searchsorted(xs, grid, side='right') - 1, 0, len(xs) - 2)
+    span = xs[j + 1] - xs[j]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        w = np.where(span > 0, (grid - xs[j]) / span, 0.)
+
+    outside = (grid < xs[0]) | (grid > xs[-1])
+    hit = (order[j], order[j + 1], w, outside)
+
+    if len(_weights) >= _weights_max:
+        _weights.clear()
+    _weights[key] = hit
+    return hit
+
+
+def mismatched(xs, grid):
+    """ Number of x-axes that differ from grid """
+    return sum(1 for x in xs if not np.array_equal(x, grid))
+
+
+def resample(xs, ys, grid, fill=np.nan):
+    """
+    Resample spectra onto a common grid. Spectra are grouped by identical
+    x-axis and each group is interpolated in a single vectorized step;
+    spectra already on the grid are copied as is.
+
+    Arguments
+    ---------
+    xs: list of arrays
+        x-axis of each spectrum
+    ys: list of arrays
+        y-data of each spectrum
+    grid: array
+        x values to resample onto
+    fill: float (default=nan)
+        value for grid points outside a spectrum's x range
+
+    Returns
+    -------
+    array:
+        (n_spectra, len(grid)) resampled y-data, float32 if every spectrum
+        is float32, float64 otherwise
+    """
+    grid = np.asarray(grid, dtype=np.float64)
+    dtype = np.result_type(np.float32, *{np.asarray(y).dtype for y in ys}) if ys else np.float64
+    out = np.empty((len(ys), len(grid)), dtype=dtype)
+
+    groups = {}
+    for i, x in enumerate(xs):
+        groups.setdefault(_digest(x), []).append(i)
+
+    for idx in groups.values():
+        x = xs[idx[0]]
+        block = np.array([ys[i] for i in idx], dtype=dtype)
+
+        if np.array_equal(x, grid):
+            out[idx] = block
+            continue
+
+        lo, hi, w, outside = interp_weights(x, grid)
+        w = w.astype(dtype, copy=False)
+        block = block[:, lo] * (1 - w) + block[:, hi] * w
+        block[:, outside] = fill
+        out[idx] = block
+
+    return out
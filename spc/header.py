@@ -0,0 +1,218 @@
+"""
+Main header layouts, and a quick look at an SPC file that reads only its
+header
+
+Kept free of numpy so that peek() starts fast.
+"""
+
+from __future__ import division, absolute_import, unicode_literals, print_function
+
+import struct
+
+# Format strings for various parts of the file
+# calculate size of strings using `struct.calcsize(string)`
+head_str = "<cccciddicccci9s9sh32s130s30siicchf48sfifc187s"
+old_head_str = "<cchfffcchcccc8shh28s130s30s32s"
+logstc_str = "<iiiii44s"
+
+# new format MSB 1st files use the same layouts in big-endian byte order
+head_str_msb = ">" + head_str[1:]
+logstc_str_msb = ">" + logstc_str[1:]
+
+# byte positon of various parts of the file
+head_siz = 512
+old_head_siz = 256
+subhead_siz = 32
+log_siz = 64
+
+# units for x, z and w axes, by fxtype / fztype
+fxtype_op = ["Arbitrary",
+             "Wavenumber (cm-1)",
+             "Micrometers (um)",
+             "Nanometers (nm)",
+             "Seconds ",
+             "Minutes", "Hertz (Hz)",
+             "Kilohertz (KHz)",
+             "Megahertz (MHz) ",
+             "Mass (M/z)",
+             "Parts per million (PPM)",
+             "Days",
+             "Years",
+             "Raman Shift (cm-1)",
+             "eV",
+             "XYZ text labels in fcatxt (old 0x4D version only)",
+             "Diode Number",
+             "Channel",
+             "Degrees",
+             "Temperature (F)",
+             "Temperature (C)",
+             "Temperature (K)",
+             "Data Points",
+             "Milliseconds (mSec)",
+             "Microseconds (uSec) ",
+             "Nanoseconds (nSec)",
+             "Gigahertz (GHz)",
+             "Centimeters (cm)",
+             "Meters (m)",
+             "Millimeters (mm)",
+             "Hours"]
+
+# units for the y axis, by fytype, and by fytype - 128 from 128 on
+fytype_op = ["Arbitrary Intensity",
+             "Interferogram",
+             "Absorbance",
+             "Kubelka-Munk",
+             "Counts",
+             "Volts",
+             "Degrees",
+             "Milliamps",
+             "Millimeters",
+             "Millivolts",
+             "Log(1/R)",
+             "Percent",
+             "Intensity",
+             "Relative Intensity",
+             "Energy",
+             "",
+             "Decibel",
+             "",
+             "",
+             "Temperature (F)",
+             "Temperature (C)",
+             "Temperature (K)",
+             "Index of Refraction [N]",
+             "Extinction Coeff. [K]",
+             "Real",
+             "Imaginary",
+             "Complex"]
+
+fytype_op2 = ["Transmission",
+              "Reflectance",
+              "Arbitrary or Single Beam with Valley Peaks",
+              "Emission"]
+
+# experiment types, by fexper
+fexper_op = ["General SPC",
+             "Gas Chromatogram",
+             "General Chromatogram",
+             "HPLC Chromatogram",
+             "FT-IR, FT-NIR, FT-Raman Spectrum or Igram",
+             "NIR Spectrum",
+             "UV-VIS Spectrum",
+             "X-ray Diffraction Spectrum",
+             "Mass Spectrum ",
+             "NMR Spectrum or FID",
+             "Raman Spectrum",
+             "Fluorescence Spectrum",
+             "Atomic Spectrum",
+             "Chromatography Diode Array Spectra"]
+
+versions = {0x4b: "new LSB 1st", 0x4c: "new MSB 1st", 0x4d: "old format",
+            0xcf: "Shimadzu"}
+
+
+def _text(raw):
+    """ Null terminated header string """
+    return raw.split(b'\x00')[0].decode('latin-1').strip()
+
+
+def axis_labels(fxtype, fytype, fztype, fcatxt=None):
+    """
+    x, y and z axis labels from the axis types of the header
+
+    Arguments
+    ---------
+    fxtype, fytype, fztype: int
+        axis types
+    fcatxt: bytes (default=None)
+        x, y and z labels separated by nulls, for files with the talabs flag
+        set; the ones that are not empty replace the label of their type
+
+    Returns
+    -------
+    tuple:
+        (xlabel, ylabel, zlabel)
+    """
+    xlabel = fxtype_op[fxtype] if fxtype < 30 else "Unknown"
+    zlabel = fxtype_op[fztype] if fztype < 30 else "Unknown"
+
+    if fytype < 27:
+        ylabel = fytype_op[fytype]
+    elif 127 < fytype < 132:
+        ylabel = fytype_op2[fytype - 128]
+    else:
+        ylabel = "Unknown"
+
+    if fcatxt:
+        ll = fcatxt.split(b'\x00')
+        # make sure there are enough items to extract from
+        if len(ll) > 2:
+            xl, yl, zl = ll[:3]
+            xlabel = xl or xlabel
+            ylabel = yl or ylabel
+            zlabel = zl or zlabel
+
+    return xlabel, ylabel, zlabel
+
+
+def exp_type(fexper):
+    """ Name of an experiment type, "Unknown" if not a known fexper """
+    return fexper_op[fexper] if 0 <= fexper < len(fexper_op) else "Unknown"
+
+
+def peek(filename):
+    """
+    Main header fields of an SPC file, without decoding any data
+
+    Arguments
+    ---------
+    filename: str
+        path to the SPC file
+
+    Returns
+    -------
+    dict:
+        version, format, points, first, last, subfiles, axis types,
+        date and comment
+
+    Example
+    -------
+    >>> spc.peek('/path/to/raman.spc')['subfiles']
+    """
+    with open(filename, 'rb') as fin:
+        head = fin.read(head_siz)
+
+    if len(head) < 2:
+        raise ValueError("{} is too short to be an SPC file".format(filename))
+
+    ftflg, fversn = head[0], head[1]
+    out = {"version": versions.get(fversn, "unknown ({})".format(hex(fversn))),
+           "flags": ftflg}
+
+    if fversn in (0x4b, 0x4c) and len(head) == head_siz:
+        items = struct.unpack((head_str if fversn == 0x4b else head_str_msb).encode('utf8'), head)
+        if ftflg & 0x40:
+            fmt = '-xy'
+        elif ftflg & 0x80:
+            fmt = 'x-y'
+        else:
+            fmt = 'gx-y'
+        d = items[12]
+
+        out.update(format=fmt,
+                   points=items[4] if fmt != '-xy' else None,
+                   first=items[5], last=items[6], subfiles=items[7],
+                   y16=bool(ftflg & 0x01),
+                   fexper=ord(items[2]), fxtype=ord(items[8]),
+                   fytype=ord(items[9]), fztype=ord(items[10]),
+                   date="{:04d}-{:02d}-{:02d} {:02d}:{:02d}".format(
+                       d >> 20, (d >> 16) % 16, (d >> 11) % 32, (d >> 6) % 32, d % 64),
+                   comment=_text(items[17]), log=bool(items[19]))
+
+    elif fversn == 0x4d and len(head) >= old_head_siz:
+        items = struct.unpack(old_head_str.encode('utf8'), head[:old_head_siz])
+        out.update(format='gx-y', points=int(items[3]), first=items[4],
+                   last=items[5], fxtype=ord(items[6]), fytype=ord(items[7]),
+                   comment=_text(items[17]))
+
+    return out
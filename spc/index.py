@@ -0,0 +1,413 @@
+"""
+SQLite index of SPC files and analysis results across runs: header
+metadata per file, analysis runs and their parameters, grains with their
+member files and the paths of their result files
+
+Rows are written in bulk, one transaction per call, and files already
+indexed with the same size and modification time are not parsed again.
+"""
+
+from __future__ import division, absolute_import, unicode_literals, print_function
+
+import os
+import json
+import time
+import sqlite3
+
+from . import archive
+
+schema = """
+CREATE TABLE IF NOT EXISTS files (
+    id          INTEGER PRIMARY KEY,
+    path        TEXT UNIQUE NOT NULL,
+    size        INTEGER,
+    modified    TEXT,
+    sample      TEXT,
+    grain       INTEGER,
+    measurement INTEGER,
+    dat_fmt     TEXT,
+    fexper      INTEGER,
+    fnpts       INTEGER,
+    fnsub       INTEGER,
+    ffirst      REAL,
+    flast       REAL,
+    xmin        REAL,
+    xmax        REAL,
+    fxtype      INTEGER,
+    fytype      INTEGER,
+    acquired    TEXT,
+    comment     TEXT,
+    log         TEXT
+);
+CREATE INDEX IF NOT EXISTS files_sample ON files (sample, acquired);
+CREATE INDEX IF NOT EXISTS files_acquired ON files (acquired);
+CREATE INDEX IF NOT EXISTS files_x ON files (xmin, xmax);
+
+CREATE TABLE IF NOT EXISTS runs (
+    id          INTEGER PRIMARY KEY,
+    started     TEXT,
+    folder      TEXT,
+    out_folder  TEXT,
+    params      TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_folder ON runs (folder);
+
+CREATE TABLE IF NOT EXISTS grains (
+    id          INTEGER PRIMARY KEY,
+    run_id      INTEGER NOT NULL REFERENCES runs (id),
+    sample      TEXT,
+    grain       INTEGER,
+    n_files     INTEGER,
+    xmin        REAL,
+    xmax        REAL,
+    acquired    TEXT,
+    data_path   TEXT,
+    plot_path   TEXT
+);
+CREATE INDEX IF NOT EXISTS grains_sample ON grains (sample, acquired);
+CREATE INDEX IF NOT EXISTS grains_acquired ON grains (acquired);
+CREATE INDEX IF NOT EXISTS grains_x ON grains (xmin, xmax);
+CREATE INDEX IF NOT EXISTS grains_run ON grains (run_id, grain);
+
+CREATE TABLE IF NOT EXISTS grain_files (
+    grain_id    INTEGER NOT NULL REFERENCES grains (id),
+    file_id     INTEGER NOT NULL REFERENCES files (id),
+    PRIMARY KEY (grain_id, file_id)
+);
+CREATE INDEX IF NOT EXISTS grain_files_file ON grain_files (file_id);
+"""
+
+file_columns = ('path', 'size', 'modified', 'sample', 'grain', 'measurement',
+                'dat_fmt', 'fexper', 'fnpts', 'fnsub', 'ffirst', 'flast',
+                'xmin', 'xmax', 'fxtype', 'fytype', 'acquired', 'comment', 'log')
+
+
+def _iso(t):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(t))
+
+
+def split_name(path):
+    """
+    Sample, grain and measurement of a SomeSample_Grain_Measurement.spc
+    file name; grain and measurement are None if the name does not follow
+    that pattern
+
+    Returns
+    -------
+    tuple:
+        (sample, grain, measurement)
+    """
+    parts = os.path.splitext(os.path.basename(path))[0].split('_')
+    try:
+        return '_'.join(parts[:-2]), int(parts[-2]), int(parts[-1])
+    except (ValueError, IndexError):
+        return os.path.splitext(os.path.basename(path))[0], None, None
+
+
+def _text(value):
+    if isinstance(value, bytes):
+        return value.decode('latin-1')
+    return value if isinstance(value, str) else str(value)
+
+
+def file_fields(f):
+    """
+    Index columns taken from a loaded File: every one of file_columns but
+    path, size, modified, sample, grain and measurement. A plain dict, so
+    worker processes can return it along with their spectra.
+
+    Arguments
+    ---------
+    f: File
+        read without an xrange, so that xmin and xmax span all its x values
+
+    Returns
+    -------
+    dict:
+        column -> value
+    """
+    # acquisition date, new format files only
+    acquired = None
+    if getattr(f, 'year', 0) and getattr(f, 'month', 0):
+        acquired = "{:04d}-{:02d}-{:02d} {:02d}:{:02d}:00".format(
+            f.year, f.month, max(f.day, 1), f.hour, f.minute)
+
+    xs = [s.x for s in getattr(f, 'sub', [])] if getattr(f, 'dat_fmt', '').endswith('-xy') \
+        else [getattr(f, 'x', [])]
+    # x values are monotonic, so the ends bound them
+    xs = [x for x in xs if len(x)]
+    xmin = float(min(min(x[0], x[-1]) for x in xs)) if xs else None
+    xmax = float(max(max(x[0], x[-1]) for x in xs)) if xs else None
+
+    log = getattr(f, 'log_dict', None)
+
+    return {
+        'dat_fmt': getattr(f, 'dat_fmt', None),
+        'fexper': getattr(f, 'fexper', None),
+        'fnpts': getattr(f, 'fnpts', getattr(f, 'onpts', None)),
+        'fnsub': getattr(f, 'fnsub', None),
+        'ffirst': getattr(f, 'ffirst', getattr(f, 'ofirst', None)),
+        'flast': getattr(f, 'flast', getattr(f, 'olast', None)),
+        'xmin': xmin,
+        'xmax': xmax,
+        'fxtype': getattr(f, 'fxtype', None),
+        'fytype': getattr(f, 'fytype', None),
+        'acquired': acquired,
+        'comment': getattr(f, 'cmnt', None) or _text(getattr(f, 'ocmnt', b'')) or None,
+        'log': json.dumps({_text(k): _text(v) for k, v in log.items()}) if log else None,
+    }
+
+
+def file_record(path, f=None):
+    """
+    Index row of one SPC file from its spc.File fields
+
+    Arguments
+    ---------
+    path: str
+        path to the SPC file, which may be inside an archive (see
+        spc.archive)
+    f: File or dict (default=None)
+        already loaded file, or its file_fields(); parsed from path if not
+        given
+
+    Returns
+    -------
+    dict:
+        column -> value, see file_columns
+    """
+    if f is None:
+        from .spc import File
+        f = File(archive.source(path), verbose=False)
+
+    st = archive.stat(path)
+    sample, grain, measurement = split_name(path)
+
+    record = {
+        'path': os.path.abspath(path),
+        'size': st.st_size,
+        'modified': _iso(st.st_mtime),
+        'sample': sample,
+        'grain': grain,
+        'measurement': measurement,
+    }
+    record.update(f if isinstance(f, dict) else file_fields(f))
+    return record
+
+
+class Index:
+    """
+    SQLite index of SPC files and analysis results
+
+    Examples
+    --------
+    >>> db = spc.Index('/path/to/raman.sqlite')
+    >>> db.add_files(['/path/to/Sample_1_1.spc', '/path/to/Sample_1_2.spc'])
+    >>> db.grains(sample='Sample', x=(500, 600), since='2024-05-01')
+    """
+
+    def __init__(self, path):
+        """
+        Arguments
+        ---------
+        path: str
+            database file, created if missing
+        """
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        with self.conn:
+            self.conn.executescript(schema)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ------------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------------
+
+    def add_files(self, paths, files=None):
+        """
+        Index SPC files. Files already indexed with the same size and
+        modification time are skipped without being parsed, files that are
+        missing or fail to parse are left out.
+
+        Arguments
+        ---------
+        paths: list of str
+        files: dict (default=None)
+            path -> already loaded File or its file_fields(), to avoid
+            parsing again
+
+        Returns
+        -------
+        dict:
+            absolute path -> file id, for every path indexed
+        """
+        paths = [os.path.abspath(p) for p in paths]
+        files = {os.path.abspath(k): v for k, v in (files or {}).items()}
+        known = self._file_rows(paths)
+
+        rows = []
+        for p in paths:
+            try:
+                st = archive.stat(p)
+                row = known.get(p)
+                if row is not None and row['size'] == st.st_size and row['modified'] == _iso(st.st_mtime):
+                    continue
+                rows.append(file_record(p, files.get(p)))
+            except Exception as e:
+                print("{} not indexed: {}".format(p, e))
+
+        if rows:
+            cols = ', '.join(file_columns)
+            marks = ', '.join(':' + c for c in file_columns)
+            update = ', '.join('{0} = excluded.{0}'.format(c) for c in file_columns[1:])
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT INTO files ({}) VALUES ({}) ON CONFLICT (path) DO UPDATE SET {}".format(cols, marks, update),
+                    rows)
+
+        return {p: r['id'] for p, r in self._file_rows(paths).items()}
+
+    def _file_rows(self, paths):
+        """ path -> (id, size, modified) of indexed paths """
+        out = {}
+        # stay under SQLite's limit on query parameters
+        for k in range(0, len(paths), 500):
+            part = paths[k:k + 500]
+            cur = self.conn.execute(
+                "SELECT id, path, size, modified FROM files WHERE path IN ({})".format(', '.join('?' * len(part))),
+                part)
+            out.update((r['path'], r) for r in cur)
+        return out
+
+    def add_run(self, folder, out_folder, params, grains, files=None):
+        """
+        Record an analysis run and its grains
+
+        Arguments
+        ---------
+        folder, out_folder: str
+            input and output folders
+        params: dict
+            analysis parameters, stored as JSON
+        grains: list of dict
+            one per grain with keys grain, files (paths of its
+            measurements), xmin, xmax, data_path, plot_path (None if not
+            written)
+        files: dict (default=None)
+            path -> File or file_fields() of files already loaded, see
+            add_files
+
+        Returns
+        -------
+        int:
+            run id
+        """
+        ids = self.add_files([p for g in grains for p in g['files']], files)
+
+        with self.conn:
+            cur = self.conn.execute(
+                "INSERT INTO runs (started, folder, out_folder, params) VALUES (?, ?, ?, ?)",
+                (_iso(time.time()), os.path.abspath(folder), os.path.abspath(out_folder),
+                 json.dumps(params, default=str)))
+            run_id = cur.lastrowid
+
+            links = []
+            for g in grains:
+                members = [ids[os.path.abspath(p)] for p in g['files'] if os.path.abspath(p) in ids]
+                first = self.conn.execute(
+                    "SELECT sample, MIN(acquired) AS acquired FROM files WHERE id IN ({})".format(
+                        ', '.join('?' * len(members[:500]))), members[:500]).fetchone() if members else None
+
+                cur = self.conn.execute(
+                    "INSERT INTO grains (run_id, sample, grain, n_files, xmin, xmax, acquired, data_path, plot_path) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (run_id, first['sample'] if first else None, g['grain'], len(g['files']),
+                     g.get('xmin'), g.get('xmax'), first['acquired'] if first else None,
+                     g.get('data_path'), g.get('plot_path')))
+                links.extend((cur.lastrowid, i) for i in members)
+
+            self.conn.executemany("INSERT OR IGNORE INTO grain_files (grain_id, file_id) VALUES (?, ?)", links)
+
+        return run_id
+
+    # ------------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------------
+
+    @staticmethod
+    def _where(sample=None, x=None, since=None, until=None, date='acquired'):
+        """ WHERE clause and parameters shared by the queries """
+        terms, args = [], []
+        if sample is not None:
+            terms.append("sample GLOB ?" if any(c in sample for c in '*?[') else "sample = ?")
+            args.append(sample)
+        if x is not None:
+            # overlapping ranges
+            lo, hi = sorted(x)
+            terms.append("xmin <= ? AND xmax >= ?")
+            args.extend((hi, lo))
+        if since is not None:
+            terms.append("{} >= ?".format(date))
+            args.append(since)
+        if until is not None:
+            terms.append("{} < ?".format(date))
+            args.append(until)
+        return (" WHERE " + " AND ".join(terms)) if terms else "", args
+
+    def grains(self, sample=None, x=None, since=None, until=None, run=None):
+        """
+        Grains matching every given condition, newest run first
+
+        Arguments
+        ---------
+        sample: str (default=None)
+            sample name, or a glob pattern such as 'Quartz*'
+        x: (float, float) (default=None)
+            x-range (e.g. cm-1) the grain's data must overlap
+        since, until: str (default=None)
+            acquisition date bounds, 'YYYY-MM-DD[ HH:MM:SS]', until excluded
+        run: int (default=None)
+            only grains of this run
+
+        Returns
+        -------
+        list of dict
+        """
+        where, args = self._where(sample, x, since, until)
+        if run is not None:
+            where += (" AND " if where else " WHERE ") + "run_id = ?"
+            args.append(run)
+        cur = self.conn.execute(
+            "SELECT * FROM grains{} ORDER BY run_id DESC, grain".format(where), args)
+        return [dict(r) for r in cur]
+
+    def files(self, sample=None, x=None, since=None, until=None, grain_id=None):
+        """
+        Indexed files matching every given condition, see grains() for
+        arguments; grain_id gives the members of one analyzed grain
+
+        Returns
+        -------
+        list of dict
+        """
+        where, args = self._where(sample, x, since, until)
+        if grain_id is not None:
+            where += (" AND " if where else " WHERE ") + \
+                "id IN (SELECT file_id FROM grain_files WHERE grain_id = ?)"
+            args.append(grain_id)
+        cur = self.conn.execute("SELECT * FROM files{} ORDER BY path".format(where), args)
+        return [dict(r) for r in cur]
+
+    def runs(self):
+        """ Every run, newest first """
+        return [dict(r) for r in self.conn.execute("SELECT * FROM runs ORDER BY id DESC")]
@@ -0,0 +1,171 @@
+"""
+Optional instrumentation of SPC parsing: wall time of each parse phase and
+byte, subfile and point counters, aggregated over a run in a module-level
+registry
+
+Off by default. File only pays for a few no-op calls per file unless
+timings are asked for or instrumentation is enabled.
+"""
+
+from __future__ import division, absolute_import, unicode_literals, print_function
+
+import json
+import time
+import threading
+import contextlib
+
+# aggregate every File parsed in this process into the registry
+enabled = False
+
+# parse phases in the order File goes through them
+PHASES = ('read', 'header', 'x', 'subfiles')
+
+
+class Probe:
+    """
+    Timings and counters of one File. Each mark() charges the time since
+    the previous mark (or creation) to a phase.
+
+    Data
+    ----
+    phases: phase -> seconds
+    counters: name -> count
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self.counters = {}
+        self._t = time.perf_counter()
+
+    def mark(self, phase):
+        """ End a phase """
+        t = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.) + t - self._t
+        self._t = t
+
+    def count(self, name, n=1):
+        """ Add n to a counter """
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def as_dict(self):
+        return {"phases": dict(self.phases), "counters": dict(self.counters)}
+
+
+class _NullProbe:
+    """ Stand-in for Probe when nothing is recorded """
+
+    def mark(self, phase):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+
+null_probe = _NullProbe()
+
+
+def probe(force=False):
+    """ A recording Probe if instrumentation is on (or forced), else the null probe """
+    return Probe() if (enabled or force) else null_probe
+
+
+class Registry:
+    """
+    Totals of the phases and counters of every instrumented File, safe to
+    update from several threads. Snapshots from worker processes can be
+    merged in.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.files = 0
+            self.phases = {}
+            self.counters = {}
+
+    def add(self, p):
+        """ Add the record of one File """
+        self.merge({"files": 1, "phases": p.phases, "counters": p.counters})
+
+    def merge(self, snap):
+        """ Add a snapshot, e.g. returned by a worker process """
+        with self._lock:
+            self.files += snap["files"]
+            for k, v in snap["phases"].items():
+                self.phases[k] = self.phases.get(k, 0.) + v
+            for k, v in snap["counters"].items():
+                self.counters[k] = self.counters.get(k, 0) + v
+
+    def snapshot(self):
+        """ Totals so far as a plain dict """
+        with self._lock:
+            return {"files": self.files,
+                    "phases": dict(self.phases),
+                    "counters": dict(self.counters)}
+
+    def report(self):
+        """
+        Snapshot with the share of parse time in each phase and per file
+        means
+
+        Returns
+        -------
+        dict
+        """
+        snap = self.snapshot()
+        total = sum(snap["phases"].values())
+        n = snap["files"] or 1
+
+        ordered = [p for p in PHASES if p in snap["phases"]] + \
+            sorted(p for p in snap["phases"] if p not in PHASES)
+        snap["seconds"] = total
+        snap["phases"] = {p: {"seconds": snap["phases"][p],
+                              "share": snap["phases"][p] / total if total else 0.,
+                              "per_file": snap["phases"][p] / n}
+                          for p in ordered}
+        if total:
+            snap["mb_per_s"] = snap["counters"].get("bytes", 0) / 1e6 / total
+        return snap
+
+    def dump(self, path):
+        """ Write report() as JSON """
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=1)
+
+
+registry = Registry()
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+@contextlib.contextmanager
+def recording(reset=True):
+    """
+    Instrument every File parsed inside the block
+
+    Example
+    -------
+    >>> with spc.instrument.recording() as reg:
+    ...     spc.File('/path/to/raman.spc')
+    >>> reg.report()['phases']['subfiles']
+    """
+    was = enabled
+    if reset:
+        registry.reset()
+    enable()
+    try:
+        yield registry
+    finally:
+        if not was:
+            disable()
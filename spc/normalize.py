@@ -0,0 +1,191 @@
+"""
+Normalization of stacks of spectra
+
+Every mode takes one reduction over a whole (n_spectra, n_points) stack and
+one multiply, and returns the per spectrum factors along with the result,
+so what was done to each spectrum can be recorded:
+
+    max     scale the highest point to `to`
+    area    scale the area under the spectrum (trapezoid rule over x) to `to`
+    band    scale the highest point inside the reference band (lo, hi) of x
+            to `to`
+    l2      scale the vector (L2) norm to `to`
+    snv     standard normal variate: subtract the mean and scale the
+            standard deviation to `to`
+
+Normalizing is kept apart from averaging: each spectrum is normalized on
+its own, and the statistics of a set are taken afterwards (see
+stats.Accumulator).
+"""
+
+from __future__ import division, absolute_import, unicode_literals, print_function
+
+import collections
+import numpy as np
+
+# result of normalize(): y = (ys - offset) * scale, row by row
+normalized = collections.namedtuple('normalized', 'y scale offset')
+
+modes = ('max', 'area', 'band', 'l2', 'snv')
+
+# what each mode scales, for errors
+statistics = {'max': 'maximum', 'area': 'area', 'band': 'maximum in the band',
+              'l2': 'L2 norm', 'snv': 'standard deviation'}
+
+
+def trapezoid_weights(x, n=None):
+    """
+    Weights w such that ys @ w is the trapezoid rule area of each spectrum
+
+    Arguments
+    ---------
+    x: array or None
+        x values, unit spacing if None
+    n: int
+        number of points, if x is None
+    """
+    if x is None:
+        w = np.ones(n)
+        w[[0, -1]] = 0.5
+        return w
+
+    dx = np.diff(np.asarray(x, dtype=np.float64))
+    w = np.zeros(len(dx) + 1)
+    w[:-1] += dx / 2
+    w[1:] += dx / 2
+    return w
+
+
+def band_columns(x, band):
+    """
+    Columns of the points with x inside band
+
+    Raises
+    ------
+    ValueError:
+        if band holds none of the points
+    """
+    lo, hi = sorted(band)
+    x = np.asarray(x)
+    cols = np.flatnonzero((x >= lo) & (x <= hi))
+    if not len(cols):
+        raise ValueError("reference band {}:{} holds none of the x values ({} to {})".format(
+            lo, hi, x.min(), x.max()))
+    return cols
+
+
+def normalize(ys, mode='max', to=1.0, x=None, band=None, names=None):
+    """
+    Normalize every spectrum of a stack
+
+    Arguments
+    ---------
+    ys: (n_spectra, n_points) or (n_points,) array
+    mode: str (default='max')
+        'max', 'area', 'band', 'l2' or 'snv', see the module docstring
+    to: float (default=1.0)
+        value the statistic of the mode is scaled to
+    x: (n_points,) array (default=None)
+        x values, needed for 'band'; 'area' assumes unit spacing without
+    band: (float, float) (default=None)
+        reference band for 'band'
+    names: sequence (default=None)
+        name of each spectrum, such as its file, for errors; row numbers
+        without
+
+    Returns
+    -------
+    normalized:
+        (y, scale, offset): the new spectra, in the float dtype of ys, and
+        the factor and offset of each, y = (ys - offset) * scale
+
+    Raises
+    ------
+    ValueError:
+        if the statistic of a spectrum is not positive and finite, e.g. the
+        maximum of a flat spectrum or the area of one that is negative after
+        its baseline was removed, since its scale would be infinite, NaN or
+        flip its sign
+
+    Example
+    -------
+    >>> y, scale, offset = spc.normalize.normalize(stack, 'band', x=x, band=(500, 530))
+    """
+    ys = np.asarray(ys)
+    if not np.issubdtype(ys.dtype, np.floating):
+        ys = ys.astype(np.float64)
+    single = ys.ndim == 1
+    ys = np.atleast_2d(ys)
+
+    offset = np.zeros(len(ys), dtype=ys.dtype)
+
+    if mode == 'max':
+        stat = ys.max(axis=1)
+
+    elif mode == 'area':
+        stat = ys @ trapezoid_weights(x, ys.shape[1])
+
+    elif mode == 'band':
+        if x is None or band is None:
+            raise ValueError("band normalization needs x and a band")
+        stat = ys[:, band_columns(x, band)].max(axis=1)
+
+    elif mode == 'l2':
+        stat = np.sqrt(np.einsum('ij,ij->i', ys, ys, dtype=np.float64))
+
+    elif mode == 'snv':
+        offset = ys.mean(axis=1, dtype=np.float64).astype(ys.dtype)
+        stat = ys.std(axis=1, ddof=1, dtype=np.float64)
+
+    else:
+        raise ValueError("unknown normalization {!r}, choose from {}".format(mode, ', '.join(modes)))
+
+    bad = np.flatnonzero(~(np.isfinite(stat) & (stat > 0)))
+    if len(bad):
+        i = bad[0]
+        raise ValueError("cannot normalize spectrum {}: its {} is {}{}".format(
+            i if names is None else names[i], statistics[mode], float(stat[i]),
+            " ({} more spectra cannot either)".format(len(bad) - 1) if len(bad) > 1 else ""))
+
+    scale = (to / stat).astype(ys.dtype, copy=False)
+
+    if mode == 'snv':
+        y = (ys - offset[:, None]) * scale[:, None]
+    else:
+        y = ys * scale[:, None]
+
+    if single:
+        return normalized(y[0], scale[0], offset[0])
+    return normalized(y, scale, offset)
+
+
+def parse(spec):
+    """
+    Mode and parameters from a spec: 'max', 'area', 'l2', 'snv' or
+    'band:LO:HI'
+
+    Returns
+    -------
+    tuple:
+        (mode, dict of parameters for normalize())
+
+    Raises
+    ------
+    ValueError:
+        for an unknown mode or a bad band
+    """
+    mode, _, rest = spec.partition(':')
+    mode = mode.strip().lower()
+    if mode not in modes:
+        raise ValueError("unknown normalization {!r}, choose from {}".format(mode, ', '.join(modes)))
+
+    if mode != 'band':
+        if rest:
+            raise ValueError("{} takes no parameters".format(mode))
+        return mode, {}
+
+    try:
+        lo, hi = [float(v) for v in rest.split(':')]
+    except ValueError:
+        raise ValueError("band normalization needs a band, band:LO:HI")
+    return mode, {'band': (lo, hi)}
@@ -0,0 +1,503 @@
+"""
+Peak detection and fitting over stacks of spectra, typically the averaged
+(n_grains, n_points) matrix of a run
+
+    find    local maxima of every spectrum with their prominence and full
+            width at half prominence, kept if both pass a threshold
+    fit     least squares fits of the peaks inside x windows, a Lorentzian
+            or pseudo-Voigt per peak over a flat offset, weighted by the
+            per point SEM
+
+Both work on all spectra at once. find() walks outward from every
+candidate of every spectrum together, one point per step. fit() runs
+Levenberg-Marquardt in lockstep over all spectra with the same number of
+peaks in a window, one batched linear solve per iteration.
+
+Results are tables: namedtuples of equal length columns, one row per peak.
+"""
+
+from __future__ import division, absolute_import, unicode_literals, print_function
+
+import collections
+import numpy as np
+
+from .normalize import band_columns
+
+# found peaks, one row per peak in order of grain (row of ys) then index
+candidates = collections.namedtuple('candidates', 'grain index position height prominence width')
+
+# fitted peaks, one row per peak in order of window, grain, then position;
+# the *_err columns are standard errors from the fit covariance
+fits = collections.namedtuple('fits', 'grain window peak position position_err height height_err fwhm fwhm_err '
+                                      'eta eta_err area area_err offset chi2 converged')
+
+shapes = ('lorentzian', 'voigt')
+
+_ln2 = np.log(2.)
+
+
+def _stack(ys):
+    """ ys as a 2-D float64 array """
+    return np.atleast_2d(np.asarray(ys, dtype=np.float64))
+
+
+# ------------------------------------------------------------------------
+# Detection
+# ------------------------------------------------------------------------
+
+def _bases(ys, g, i, h, limit, prominence):
+    """
+    Lowest point on each side of each candidate before a higher one (or the
+    end of the spectrum, or limit points)
+
+    Both sides are walked together, over blocks of points that double in
+    length each pass. A candidate is dropped as soon as one side it has
+    finished walking leaves it less prominent than prominence, so noise on
+    the flank of a peak stops early instead of walking to the end.
+
+    Returns
+    -------
+    tuple:
+        (left lowest value, its index, right lowest value, its index, kept)
+        per candidate; only the kept ones have both sides walked in full
+    """
+    n = ys.shape[1]
+    flat = ys.ravel()
+    row_start = g * n
+    base = [h.copy(), h.copy()]
+    where = [i.copy(), i.copy()]
+    active = [np.arange(len(i)), np.arange(len(i))]
+    kept = np.ones(len(i), dtype=bool)
+
+    done, block = 0, 4
+    while (len(active[0]) or len(active[1])) and done < limit:
+        b = min(block, limit - done)
+        offsets = (done + 1 + np.arange(b))[:, None]
+        finished = []
+
+        for side, step in enumerate((-1, 1)):
+            # (block, candidates), so reductions run along the long axis
+            act = active[side][kept[active[side]]]
+            j = i[act] + step * offsets
+            outside = (j < 0) | (j >= n)
+            v = flat.take(row_start[act] + np.clip(j, 0, n - 1))
+
+            # points up to the first higher one, or the end of the spectrum
+            stop = outside | (v > h[act])
+            first = np.where(stop.any(axis=0), stop.argmax(axis=0), b)
+            v[np.arange(b)[:, None] >= first] = np.inf
+
+            cols = np.arange(len(act))
+            at = v.argmin(axis=0)
+            low = v[at, cols]
+            lower = low < base[side][act]
+            base[side][act[lower]] = low[lower]
+            where[side][act[lower]] = j[at, cols][lower]
+
+            active[side] = act[first == b]
+            finished.append(act[first < b])
+
+        for side, act in enumerate(finished):
+            kept[act[h[act] - base[side][act] < prominence]] = False
+
+        done += b
+        block *= 2
+
+    return base[0], where[0], base[1], where[1], kept
+
+
+def _crossing(ys, g, i, level, step, stop):
+    """
+    Fractional index where each spectrum first drops to level on one side
+    of its candidate, going no further than stop
+    """
+    cross = stop.astype(np.float64)
+    active = np.arange(len(i))
+
+    k = 1
+    while len(active):
+        j = i[active] + step * k
+        keep = (j - stop[active]) * step <= 0
+        active, j = active[keep], j[keep]
+
+        v = ys[g[active], j]
+        below = v <= level[active]
+
+        # interpolate between j and the point before it
+        a, jb = active[below], j[below]
+        prev = ys[g[a], jb - step]
+        frac = (prev - level[a]) / np.where(prev != v[below], prev - v[below], 1.)
+        cross[a] = jb - step + step * frac
+
+        active = active[~below]
+        k += 1
+
+    return cross
+
+
+def find(ys, x=None, prominence=0.05, width=None, wlen=None):
+    """
+    Peaks of every spectrum of a stack
+
+    A candidate is a point higher than the one before it and at least as high
+    as the one after. Its prominence is its height over the higher of the
+    lowest points on each side before a higher point, and its width is the
+    full width at half that prominence.
+
+    Arguments
+    ---------
+    ys: (n_spectra, n_points) or (n_points,) array
+    x: (n_points,) array (default=None)
+        x values, positions and widths are in points if None
+    prominence: float (default=0.05)
+        least prominence kept, in units of ys
+    width: float (default=None)
+        least width kept, in units of x
+    wlen: int (default=None)
+        most points looked at on each side for the prominence, all if None
+
+    Returns
+    -------
+    candidates:
+        (grain, index, position, height, prominence, width) arrays
+
+    Example
+    -------
+    >>> found = spc.peaks.find(means, x, prominence=0.1)
+    >>> found.position[found.grain == 0]
+    """
+    ys = _stack(ys)
+    n = ys.shape[1]
+    limit = n if wlen is None else int(wlen)
+
+    mid = ys[:, 1:-1]
+    g, i = np.nonzero((mid > ys[:, :-2]) & (mid >= ys[:, 2:]))
+    i = i + 1
+    h = ys[g, i]
+
+    left, left_at, right, right_at, kept = _bases(ys, g, i, h, limit, prominence)
+    prom = h - np.maximum(left, right)
+
+    keep = kept & (prom >= prominence)
+    g, i, h, prom, left_at, right_at = g[keep], i[keep], h[keep], prom[keep], left_at[keep], right_at[keep]
+
+    level = h - prom / 2
+    lo = _crossing(ys, g, i, level, -1, left_at)
+    hi = _crossing(ys, g, i, level, 1, right_at)
+
+    points = np.arange(n)
+    if x is None:
+        position, wid = i.astype(np.float64), hi - lo
+    else:
+        x = np.asarray(x, dtype=np.float64)
+        position = x[i]
+        wid = np.abs(np.interp(hi, points, x) - np.interp(lo, points, x))
+
+    if width is not None:
+        keep = wid >= width
+        g, i, position, h, prom, wid = g[keep], i[keep], position[keep], h[keep], prom[keep], wid[keep]
+
+    return candidates(g, i, position, h, prom, wid)
+
+
+# ------------------------------------------------------------------------
+# Fitting
+# ------------------------------------------------------------------------
+
+def _model(x, p, k, voigt):
+    """
+    Values and Jacobian of the peaks plus offset for a batch of parameter
+    sets
+
+    Arguments
+    ---------
+    x: (n,) array
+    p: (m, n_params) array
+        per peak (height, position, fwhm[, eta]), then the offset
+    k: int
+        peaks per set
+
+    Returns
+    -------
+    tuple:
+        ((m, n) values, (m, n, n_params) Jacobian)
+    """
+    per = 4 if voigt else 3
+    m = p.shape[0]
+    f = np.repeat(p[:, -1:], len(x), axis=1)
+    jac = np.zeros((m, len(x), p.shape[1]))
+    jac[:, :, -1] = 1.
+
+    for q in range(k):
+        a, x0, w = p[:, per * q, None], p[:, per * q + 1, None], p[:, per * q + 2, None]
+        u = 2 * (x - x0) / w
+        lor = 1 / (1 + u * u)
+        d_lor = 2 * u * lor * lor / w           # dL/dx0 / 2, and dL/dw / u
+
+        if voigt:
+            eta = p[:, per * q + 3, None]
+            gau = np.exp(-_ln2 * u * u)
+            d_gau = 2 * _ln2 * u * gau / w
+            shape = eta * lor + (1 - eta) * gau
+            d_shape = eta * d_lor + (1 - eta) * d_gau
+            jac[:, :, per * q + 3] = a * (lor - gau)
+        else:
+            shape, d_shape = lor, d_lor
+
+        f += a * shape
+        jac[:, :, per * q] = shape
+        jac[:, :, per * q + 1] = 2 * a * d_shape
+        jac[:, :, per * q + 2] = a * u * d_shape
+
+    return f, jac
+
+
+def _levenberg_marquardt(x, y, wt, p, k, voigt, bounds, niter=100, tol=1e-8):
+    """
+    Weighted least squares of the model for a batch, each set damped on its
+    own and stopped once its chi squared changes by less than tol (relative)
+
+    Returns
+    -------
+    tuple:
+        (parameters, chi squared, J'WJ at the solution, converged flags)
+    """
+    m, n_par = p.shape
+    lam = np.full(m, 1e-3)
+    lo, hi = bounds
+
+    f, jac = _model(x, p, k, voigt)
+    chi2 = np.einsum('mn,mn->m', wt, (y - f) ** 2)
+    done = np.zeros(m, dtype=bool)
+    eye = np.eye(n_par)
+
+    for _ in range(niter):
+        if done.all():
+            break
+
+        r = y - f
+        jtw = jac.transpose(0, 2, 1) * wt[:, None, :]
+        jtj = jtw @ jac
+        grad = np.einsum('mpn,mn->mp', jtw, r)
+
+        diag = np.einsum('mpp->mp', jtj)
+        damped = jtj + (lam[:, None] * diag + 1e-12 * (diag.max(axis=1, keepdims=True) + 1.))[:, :, None] * eye
+        step = np.linalg.solve(damped, grad[:, :, None])[:, :, 0]
+
+        trial = np.clip(p + step, lo, hi)
+        f_t, jac_t = _model(x, trial, k, voigt)
+        chi2_t = np.einsum('mn,mn->m', wt, (y - f_t) ** 2)
+
+        better = (chi2_t <= chi2) & ~done
+        small = better & (chi2 - chi2_t <= tol * np.maximum(chi2, 1e-300))
+
+        p[better], f[better], jac[better] = trial[better], f_t[better], jac_t[better]
+        chi2[better] = chi2_t[better]
+        lam = np.where(better, lam / 10, np.minimum(lam * 10, 1e10))
+        done |= small | (lam >= 1e10)
+
+    jtj = (jac.transpose(0, 2, 1) * wt[:, None, :]) @ jac
+    return p, chi2, jtj, done & (lam < 1e10)
+
+
+def _weights(sem):
+    """
+    1 / sem**2 per point, and whether each spectrum had a usable SEM
+
+    SEMs are floored at a tenth of the median SEM of their spectrum, as a
+    point every measurement was scaled to (the maximum under 'max'
+    normalization) has next to none and would pin the fit. Rows with no
+    positive finite SEM get unit weights.
+    """
+    usable = np.isfinite(sem) & (sem > 0)
+    weighted = usable.any(axis=1)
+    wt = np.ones_like(sem)
+
+    if weighted.any():
+        s = sem[weighted]
+        floor = 0.1 * np.nanmedian(np.where(usable[weighted], s, np.nan), axis=1)[:, None]
+        s = np.where(usable[weighted], np.maximum(s, floor), floor)
+        wt[weighted] = 1. / s ** 2
+
+    return wt, weighted
+
+
+def fit(x, ys, windows, sem=None, found=None, shape='lorentzian', max_peaks=None, niter=100):
+    """
+    Fit the peaks inside each x window of every spectrum
+
+    Each window of each spectrum is fitted with a flat offset plus one
+    peak per candidate of found inside it (its most prominent max_peaks),
+    or a single peak at its highest point if none is. Spectra with the same
+    number of peaks in a window are fitted as one batch.
+
+    Arguments
+    ---------
+    x: (n_points,) array
+    ys: (n_spectra, n_points) or (n_points,) array
+    windows: list of (float, float)
+        x ranges to fit, each on its own
+    sem: array like ys (default=None)
+        standard error of every point; fits are weighted by 1 / sem**2 and
+        their errors taken from the covariance as is. Without a usable
+        SEM a spectrum is fitted unweighted and the covariance is scaled by
+        the reduced chi squared. See _weights for SEMs near zero.
+    found: candidates (default=None)
+        start peaks, from find(ys, x) if None
+    shape: str (default='lorentzian')
+        'lorentzian', or 'voigt' for a pseudo-Voigt (a Lorentzian and a
+        Gaussian of the same fwhm mixed by eta, 1 is all Lorentzian)
+    max_peaks: int (default=None)
+        most peaks per window, all candidates that leave the fit more
+        points than parameters if None
+    niter: int (default=100)
+        most iterations
+
+    Returns
+    -------
+    fits:
+        one row per peak; window is the index into windows, chi2 the
+        reduced chi squared of the window fit
+
+    Raises
+    ------
+    ValueError:
+        for an unknown shape or a window too narrow to fit a single peak
+
+    Example
+    -------
+    >>> table = spc.peaks.fit(x, means, [(450, 480), (500, 530)], sem=sems, shape='voigt')
+    """
+    if shape not in shapes:
+        raise ValueError("unknown peak shape {!r}, choose from {}".format(shape, ', '.join(shapes)))
+    voigt = shape == 'voigt'
+    per = 4 if voigt else 3
+
+    x = np.asarray(x, dtype=np.float64)
+    ys = _stack(ys)
+    sem = np.full_like(ys, np.nan) if sem is None else _stack(sem)
+    if found is None:
+        found = find(ys, x)
+
+    columns = collections.OrderedDict((name, []) for name in fits._fields)
+
+    for w, (lo, hi) in enumerate(windows):
+        cols = band_columns(x, (lo, hi))
+        xw, yw = x[cols], ys[:, cols]
+        wt, weighted = _weights(sem[:, cols])
+        lo, hi = xw.min(), xw.max()
+        span = max(hi - lo, np.finfo(float).tiny)
+
+        # start peaks of each spectrum, most prominent first
+        inside = (found.position >= lo) & (found.position <= hi)
+        order = np.lexsort((-found.prominence[inside], found.grain[inside]))
+        g_in = found.grain[inside][order]
+        starts = [[] for _ in range(len(ys))]
+        for row, pos, height, wid in zip(g_in, found.position[inside][order], found.height[inside][order],
+                                         found.width[inside][order]):
+            if max_peaks is None or len(starts[row]) < max_peaks:
+                starts[row].append((pos, height, wid))
+
+        # as many peaks as the points of the window can take
+        most = (len(xw) - 2) // per
+        if most < 1:
+            raise ValueError("window {}:{} holds {} points, too few to fit a peak".format(lo, hi, len(xw)))
+
+        base = yw.min(axis=1)
+        for row in range(len(ys)):
+            del starts[row][most:]
+            if not starts[row]:
+                top = yw[row].argmax()
+                starts[row].append((xw[top], yw[row, top], span / 10))
+
+        by_k = collections.defaultdict(list)
+        for row in range(len(ys)):
+            by_k[len(starts[row])].append(row)
+
+        for k, rows in sorted(by_k.items()):
+            rows = np.array(rows)
+            n_par = per * k + 1
+            p0 = np.empty((len(rows), n_par))
+            for r, row in enumerate(rows):
+                for q, (pos, height, wid) in enumerate(sorted(starts[row])):
+                    p0[r, per * q:per * q + per] = (height - base[row], pos, max(wid, span / len(xw)), 0.5)[:per]
+                p0[r, -1] = base[row]
+
+            # heights and widths stay positive, positions inside the window
+            b_lo = np.tile(np.r_[0., lo, span / (10 * len(xw)), 0.][:per], k)
+            b_hi = np.tile(np.r_[np.inf, hi, 10 * span, 1.][:per], k)
+            bounds = (np.r_[b_lo, -np.inf], np.r_[b_hi, np.inf])
+
+            p, chi2, jtj, converged = _levenberg_marquardt(xw, yw[rows], wt[rows], p0, k, voigt, bounds, niter)
+
+            dof = max(len(xw) - n_par, 1)
+            cov = np.linalg.pinv(jtj)
+            cov[~weighted[rows]] *= (chi2[~weighted[rows]] / dof)[:, None, None]
+            err = np.sqrt(np.abs(np.einsum('mpp->mp', cov)))
+
+            for q in range(k):
+                a, x0, fw = p[:, per * q], p[:, per * q + 1], p[:, per * q + 2]
+                eta = p[:, per * q + 3] if voigt else np.ones(len(rows))
+
+                # area of eta L + (1 - eta) G, and its error through the covariance
+                unit = fw / 2 * (eta * np.pi + (1 - eta) * np.sqrt(np.pi / _ln2))
+                area = a * unit
+                d_area = np.zeros((len(rows), n_par))
+                d_area[:, per * q] = unit
+                d_area[:, per * q + 2] = a * unit / fw
+                if voigt:
+                    d_area[:, per * q + 3] = a * fw / 2 * (np.pi - np.sqrt(np.pi / _ln2))
+                area_err = np.sqrt(np.abs(np.einsum('mp,mpq,mq->m', d_area, cov, d_area)))
+
+                columns['grain'].append(rows)
+                columns['window'].append(np.full(len(rows), w))
+                columns['peak'].append(np.full(len(rows), q))
+                columns['position'].append(x0)
+                columns['position_err'].append(err[:, per * q + 1])
+                columns['height'].append(a)
+                columns['height_err'].append(err[:, per * q])
+                columns['fwhm'].append(fw)
+                columns['fwhm_err'].append(err[:, per * q + 2])
+                columns['eta'].append(eta)
+                columns['eta_err'].append(err[:, per * q + 3] if voigt else np.zeros(len(rows)))
+                columns['area'].append(area)
+                columns['area_err'].append(area_err)
+                columns['offset'].append(p[:, -1])
+                columns['chi2'].append(chi2 / dof)
+                columns['converged'].append(converged)
+
+    table = fits(*[np.concatenate(c) if c else np.empty(0) for c in columns.values()])
+    order = np.lexsort((table.position, table.grain, table.window))
+    return fits(*[c[order] for c in table])
+
+
+def characterize(x, ys, sem=None, windows=(), prominence=0.05, width=None, shape='lorentzian', max_peaks=None):
+    """
+    find() then, if windows are given, fit()
+
+    Returns
+    -------
+    tuple:
+        (candidates, fits or None)
+
+    Example
+    -------
+    >>> found, table = spc.peaks.characterize(x, means, sems, [(500, 530)], prominence=0.1)
+    """
+    found = find(ys, x, prominence, width)
+    table = fit(x, ys, windows, sem, found, shape, max_peaks) if windows else None
+    return found, table
+
+
+def rows(table, labels=None):
+    """
+    Rows of a candidates or fits table as dicts, with the grain column
+    replaced by labels[grain] if labels are given
+    """
+    out = []
+    for values in zip(*table):
+        row = collections.OrderedDict(zip(table._fields, (v.item() for v in values)))
+        if labels is not None:
+            row['grain'] = labels[row['grain']]
+        out.append(row)
+    return out
@@ -0,0 +1,250 @@
+"""
+Smoothing and derivatives of stacks of spectra
+
+    savgol          Savitzky-Golay: a polynomial of some order fitted by
+                    least squares over a moving window, giving the smoothed
+                    value or a derivative at each point
+    moving_average  mean over a moving window, savgol of order 0
+
+A filter is a (window, window) matrix whose row j evaluates the fitted
+polynomial (or its derivative) at point j of the window. The middle row is
+convolved over the inside of every spectrum, and the rows before and after
+it give the first and last points from the first and last windows, the way
+the polynomial fits there. Filters only depend on (window, order, deriv)
+and are cached, and a whole (n_spectra, n_points) stack is filtered at once.
+"""
+
+from __future__ import division, absolute_import, unicode_literals, print_function
+
+import math
+import numpy as np
+
+# filters per (window, order, deriv), most recently used last
+_filters = {}
+_cache_max = 16
+
+
+def filters(window, order, deriv=0):
+    """
+    Savitzky-Golay filters of a window
+
+    Arguments
+    ---------
+    window: int
+        odd number of points in the window
+    order: int
+        polynomial order, less than window
+    deriv: int (default=0)
+        derivative order, 0 for the smoothed values
+
+    Returns
+    -------
+    array:
+        (window, window) read-only and shared; row j dotted with the points
+        of a window gives the value (or derivative, per point spacing) of
+        the fit at point j
+
+    Raises
+    ------
+    ValueError:
+        for an even window, order >= window or a negative deriv
+    """
+    window, order, deriv = int(window), int(order), int(deriv)
+    if window < 1 or window % 2 == 0:
+        raise ValueError("window must be a positive odd number of points, not {}".format(window))
+    if not 0 <= order < window:
+        raise ValueError("order must be from 0 to window - 1 ({}), not {}".format(window - 1, order))
+    if not 0 <= deriv:
+        raise ValueError("deriv must not be negative")
+
+    key = (window, order, deriv)
+    f = _filters.pop(key, None)
+    if f is None:
+        half = window // 2
+        t = np.arange(-half, half + 1, dtype=np.float64)
+
+        # poly coefficients (in powers of t) from the points of a window
+        fit = np.linalg.pinv(np.vander(t, order + 1, increasing=True))
+
+        # deriv-th derivative of each power of t, at each point
+        powers = np.arange(order + 1)
+        factor = np.array([math.factorial(k) // math.factorial(k - deriv) if k >= deriv else 0
+                           for k in powers], dtype=np.float64)
+        evaluate = factor * t[:, None] ** np.maximum(powers - deriv, 0)
+
+        f = evaluate @ fit
+        f.flags.writeable = False
+
+        while len(_filters) >= _cache_max:
+            del _filters[next(iter(_filters))]
+    _filters[key] = f
+    return f
+
+
+def _stack(ys):
+    """ ys as a 2-D float array, and whether it was a single spectrum """
+    ys = np.asarray(ys)
+    if not np.issubdtype(ys.dtype, np.floating):
+        ys = ys.astype(np.float64)
+    return np.atleast_2d(ys), ys.ndim == 1
+
+
+def savgol(ys, window=11, order=3, deriv=0, delta=1.0):
+    """
+    Savitzky-Golay smoothing or derivatives
+
+    Arguments
+    ---------
+    ys: (n_spectra, n_points) or (n_points,) array
+    window: int (default=11)
+        odd number of points in the window, at most n_points
+    order: int (default=3)
+        polynomial order, less than window
+    deriv: int (default=0)
+        0 smooths, 1 and 2 give the first and second derivatives
+    delta: float (default=1.0)
+        spacing of the points, derivatives are per delta**deriv
+
+    Returns
+    -------
+    array:
+        the same shape and float dtype as ys
+
+    Raises
+    ------
+    ValueError:
+        for a bad window or order, or spectra shorter than window
+
+    Example
+    -------
+    >>> smooth = spc.smooth.savgol(stack, 11, 3)
+    >>> d2 = spc.smooth.savgol(stack, 11, 3, deriv=2, delta=x[1] - x[0])
+    """
+    ys, single = _stack(ys)
+    f = filters(window, order, deriv)
+    n = ys.shape[1]
+    if n < window:
+        raise ValueError("window of {} points is longer than the {} points of the spectra".format(window, n))
+
+    half = window // 2
+    work = ys.astype(np.float64, copy=False)
+
+    # the middle filter over every full window, a shifted slice per weight
+    out = np.empty(ys.shape, dtype=np.float64)
+    inner = out[:, half:n - half]
+    inner[:] = 0.
+    for k, c in enumerate(f[half]):
+        inner += c * work[:, k:n - window + 1 + k]
+
+    # the first and last points from the fits over the end windows
+    out[:, :half] = work[:, :window] @ f[:half].T
+    out[:, n - half:] = work[:, n - window:] @ f[half + 1:].T
+
+    if deriv:
+        out /= delta ** deriv
+
+    out = out.astype(ys.dtype, copy=False)
+    return out[0] if single else out
+
+
+def moving_average(ys, window=5):
+    """
+    Mean over a window of points centred on each point; the first and last
+    window // 2 points take the mean of the first and last windows
+
+    Arguments
+    ---------
+    ys: (n_spectra, n_points) or (n_points,) array
+    window: int (default=5)
+        odd number of points
+
+    Returns
+    -------
+    array:
+        the same shape and float dtype as ys
+    """
+    return savgol(ys, window, 0)
+
+
+# ------------------------------------------------------------------------
+# Entry point
+# ------------------------------------------------------------------------
+
+methods = {'savgol': savgol, 'moving': moving_average}
+
+# positional parameters of each method in a spec, see parse()
+_params = {'savgol': (('window', int), ('order', int), ('deriv', int)),
+           'moving': (('window', int),)}
+
+
+def parse(spec):
+    """
+    Method and parameters from a spec such as 'savgol', 'savgol:15:2',
+    'savgol:11:3:1' or 'moving:7'; parameters are given in the order of the
+    method's arguments
+
+    Returns
+    -------
+    tuple:
+        (method name, dict of parameters)
+
+    Raises
+    ------
+    ValueError:
+        for an unknown method or a bad parameter
+    """
+    name, _, rest = spec.partition(':')
+    name = name.strip().lower()
+    if name not in methods:
+        raise ValueError("unknown smoothing {!r}, choose from {}".format(name, ', '.join(sorted(methods))))
+
+    values = rest.split(':') if rest else []
+    if len(values) > len(_params[name]):
+        raise ValueError("{} takes at most {} parameters".format(name, len(_params[name])))
+
+    params = {}
+    for (key, kind), value in zip(_params[name], values):
+        try:
+            params[key] = kind(value)
+        except ValueError:
+            raise ValueError("bad {} {!r} for {}".format(key, value, name))
+
+    # check the window and order now rather than on the first spectrum
+    full = dict(zip(('window', 'order', 'deriv'), (11, 3, 0) if name == 'savgol' else (5, 0, 0)))
+    full.update(params)
+    filters(full['window'], full['order'], full['deriv'])
+
+    return name, params
+
+
+def smooth(ys, method='savgol', x=None, **params):
+    """
+    Smoothed spectra, or their derivatives
+
+    Arguments
+    ---------
+    ys: (n_spectra, n_points) or (n_points,) array
+    method: str (default='savgol')
+        'savgol' or 'moving', or a spec for parse()
+    x: (n_points,) array (default=None)
+        x values, whose mean spacing is the delta of savgol derivatives
+    params:
+        parameters of the method, overriding those of a spec
+
+    Returns
+    -------
+    array:
+        new array of the same shape and float dtype as ys
+
+    Example
+    -------
+    >>> smooth = spc.smooth.smooth(stack, 'savgol:15:2')
+    >>> d1 = spc.smooth.smooth(stack, 'savgol', x=x, deriv=1)
+    """
+    name, spec_params = parse(method)
+    spec_params.update(params)
+
+    if name == 'savgol' and x is not None and len(x) > 1 and 'delta' not in spec_params:
+        spec_params['delta'] = (x[-1] - x[0]) / (len(x) - 1)
+
+    return methods[name](ys, **spec_params)
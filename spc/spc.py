@@ -8,11 +8,278 @@ author: Rohan Isaac
 """
 
 from __future__ import division, absolute_import, unicode_literals, print_function
+import os
+import math
+import mmap
 import struct
 import numpy as np
 
-from .sub import subFile, subFileOld
-from .global_fun import read_subheader, flag_bits
+from .sub import subFile, subFileOld, subFileShimadzu
+from .global_fun import read_subheader, read_subheaders, flag_bits, subhead_dtype
+from . import header, instrument
+
+
+# ------------------------------------------------------------------------
+# Region of interest
+# ------------------------------------------------------------------------
+
+
+def even_window(first, last, npts, xrange):
+    """
+    Point window of evenly spaced x values that falls inside xrange
+
+    Arguments
+    ---------
+    first, last: float
+        first and last x values
+    npts: int
+        number of points
+    xrange: (float, float)
+        x-range to keep, in either order
+
+    Returns
+    -------
+    tuple:
+        (start, stop) point indices
+    """
+    lo, hi = sorted(xrange)
+
+    if npts < 2:
+        return (0, npts) if lo <= first <= hi else (0, 0)
+
+    step = (last - first) / (npts - 1)
+    t0, t1 = sorted(((lo - first) / step, (hi - first) / step))
+
+    # small tolerance so that bounds landing on a point keep it
+    start = max(0, int(math.ceil(t0 - 1e-9)))
+    stop = min(npts, int(math.floor(t1 + 1e-9)) + 1)
+    return start, max(start, stop)
+
+
+def search_window(content, pos, npts, xrange, fmt='<f'):
+    """
+    Point window of a monotonic x array stored in content that falls inside
+    xrange, found by binary search, reading only the probed values
+
+    Arguments
+    ---------
+    content: bytes or buffer
+        raw file data
+    pos: int
+        byte position of the x array
+    npts: int
+        number of points
+    xrange: (float, float)
+        x-range to keep, in either order
+    fmt: str (default='<f')
+        struct format of one x value
+
+    Returns
+    -------
+    tuple:
+        (start, stop) point indices
+    """
+    lo, hi = sorted(xrange)
+    siz = struct.calcsize(fmt)
+
+    def probe(i):
+        return struct.unpack_from(fmt, content, pos + siz * i)[0]
+
+    def first_true(pred):
+        # first index where a monotonic predicate turns true
+        a, b = 0, npts
+        while a < b:
+            m = (a + b) // 2
+            if pred(probe(m)):
+                b = m
+            else:
+                a = m + 1
+        return a
+
+    if npts == 0:
+        return 0, 0
+
+    if probe(0) <= probe(npts - 1):
+        start = first_true(lambda v: v >= lo)
+        stop = first_true(lambda v: v > hi)
+    else:
+        start = first_true(lambda v: v <= hi)
+        stop = first_true(lambda v: v < lo)
+
+    return start, max(start, stop)
+
+
+# ------------------------------------------------------------------------
+# Global x data
+# ------------------------------------------------------------------------
+
+# x arrays of txvals files keyed on their raw bytes, so the files of one
+# session share a single array
+_x_cache = {}
+_x_cache_max = 32
+
+
+def shared_x(raw, order='<'):
+    """
+    x values of a global x block, decoded in one step. Files whose x block
+    is byte for byte identical get the same read-only array.
+
+    Arguments
+    ---------
+    raw: bytes or buffer
+        float32 x values
+    order: str (default='<')
+        byte order, '<' for LSB 1st files and '>' for MSB 1st
+
+    Returns
+    -------
+    array:
+        float64 x values, not writeable
+    """
+    key = order.encode('ascii') + bytes(raw)
+    x = _x_cache.get(key)
+    if x is None:
+        x = np.frombuffer(key, order + 'f4', offset=1).astype(np.float64)
+        x.flags.writeable = False
+
+        if len(_x_cache) >= _x_cache_max:
+            _x_cache.clear()
+        _x_cache[key] = x
+    return x
+
+
+# ------------------------------------------------------------------------
+# Shimadzu data blocks
+# ------------------------------------------------------------------------
+
+
+def shimadzu_layout(content, start=10240, min_gap=4):
+    """
+    Position of the y and x blocks of a Shimadzu file: float64 y values
+    from start, a gap of at least min_gap zero doubles, then as many
+    float64 x values. The gap is found on the whole data as 8 byte words,
+    and the first gap followed by a full, strictly monotonic x block wins,
+    so zeros inside the y data are skipped over.
+
+    y values of 0.0 at the end of the y block run into the gap, so the y
+    block may reach into the run of zeros up to min_gap words before the x
+    block. It is as long as the x block, which ends with the data or with
+    the last x value whose step keeps the sign of the first and is within
+    half and twice the step before it; if the x block without trailing y
+    zeros is followed by the end of the data or by zero padding, that
+    shorter block is taken.
+
+    Arguments
+    ---------
+    content: bytes or buffer
+        raw file data
+    start: int
+        byte position of the y block
+    min_gap: int
+        fewest zero doubles between the blocks
+
+    Returns
+    -------
+    tuple:
+        (y position, x position, number of points)
+
+    Raises
+    ------
+    ValueError:
+        if no such layout is found
+    """
+    n_words = (len(content) - start) // 8
+    if n_words < 2 + min_gap:
+        raise ValueError("Shimadzu file is too short to hold data ({} bytes)".format(len(content)))
+
+    words = np.frombuffer(content, '<u8', n_words, start)
+
+    # start and end word of every run of zero words
+    edges = np.diff(np.concatenate(([0], (words == 0).view(np.int8), [0])))
+    run_start = np.flatnonzero(edges == 1)
+    run_end = np.flatnonzero(edges == -1)
+
+    # the y block runs up to the gap, or into it if it ends in zeros, and
+    # the x block is as long
+    for shortest, x_word in zip(run_start, run_end):
+        longest = min(x_word - min_gap, n_words - x_word)
+        if shortest < 2 or longest < shortest:
+            continue
+
+        # number of x values on a smooth monotonic axis, up to longest + 1
+        step = np.diff(words[x_word:x_word + longest + 1].view('<f8'))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = step[1:] / step[:-1]
+        smooth = step * step[0] > 0
+        smooth[1:] &= (ratio >= 0.5) & (ratio <= 2.)
+        run = 1 + (len(step) if smooth.all() else int(np.argmin(smooth)))
+        if run < shortest:
+            continue
+
+        ends = x_word + shortest == n_words or words[x_word + shortest] == 0
+        pts = shortest if ends or run > longest else run
+        return start, start + 8 * int(x_word), int(pts)
+
+    raise ValueError("no y and x data blocks found in Shimadzu file")
+
+
+# ------------------------------------------------------------------------
+# Old format subfiles
+# ------------------------------------------------------------------------
+
+
+def old_subfile_layout(content, onpts, txyxys, start=header.old_head_siz - header.subhead_siz):
+    """
+    Byte position and number of points of every subfile of an old format
+    file. The old header does not give the number of subfiles, so the
+    subheaders are followed from the first (the last 32 bytes of the main
+    header) to the end of the file.
+
+    Arguments
+    ---------
+    content: bytes or buffer
+        raw file data
+    onpts: int
+        points of subfiles whose subheader gives none
+    txyxys: bool
+        subfiles store their own x values before the y values
+    start: int
+        byte position of the first subheader
+
+    Returns
+    -------
+    list:
+        (position, points) of each subfile
+
+    Raises
+    ------
+    ValueError:
+        if the file ends inside a subheader or subfile
+    """
+    length = len(content)
+    bytes_per_point = 8 if txyxys else 4
+
+    layout = []
+    pos = start
+    while pos < length:
+        if length - pos < header.subhead_siz:
+            raise ValueError("truncated old format file: subheader {} at byte {} is cut off "
+                             "after {} of {} bytes".format(len(layout) + 1, pos, length - pos, header.subhead_siz))
+
+        # subnpts, after the flags, exponent, index, time, next and noise fields
+        pts = struct.unpack_from('<i', content, pos + 16)[0]
+        if pts <= 0:
+            pts = onpts
+
+        end = pos + header.subhead_siz + bytes_per_point * pts
+        if end > length:
+            raise ValueError("truncated old format file: subfile {} ({} points) needs bytes {} to {}, "
+                             "but the file has {}".format(len(layout) + 1, pts, pos, end, length))
+
+        layout.append((pos, pts))
+        pos = end
+
+    return layout
 
 
 class File:
@@ -25,54 +292,150 @@ class File:
     content: Full raw data
     sub[i]: sub file object for each subfileFor each subfile
         sub[i].y: y data for each subfile
-    x: x-data, global, or for the first subheader
+    x: x-data, global, or for the first subheader. Global x arrays stored
+        in the file are read-only and shared with files storing the same
+        values
+    xrange: x-range the data was restricted to, or None
+    subheads: subheader fields of every subfile, one record each in the
+        byte order of the file (see global_fun.subhead_dtype);
+        sub[i].subtime etc. read from it
+    sub_layout: (position, points) of each subfile, old format only
+    byte_order: '<' for new LSB 1st files, '>' for new MSB 1st
+    dtype: dtype of the y data of every subfile
+    timings: time spent in each parse phase and counters, or None if not
+        recorded (see spc.instrument)
 
     Examples
     --------
     >>> import spc
     >>> ftir_1 = spc.File('/path/to/ftir.spc')
+    >>> window = spc.File('/path/to/raman.spc', xrange=(100, 1800))
+    >>> single = spc.File('/path/to/raman.spc', dtype=np.float32)
+    >>> member = spc.File(spc.archive.read('/path/to/run.zip/raman.spc'))
+    >>> spc.File('/path/to/raman.spc', timings=True).timings['phases']
     """
 
-    # Format strings for various parts of the file
-    # calculate size of strings using `struct.calcsize(string)`
-    head_str        = "<cccciddicccci9s9sh32s130s30siicchf48sfifc187s"
-    old_head_str    = "<cchfffcchcccc8shh28s130s30s32s"
-    logstc_str      = "<iiiii44s"
-
-    # byte positon of various parts of the file
-    head_siz        = 512
-    old_head_siz    = 256
-    subhead_siz     = 32
-    log_siz         = 64
+    # every attribute a file can have, so no per-file __dict__ is needed
+    __slots__ = (
+        # main header, new format
+        'ftflg', 'fversn', 'fexper', 'fexp', 'fnpts', 'ffirst', 'flast', 'fnsub',
+        'fxtype', 'fytype', 'fztype', 'fpost', 'fdate', 'fres', 'fsource', 'fpeakpt',
+        'fspare', 'fcmnt', 'fcatxt', 'flogoff', 'fmods', 'fprocs', 'flevel', 'fsampin',
+        'ffactor', 'fmethod', 'fzinc', 'fwplanes', 'fwinc', 'fwtype', 'freserv',
+        # main header, old format
+        'oftflgs', 'oversn', 'oexp', 'onpts', 'ofirst', 'olast', 'oyear', 'omonth',
+        'oday', 'ohour', 'ominute', 'ores', 'opeakpt', 'onscans', 'ospare', 'ocmnt',
+        'ocatxt', 'osubh1',
+        # log block
+        'logsizd', 'logsizm', 'logtxto', 'logbins', 'logdsks', 'logspar',
+        # flags and values derived from the header
+        'tsprec', 'tcgram', 'tmulti', 'trandm', 'tordrd', 'talabs', 'txyxys', 'txvals',
+        'dat_fmt', 'dat_multi', 'pr_versn', 'byte_order', 'year', 'month', 'day',
+        'hour', 'minute', 'cmnt', 'spacing', 'directory',
+        # data
+        'length', 'xrange', 'dtype', 'timings', 'content', 'x', 'sub', 'subheads',
+        'sub_layout',
+        # filled in on first access
+        '_log_raw', '_log', '_labels', '_exp_type')
+
+    # Format strings and byte positions of various parts of the file,
+    # see header.py
+    head_str        = header.head_str
+    old_head_str    = header.old_head_str
+    logstc_str      = header.logstc_str
+
+    head_str_msb    = header.head_str_msb
+    logstc_str_msb  = header.logstc_str_msb
+
+    head_siz        = header.head_siz
+    old_head_siz    = header.old_head_siz
+    subhead_siz     = header.subhead_siz
+    log_siz         = header.log_siz
 
     subhead1_pos    = head_siz + subhead_siz
 
+    # files at least this big are memory mapped rather than read, so only
+    # the pages that get decoded are loaded
+    mmap_min        = 1 << 20
+
     # ------------------------------------------------------------------------
     # CONSTRUCTOR
     # ------------------------------------------------------------------------
 
-    def __init__(self, filename):
+    def __init__(self, filename, xrange=None, timings=False, dtype=np.float64, verbose=True):
+        """
+        Arguments
+        ---------
+        filename: str, bytes or file object
+            path to the SPC file, its contents (e.g. an archive member, see
+            spc.archive), or a binary file object to read them from
+        xrange: (float, float) (default=None)
+            only decode points with x inside this range
+        timings: bool (default=False)
+            record the time of each parse phase in self.timings, also done
+            for every file while spc.instrument is enabled
+        dtype: numpy dtype (default=np.float64)
+            y data is decoded straight into this type, np.float32 halves
+            the memory of the spectra; x data is always float64
+        verbose: bool (default=True)
+            print the data format and number of subfiles
+        """
+
+        probe = instrument.probe( timings )
+
+        if isinstance( filename, ( bytes, bytearray, memoryview ) ):
+            # already in memory, bytes slices as the parser expects
+            content  = filename if isinstance( filename, bytes ) else bytes( filename )
+            filename = '<buffer>'
+
+        elif hasattr( filename, 'read' ):
+            content  = filename.read()
+            filename = getattr( filename, 'name', '<stream>' )
 
-        # load entire into memory temporarly
-        with open( filename, "rb" ) as fin:
-            content = fin.read()
-            # print "Read raw data"
+        else:
+            with open( filename, "rb" ) as fin:
+                if os.fstat( fin.fileno() ).st_size >= self.mmap_min:
+                    content = mmap.mmap( fin.fileno(), 0, access = mmap.ACCESS_READ )
+                    probe.count( 'mapped' )
+                else:
+                    # load entire into memory temporarly
+                    content = fin.read()
 
         self.length             = len( content )
+        self.xrange             = xrange
+        self.dtype              = np.dtype( dtype )
+        self.timings            = None
+
+        # filled in on first access, see the log and label properties
+        self._log_raw           = None
+        self._log               = None
+        self._labels            = None
+        self._exp_type          = None
+
+        probe.count( 'files' )
+        probe.count( 'bytes', self.length )
+        probe.mark( 'read' )
+
+        # point window of each spectrum, None for all points
+        window                  = None
 
         # extract first two bytes to determine file type version
         self.ftflg, self.fversn = struct.unpack( '<cc'.encode( 'utf8' ), content[:2] )
          
         # --------------------------------------------
-        # NEW FORMAT (LSB)
+        # NEW FORMAT (LSB or MSB)
         # --------------------------------------------
-        if self.fversn == b'\x4b':
-            # format: new LSB 1st
+        if self.fversn in ( b'\x4b', b'\x4c' ):
+            # format: new LSB 1st, or new MSB 1st which only differs in the
+            # byte order of every number
             # -------------
             # unpack header
             # -------------
-            # use little-endian format with standard sizes
+            # use little-endian (big-endian for MSB) format with standard sizes
             # use naming scheme in SPC.H header file
+            order           = '<' if self.fversn == b'\x4b' else '>'
+            self.byte_order = order
+
             self.ftflg, \
                 self.fversn, \
                 self.fexper, \
@@ -104,7 +467,8 @@ class File:
                 self.fwinc, \
                 self.fwtype, \
                 self.freserv \
-                = struct.unpack( self.head_str.encode( 'utf8' ), content[:self.head_siz] )
+                = struct.unpack( ( self.head_str if order == '<' else self.head_str_msb ).encode( 'utf8' ),
+                                 content[:self.head_siz] )
 
             # Flag bits
             self.tsprec, \
@@ -161,7 +525,9 @@ class File:
                 # no x values are given, but they can be generated
                 self.dat_fmt = 'gx-y'
 
-            print( '{}({})'.format( self.dat_fmt, self.fnsub ) )
+            if verbose:
+                print( '{}({})'.format( self.dat_fmt, self.fnsub ) )
+            probe.mark( 'header' )
 
             sub_pos = self.head_siz
 
@@ -173,10 +539,16 @@ class File:
                     # if global x data is given
                     x_dat_pos = self.head_siz
                     x_dat_end = self.head_siz + (4 * self.fnpts)
-                    self.x    = np.array(
-                                [struct.unpack_from(
-                                    'f', content[x_dat_pos:x_dat_end], 4 * i)[0]
-                                    for i in range( 0, self.fnpts )] )
+
+                    if xrange is not None:
+
+                        # binary search the x data, then decode only the window
+                        window    = search_window( content, x_dat_pos, self.fnpts, xrange, order + 'f' )
+                        self.x    = np.frombuffer( content, order + 'f4', window[1] - window[0],
+                                                   x_dat_pos + 4 * window[0] ).astype( np.float64 )
+                    else:
+                        # shared by every subfile, and by files with the same x data
+                        self.x    = shared_x( content[x_dat_pos:x_dat_end], order )
                     sub_pos   = x_dat_end
 
                 else:
@@ -184,11 +556,24 @@ class File:
                     # otherwise generate them
                     self.x    = np.linspace( self.ffirst, self.flast, num = self.fnpts )
 
-            # make a list of subfiles
-            self.sub = []
+                    if xrange is not None:
+                        window    = even_window( self.ffirst, self.flast, self.fnpts, xrange )
+                        self.x    = self.x[window[0]:window[1]]
+
+                if window is not None and window[0] == window[1]:
+                    raise ValueError( "xrange {} is outside the x data of {}".format( xrange, filename ) )
+
+            probe.mark( 'x' )
+
+            # decode straight out of the file buffer, without copying subfiles
+            view = memoryview( content )
+
+            # (start, end) of every subfile
+            spans = []
 
             # if subfile directory is given
-            if self.dat_fmt == '-xy' and self.fnpts > 0:
+            directory = self.dat_fmt == '-xy' and self.fnpts > 0
+            if directory:
 
                 self.directory = True
 
@@ -196,10 +581,9 @@ class File:
                 for i in range(0, self.fnsub):
 
                     ssfposn, ssfsize, ssftime = struct.unpack(
-                        '<iif'.encode('utf8'), content[self.fnpts + (i * 12):self.fnpts + ((i + 1) * 12)])
+                        ( order + 'iif' ).encode('utf8'), content[self.fnpts + (i * 12):self.fnpts + ((i + 1) * 12)])
 
-                    # add sufile, load defaults for npts and exp
-                    self.sub.append( subFile( content[ssfposn:ssfposn + ssfsize], 0, 0, True, self.tsprec, self.tmulti ) )
+                    spans.append( ( ssfposn, ssfposn + ssfsize ) )
 
             else:
 
@@ -210,23 +594,48 @@ class File:
                     if self.txyxys:
 
                         # use points in subfile
-                        subhead_lst = read_subheader( content[sub_pos:( sub_pos + 32 )] )
+                        subhead_lst = read_subheader( content[sub_pos:( sub_pos + 32 )], order )
                         pts         = subhead_lst[6]
 
-                        # 4 bytes each for x and y, and 32 for subheader
-                        dat_siz     = (8 * pts) + 32
+                        # 4 bytes each for x and y (2 for 16 bit y), and 32 for subheader
+                        dat_siz     = ((6 if self.tsprec else 8) * pts) + 32
                     else:
 
-                        # use global points
+                        # use global points, 2 bytes each for 16 bit y
                         pts         = self.fnpts
-                        dat_siz     = (4 * pts) + 32
+                        dat_siz     = ((2 if self.tsprec else 4) * pts) + 32
+
+                    spans.append( ( sub_pos, sub_pos + dat_siz ) )
 
-                    sub_end = sub_pos + dat_siz
-                    # read into object, add to list
-                    self.sub.append( subFile( content[sub_pos:sub_end],
-                                            self.fnpts, self.fexp, self.txyxys, self.tsprec, self.tmulti ) )
                     # update positions
-                    sub_pos = sub_end
+                    sub_pos = sub_pos + dat_siz
+
+            # the subheaders of all subfiles, read in one go into one array
+            self.subheads = read_subheaders( content, [ start for start, end in spans ], order )
+
+            # make a list of subfiles
+            self.sub = []
+
+            for i, ( start, end ) in enumerate( spans ):
+
+                if directory:
+                    # add sufile, load defaults for npts and exp
+                    self.sub.append( subFile( view[start:end], 0, 0, True, self.tsprec, self.tmulti,
+                                             dtype = self.dtype, order = order, heads = self.subheads, index = i ) )
+                else:
+                    # read into object, add to list
+                    self.sub.append( subFile( view[start:end],
+                                            self.fnpts, self.fexp, self.txyxys, self.tsprec, self.tmulti, window, self.dtype,
+                                            order, self.subheads, i ) )
+
+            del view
+
+            # subfiles with their own x data are cut to the range after decoding
+            if self.txyxys and xrange is not None:
+                for s in self.sub:
+                    s.clip( xrange )
+
+            probe.mark( 'subfiles' )
 
             # if log data exists
             # flog offset to log data offset not zero (bytes)
@@ -238,45 +647,19 @@ class File:
                     self.logbins, \
                     self.logdsks, \
                     self.logspar \
-                    = struct.unpack( self.logstc_str.encode( 'utf8' ),
+                    = struct.unpack( ( self.logstc_str if order == '<' else self.logstc_str_msb ).encode( 'utf8' ),
                                     content[self.flogoff:log_head_end] )
 
 
                 log_pos             = self.flogoff + self.logtxto
                 log_end_pos         = log_pos + self.logsizd
 
-                # line endings: get rid of any '\r' and then split on '\n'
-                self.log_content    = content[log_pos:log_end_pos].replace( b'\r', b'' ).split( b'\n' )
-
-                # split log data into dictionary based on =
-                self.log_dict       = dict()
-                self.log_other      = []  # put the rest into a list
-
-                for x in self.log_content:
-
-                    if x.find(b'=') >= 0:
-                        # stop it from breaking if there is more than 1 =
-                        key, value          = x.split(b'=')[:2]
-                        self.log_dict[key]  = value
-
-                    else:
-                        self.log_other.append(x)
+                # the text is only split up when first asked for, see log_dict
+                self._log_raw       = content[log_pos:log_end_pos]
 
             # spacing between data
             self.spacing = ( self.flast - self.ffirst ) / ( self.fnpts - 1 )
 
-            # call functions
-            self.set_labels()
-            self.set_exp_type()
-
-        # --------------------------------------------
-        # NEW FORMAT (MSB)
-        # --------------------------------------------
-        elif self.fversn == b'\x4c':
-            # new MSB 1st
-            print("New MSB 1st, yet to be implemented")
-            pass  # To be implemented
-
         # --------------------------------------------
         # OLD FORMAT
         # --------------------------------------------
@@ -334,6 +717,7 @@ class File:
 
             # number of scans (? subfiles sometimes ?)
             self.onscans = int(self.onscans)
+            probe.mark( 'header' )
 
             # null terminated strings
             self.ores    = self.ores.split(b'\x00')[0]
@@ -342,228 +726,178 @@ class File:
             # can it have separate x values ?
             self.x       = np.linspace(self.ofirst, self.olast, num=self.onpts)
 
-            # make a list of subfiles
-            self.sub     = []
-
-            # already have subheader from main header, retrace steps
-            sub_pos      = self.old_head_siz - self.subhead_siz
+            if xrange is not None:
+                window   = even_window(self.ofirst, self.olast, self.onpts, xrange)
+                self.x   = self.x[window[0]:window[1]]
 
-            # for each subfile
-            # in the old format we don't know how many subfiles to expect,
-            # just looping till we run out
-            i = 0
-            while True:
+            probe.mark( 'x' )
 
-                try:
+            # position and points of every subfile, from the file length, so a
+            # truncated file fails here rather than giving a short spectrum
+            self.sub_layout = old_subfile_layout( content, self.onpts, self.txyxys )
+            self.fnsub      = len( self.sub_layout )
 
-                    # read in subheader
-                    subhead_lst = read_subheader(content[sub_pos:sub_pos + self.subhead_siz])
+            # decode straight out of the file buffer, without copying subfiles
+            view = memoryview( content )
 
-                    if subhead_lst[6] > 0:
-                        # default to subfile points, unless it is zero
-                        pts = subhead_lst[6]
-                    else:
-                        pts = self.onpts
+            # make a list of subfiles, their subheaders go in one array
+            self.sub      = []
+            self.subheads = read_subheaders( content, [ sub_pos for sub_pos, pts in self.sub_layout ] )
 
-                    # figure out size of subheader
-                    dat_siz = (4 * pts)
-                    sub_end = sub_pos + self.subhead_siz + dat_siz
+            for i, ( sub_pos, pts ) in enumerate( self.sub_layout ):
 
-                    # read into object, add to list
-                    # send it pts since we have already figured that out
-                    self.sub.append(subFileOld(
-                        content[sub_pos:sub_end], pts, self.oexp, self.txyxys))
-                    # update next subfile postion, and index
-                    sub_pos = sub_end
+                sub_end = sub_pos + self.subhead_siz + ( 8 if self.txyxys else 4 ) * pts
+                self.sub.append( subFileOld( view[sub_pos:sub_end], pts, self.oexp, self.txyxys, window, self.dtype,
+                                             self.subheads, i ) )
 
-                    i += 1
+            del view
 
-                except:
-                    # zero indexed, set the total number of subfile
-                    self.fnsub = i + 1
-                    break
+            probe.mark( 'subfiles' )
 
             # assuming it can't have separate x values
             self.dat_fmt = 'gx-y'
-            print( '{}({})'.format( self.dat_fmt, self.fnsub ) )
+            if verbose:
+                print( '{}({})'.format( self.dat_fmt, self.fnsub ) )
 
             self.fxtype = ord( self.fxtype )
             self.fytype = ord( self.fytype )
 
             # need to find from year apparently
             self.fztype = 0
-            self.set_labels()
 
         # --------------------------------------------
         # SHIMADZU
         # --------------------------------------------
         elif self.fversn == b'\xcf':
 
-            print( "Highly experimental format, may not work" )
-
-            raw_data    = content[10240:]  # data starts here (maybe every time)
-
-            # spacing between y and x data is atleast 0 bytes
-            s_32        = chr(int('0', 2)) * 32
-            s_8         = chr(int('0', 2)) * 8  # zero double
-            dat_len     = raw_data.find(s_32)
-
-            for i in range( dat_len, len( raw_data ), 8 ):
-
-                # find first non zero double
-                if raw_data[i:i + 8] != s_8:
-                    break
-
-            dat_siz     = int( dat_len / 8. )
-            self.y      = struct.unpack( ( '<' + dat_siz * 'd' ).encode( 'utf8' ), raw_data[:dat_len] )
-            self.x      = struct.unpack( ( '<' + dat_siz * 'd' ).encode( 'utf8' ), raw_data[i:i + dat_len] )
+            # a single spectrum: y then x as float64, with no header fields
+            # known, separated by a gap of zeros
+            y_dat_pos, x_dat_pos, pts = shimadzu_layout( content )
+
+            self.fnsub   = 1
+            self.fnpts   = pts
+            self.dat_fmt = 'x-y'
+            self.fxtype  = self.fytype = self.fztype = 0
+            if verbose:
+                print( '{}({})'.format( self.dat_fmt, self.fnsub ) )
+            probe.mark( 'header' )
+
+            window = ( 0, pts )
+            if xrange is not None:
+                window = search_window( content, x_dat_pos, pts, xrange, '<d' )
+                if window[0] == window[1]:
+                    raise ValueError( "xrange {} is outside the x data of {}".format( xrange, filename ) )
+
+            # read-only views of the file buffer
+            self.x       = np.frombuffer( content, '<f8', window[1] - window[0], x_dat_pos + 8 * window[0] )
+            probe.mark( 'x' )
+
+            y            = np.frombuffer( content, '<f8', window[1] - window[0], y_dat_pos + 8 * window[0] )
+            self.subheads = np.zeros( 1, subhead_dtype )
+            self.sub      = [ subFileShimadzu( y.astype( self.dtype, copy = False ), self.subheads ) ]
+            probe.mark( 'subfiles' )
 
         else:
             print( "File type %s not supported yet. Please add issue. "
                   % hex( ord( self.fversn ) ) )
-            self.content = content
+            self.content = content[:]
+
+        # --------------------------------------------
+        # INSTRUMENTATION
+        # --------------------------------------------
+        if probe is not instrument.null_probe:
+            subs = getattr( self, 'sub', [] )
+            probe.count( 'subfiles', len( subs ) )
+            probe.count( 'points', sum( len( s.y ) for s in subs ) )
+
+            self.timings = probe.as_dict()
+            if instrument.enabled:
+                instrument.registry.add( probe )
 
     # ------------------------------------------------------------------------
     # Process other data
     # ------------------------------------------------------------------------
 
-    def set_labels(self):
-        """
-        Set the x, y, z axis labels using various information in file content
-        """
+    def _parse_log(self):
+        """ Split the log text into key=value pairs and other lines """
+        if self._log_raw is None:
+            raise AttributeError("file has no log block")
 
-        # --------------------------
-        # units for x,z,w axes
-        # --------------------------
-        fxtype_op = ["Arbitrary",
-                     "Wavenumber (cm-1)",
-                     "Micrometers (um)",
-                     "Nanometers (nm)",
-                     "Seconds ",
-                     "Minutes", "Hertz (Hz)",
-                     "Kilohertz (KHz)",
-                     "Megahertz (MHz) ",
-                     "Mass (M/z)",
-                     "Parts per million (PPM)",
-                     "Days",
-                     "Years",
-                     "Raman Shift (cm-1)",
-                     "eV",
-                     "XYZ text labels in fcatxt (old 0x4D version only)",
-                     "Diode Number",
-                     "Channel",
-                     "Degrees",
-                     "Temperature (F)",
-                     "Temperature (C)",
-                     "Temperature (K)",
-                     "Data Points",
-                     "Milliseconds (mSec)",
-                     "Microseconds (uSec) ",
-                     "Nanoseconds (nSec)",
-                     "Gigahertz (GHz)",
-                     "Centimeters (cm)",
-                     "Meters (m)",
-                     "Millimeters (mm)",
-                     "Hours"]
-
-        if self.fxtype < 30:
-            self.xlabel = fxtype_op[self.fxtype]
-        else:
-            self.xlabel = "Unknown"
+        # line endings: get rid of any '\r' and then split on '\n'
+        content = self._log_raw.replace(b'\r', b'').split(b'\n')
 
-        if self.fztype < 30:
-            self.zlabel = fxtype_op[self.fztype]
-        else:
-            self.zlabel = "Unknown"
-
-        # --------------------------
-        # units y-axis
-        # --------------------------
-
-        fytype_op = ["Arbitrary Intensity",
-                     "Interferogram",
-                     "Absorbance",
-                     "Kubelka-Munk",
-                     "Counts",
-                     "Volts",
-                     "Degrees",
-                     "Milliamps",
-                     "Millimeters",
-                     "Millivolts",
-                     "Log(1/R)",
-                     "Percent",
-                     "Intensity",
-                     "Relative Intensity",
-                     "Energy",
-                     "",
-                     "Decibel",
-                     "",
-                     "",
-                     "Temperature (F)",
-                     "Temperature (C)",
-                     "Temperature (K)",
-                     "Index of Refraction [N]",
-                     "Extinction Coeff. [K]",
-                     "Real",
-                     "Imaginary",
-                     "Complex"]
-
-        fytype_op2 = ["Transmission",
-                      "Reflectance",
-                      "Arbitrary or Single Beam with Valley Peaks",
-                      "Emission"]
-
-        if self.fytype < 27:
-            self.ylabel = fytype_op[self.fytype]
-
-        elif self.fytype > 127 and self.fytype < 132:
-            self.ylabel = fytype_op2[self.fytype - 128]
+        # split log data into dictionary based on =
+        log_dict = dict()
+        log_other = []  # put the rest into a list
 
-        else:
-            self.ylabel = "Unknown"
+        for x in content:
 
-        # --------------------------
-        # check if labels are included as text
-        # --------------------------
+            if x.find(b'=') >= 0:
+                # stop it from breaking if there is more than 1 =
+                key, value = x.split(b'=')[:2]
+                log_dict[key] = value
 
-        # split it based on 00 string
-        # format x, y, z
-        if self.talabs:
+            else:
+                log_other.append(x)
+
+        self._log = (content, log_dict, log_other)
+
+    @property
+    def log_content(self):
+        """ Lines of the log text, parsed on first access """
+        if self._log is None:
+            self._parse_log()
+        return self._log[0]
+
+    @property
+    def log_dict(self):
+        """ key=value lines of the log text as a dict of bytes """
+        if self._log is None:
+            self._parse_log()
+        return self._log[1]
+
+    @property
+    def log_other(self):
+        """ Lines of the log text without an = """
+        if self._log is None:
+            self._parse_log()
+        return self._log[2]
 
-            ll = self.fcatxt.split(b'\x00')
+    def set_labels(self):
+        """
+        Set the x, y, z axis labels using various information in file content,
+        see header.axis_labels. Done on first access of any of them.
+        """
+        fcatxt = self.fcatxt if getattr(self, 'talabs', 0) else None
+        self._labels = list(header.axis_labels(self.fxtype, self.fytype, self.fztype, fcatxt))
 
-            if len(ll) > 2:
+    def _label(self, i):
+        if self._labels is None:
+            self.set_labels()
+        return self._labels[i]
 
-                # make sure there are enough items to extract from
-                xl, yl, zl = ll[:3]
+    def _set_label(self, i, value):
+        if self._labels is None:
+            self.set_labels()
+        self._labels[i] = value
 
-                # overwrite only if non zero
-                if len(xl) > 0:
-                    self.xlabel = xl
-                if len(yl) > 0:
-                    self.ylabel = yl
-                if len(zl) > 0:
-                    self.zlabel = zl
+    xlabel = property(lambda self: self._label(0), lambda self, v: self._set_label(0, v),
+                      doc="x axis label")
+    ylabel = property(lambda self: self._label(1), lambda self, v: self._set_label(1, v),
+                      doc="y axis label")
+    zlabel = property(lambda self: self._label(2), lambda self, v: self._set_label(2, v),
+                      doc="z axis label")
 
     def set_exp_type(self):
         """ Sets the experiment type """
+        self._exp_type = header.exp_type(self.fexper)
 
-        fexper_op = ["General SPC",
-                     "Gas Chromatogram",
-                     "General Chromatogram",
-                     "HPLC Chromatogram",
-                     "FT-IR, FT-NIR, FT-Raman Spectrum or Igram",
-                     "NIR Spectrum",
-                     "UV-VIS Spectrum",
-                     "X-ray Diffraction Spectrum",
-                     "Mass Spectrum ",
-                     "NMR Spectrum or FID",
-                     "Raman Spectrum",
-                     "Fluorescence Spectrum",
-                     "Atomic Spectrum",
-                     "Chromatography Diode Array Spectra"]
-
-        self.exp_type = fexper_op[self.fexper]
+    @property
+    def exp_type(self):
+        """ Experiment type, from fexper (new format only) """
+        if self._exp_type is None:
+            self.set_exp_type()
+        return self._exp_type
 
     # ------------------------------------------------------------------------
     # output
@@ -677,6 +1011,28 @@ class File:
         #Return list
         return dat
 
+    def data_arrays(self, sub=0):
+        """ x and y arrays of one subfile, as decoded and without copying,
+        y in the dtype the file was read with
+
+        Arguments
+        ---------
+        sub: int (default=0)
+            index of the subfile
+
+        Returns
+        -------
+        tuple:
+            (x, y) arrays; they belong to the file and are shared with it
+
+        Example
+        -------
+        >>> x, y = spc.File(path, dtype=np.float32).data_arrays()
+        """
+        s = self.sub[sub]
+        x = s.x if self.dat_fmt.endswith('-xy') else self.x
+        return x, s.y
+
     def write_file(self, path, delimiter='\t', newline='\n'):
         """ Output x,y data to text file tab seperated
 
@@ -697,6 +1053,37 @@ class File:
         with open(path, 'w') as f:
             f.write( self.data_txt( delimiter, newline ) )
 
+    def save(self, path, ytype='float'):
+        """ Write the data back out as a new format (LSB) SPC file
+
+        Arguments
+        ---------
+        path: str
+            full path to output file including extension
+        ytype: str (default='float')
+            'float', 'int32' or 'int16' storage of the y data
+
+        Example
+        -------
+        >>> f.save('/Users/home/copy.spc')
+
+        """
+        from .writer import save
+
+        if self.dat_fmt.endswith('-xy'):
+            x = [s.x for s in self.sub]
+            y = [s.y for s in self.sub]
+        else:
+            x = self.x
+            y = np.array([s.y for s in self.sub])
+
+        save(path, y, x, ytype=ytype,
+             subtime=self.subheads['subtime'],
+             log=getattr(self, 'log_dict', None),
+             comment=getattr(self, 'cmnt', ''),
+             fexper=getattr(self, 'fexper', 0),
+             fxtype=self.fxtype, fytype=self.fytype, fztype=self.fztype)
+
     def print_metadata(self):
         """ Print out select metadata"""
         print("Scan: ", self.log_dict['Comment'], "\n",
@@ -0,0 +1,138 @@
+"""
+Streaming statistics over spectra: running mean and variance per point
+"""
+
+from __future__ import division, absolute_import, unicode_literals, print_function
+
+import numpy as np
+
+
+class Accumulator:
+    """
+    One-pass mean and variance of a set of equal length spectra, using
+    Chan's pairwise combination for single spectra (Welford's update),
+    stacks and partial results from other workers. Memory use is that of
+    four spectra, however many are added.
+
+    NaN values, such as the points of a spectrum resampled onto a grid
+    wider than its own x range, are skipped: every point keeps its own
+    count, mean and m2 over the spectra that have a value there. Points no
+    spectrum has a value for have a NaN mean.
+
+    With dtype=np.float32 the running mean and m2 are kept in single
+    precision; the sums over a stack are still taken in double precision,
+    so the error does not grow with the number of spectra per stack.
+
+    Data
+    ----
+    count: number of spectra added
+    n: per point number of values added
+    mean: per point mean
+    m2: per point sum of squared deviations from the mean
+
+    Examples
+    --------
+    >>> acc = Accumulator()
+    >>> for y in spectra:
+    ...     acc.add(y)
+    >>> acc.mean, acc.sem()
+    """
+
+    def __init__(self, npts=None, dtype=np.float64):
+        self.dtype = np.dtype(dtype)
+        self.count = 0
+        self.n = None
+        self.mean = None
+        self.m2 = None
+
+        if npts is not None:
+            self._alloc(npts)
+
+    def _alloc(self, npts):
+        self.n = np.zeros(npts, dtype=np.int64)
+        self.mean = np.full(npts, np.nan, dtype=self.dtype)
+        self.m2 = np.zeros(npts, dtype=self.dtype)
+
+    def _check(self, npts):
+        if self.mean is None:
+            self._alloc(npts)
+        elif npts != len(self.mean):
+            raise ValueError("spectrum has {} points, accumulator has {}".format(
+                npts, len(self.mean)))
+
+    def add(self, y):
+        """ Add one spectrum """
+        self.add_stack(np.asarray(y, dtype=self.dtype)[None])
+
+    def add_stack(self, ys):
+        """ Add a (n_spectra, n_points) stack in one vectorized step """
+        ys = np.asarray(ys, dtype=self.dtype)
+        if ys.ndim == 1:
+            return self.add(ys)
+        if len(ys) == 0:
+            return
+
+        part = Accumulator(dtype=self.dtype)
+        part.count = len(ys)
+        valid = ~np.isnan(ys)
+        if valid.all():
+            part.n = np.full(ys.shape[1], len(ys), dtype=np.int64)
+            mean = ys.mean(axis=0, dtype=np.float64)
+            m2 = np.square(ys - mean).sum(axis=0)
+        else:
+            part.n = valid.sum(axis=0)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                mean = np.nansum(ys, axis=0, dtype=np.float64) / part.n
+            m2 = np.nansum(np.square(ys - mean), axis=0)
+        part.m2 = m2.astype(self.dtype, copy=False)
+        part.mean = mean.astype(self.dtype, copy=False)
+        self.merge(part)
+
+    def merge(self, other):
+        """ Combine the spectra of another accumulator into this one """
+        if other.count == 0:
+            return self
+        self._check(len(other.mean))
+
+        if self.count == 0:
+            self.count = other.count
+            self.n[:] = other.n
+            self.mean[:] = other.mean
+            self.m2[:] = other.m2
+            return self
+
+        na, nb = self.n, other.n
+        n = na + nb
+        with np.errstate(invalid='ignore', divide='ignore'):
+            delta = other.mean - self.mean
+            mean = self.mean + delta * (nb / n).astype(self.dtype)
+            m2 = self.m2 + (other.m2 + delta * delta * (na * nb / n).astype(self.dtype))
+
+        # points only one side has a value for keep that side's
+        self.mean[:] = np.where(na == 0, other.mean, np.where(nb == 0, self.mean, mean))
+        self.m2[:] = np.where(na == 0, other.m2, np.where(nb == 0, self.m2, m2))
+        self.n = n
+        self.count += other.count
+        return self
+
+    def _zeros(self):
+        """ Zero per point, or no points if none were allocated yet """
+        return np.zeros(0 if self.m2 is None else len(self.m2), dtype=self.dtype)
+
+    def variance(self, ddof=1):
+        """ Per point variance, zero where there are no more than ddof values """
+        if self.count <= ddof:
+            return self._zeros()
+        var = self.m2 / np.maximum(self.n - ddof, 1).astype(self.dtype)
+        var[self.n <= ddof] = 0
+        return var
+
+    def std(self, ddof=1):
+        """ Per point standard deviation """
+        return np.sqrt(self.variance(ddof))
+
+    def sem(self):
+        """ Per point standard error of the mean """
+        if self.count < 2:
+            return self._zeros()
+        return np.sqrt(self.variance(1) / np.maximum(self.n, 1).astype(self.dtype))
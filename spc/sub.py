@@ -6,39 +6,94 @@ author: Rohan Isaac
 
 from __future__ import division, absolute_import, unicode_literals, print_function
 
-import struct
 import numpy as np
 
-from .global_fun import read_subheader
+from .global_fun import subhead_dtype, read_subheaders
 
 
-class subFile:
+def _column(name):
+    """ Subheader field of a subfile, stored in the column array of its file """
+
+    def get(self):
+        return self._heads[name][self._i].item()
+
+    def set(self, value):
+        self._heads[name][self._i] = value
+
+    return property(get, set, doc="{} of the subheader".format(name))
+
+
+class subHeader:
+    """
+    Subheader fields of a subfile, kept as one row of a structured array
+    (see global_fun.subhead_dtype) that a File shares between all of its
+    subfiles, so each subfile only holds its data arrays and a row index
+
+    Data
+    ----
+    subflgs, subexp, subindx, subtime, subnext, subnois, subnpts, subscan,
+    subwlevel, subresv: subheader fields
+    """
+
+    __slots__ = ('x', 'y', '_heads', '_i')
+
+    subflgs = _column('subflgs')
+    subexp = _column('subexp')
+    subindx = _column('subindx')
+    subtime = _column('subtime')
+    subnext = _column('subnext')
+    subnois = _column('subnois')
+    subnpts = _column('subnpts')
+    subscan = _column('subscan')
+    subwlevel = _column('subwlevel')
+    subresv = _column('subresv')
+
+    def _set_head(self, heads, index, data=None, order='<'):
+        """
+        Use row index of heads, the subheaders of the file already read
+        (see global_fun.read_subheaders). Without them the subheader is read
+        from the first 32 bytes of data into a row of its own, or left at
+        zero if there is no data either.
+        """
+        if heads is None:
+            if data is None:
+                heads = np.zeros(1, subhead_dtype)
+            else:
+                heads = read_subheaders(data, [0], order)
+            index = 0
+
+        self._heads = heads
+        self._i = index
+
+
+class subFile(subHeader):
     """
     Processes each subfile passed to it, extracts header information and data
     information and places them in data members
 
     Data
     ----
-    x: x-data (optional)
-    y: y-data
-    y_int: integer y-data if y-data is not floating
+    x: x-data (only set for subfiles with their own x values)
+    y: y-data, scaled by the exponent if stored as integers
+    subflgs, subexp, ...: subheader fields, see subHeader
 
     """
 
-    def __init__(self, data, fnpts, fexp, txyxy, tsprec, tmulti):
+    __slots__ = ()
+
+    def __init__(self, data, fnpts, fexp, txyxy, tsprec, tmulti, window=None, dtype=np.float64, order='<',
+                 heads=None, index=0):
+        """
+        data is any buffer holding the subfile (bytes, memoryview of a
+        mapped file, ...). If window = (start, stop) is given, only those
+        points of the y data are decoded. y is decoded straight into dtype,
+        x is always float64. order is the byte order of the file, '<' (LSB
+        1st) or '>' (MSB 1st). The subheader is row index of heads if
+        given, see subHeader.
+        """
 
         # extract subheader info
-        self.subflgs, \
-            self.subexp, \
-            self.subindx, \
-            self.subtime, \
-            self.subnext, \
-            self.subnois, \
-            self.subnpts, \
-            self.subscan, \
-            self.subwlevel, \
-            self.subresv \
-            = read_subheader(data[:32])
+        self._set_head(heads, index, data, order)
 
         # header is 32 bytes
         y_dat_pos = 32
@@ -49,6 +104,10 @@ class subFile:
         else:
             pts = fnpts
 
+        if window is None:
+            window = (0, pts)
+        start, stop = window
+
         # Choosing exponent
         # -----------------
         # choose local vs global exponent depending on tmulti
@@ -65,45 +124,47 @@ class subFile:
         # if x_data present
         # --------------------------
         if txyxy:
-            x_str = '<' + 'i' * pts
-            x_dat_pos = y_dat_pos
-            x_dat_end = x_dat_pos + (4 * pts)
-
-            x_raw = np.array(struct.unpack(x_str.encode('utf8'), data[x_dat_pos:x_dat_end]))
-            self.x = (2**(exp - 32)) * x_raw
+            if exp == 128:
+                # floating y-values come with floating x-values
+                self.x = np.frombuffer(data, order + 'f4', pts, y_dat_pos).astype(np.float64)
+            else:
+                x_raw = np.frombuffer(data, order + 'i4', pts, y_dat_pos)
+                self.x = (2.**(exp - 32)) * x_raw
 
-            y_dat_pos = x_dat_end
+            y_dat_pos += 4 * pts
 
         # --------------------------
         # extract y_data
         # --------------------------
-        y_dat_str = '<'
+        # only the bytes of the window are decoded
         if exp == 128:
             # Floating y-values
-            y_dat_str += 'f' * pts
-            y_dat_end = y_dat_pos + (4 * pts)
-            y_raw = np.array(struct.unpack(y_dat_str.encode('utf8'), data[y_dat_pos:y_dat_end]))
-            self.y = y_raw
+            y_raw = np.frombuffer(data, order + 'f4', stop - start, y_dat_pos + 4 * start)
+            self.y = y_raw.astype(dtype)
         else:
             # integer format
-            # lydata = len(data) - y_dat_pos
             if tsprec:
                 # 16 bit
-                y_dat_str += 'h' * pts  # short
-                y_dat_end = y_dat_pos + (2 * pts)
-                y_raw = np.array(struct.unpack(y_dat_str.encode('utf8'), data[y_dat_pos:y_dat_end]))
-                self.y = (2**(exp - 16)) * y_raw
+                y_raw = np.frombuffer(data, order + 'i2', stop - start, y_dat_pos + 2 * start)
+                self.y = y_raw.astype(dtype)
+                self.y *= 2.**(exp - 16)
             else:
                 # 32 bit, using size of subheader to figure out data type
                 # actually there is flag for this, use it instead
                 # self.tsprec
-                y_dat_str += 'i' * pts
-                y_dat_end = y_dat_pos + (4 * pts)
-                y_raw = np.array(struct.unpack(y_dat_str.encode('utf8'), data[y_dat_pos:y_dat_end]))
-                self.y = (2**(exp - 32)) * y_raw
+                y_raw = np.frombuffer(data, order + 'i4', stop - start, y_dat_pos + 4 * start)
+                self.y = y_raw.astype(dtype)
+                self.y *= 2.**(exp - 32)
 
+    def clip(self, xrange):
+        """ Keep only the points with x inside xrange (-xy subfiles) """
+        lo, hi = sorted(xrange)
+        keep = (self.x >= lo) & (self.x <= hi)
+        self.x = self.x[keep]
+        self.y = self.y[keep]
 
-class subFileOld:
+
+class subFileOld(subHeader):
     """
     Processes each subfile passed to it, extracts header information and data
     information and places them in data members.
@@ -117,22 +178,14 @@ class subFileOld:
 
     """
 
-    def __init__(self, data, pts, fexp, txyxy):
+    __slots__ = ()
+
+    def __init__(self, data, pts, fexp, txyxy, window=None, dtype=np.float64, heads=None, index=0):
         # fixed header size
         y_dat_pos = 32
 
         # extract subheader info
-        self.subflgs, \
-            self.subexp, \
-            self.subindx, \
-            self.subtime, \
-            self.subnext, \
-            self.subnois, \
-            self.subnpts, \
-            self.subscan, \
-            self.subwlevel, \
-            self.subresv \
-            = read_subheader(data[:y_dat_pos])
+        self._set_head(heads, index, data)
 
         # assume it is an integer unless told otherwise
         yfloat = False
@@ -151,44 +204,54 @@ class subFileOld:
         # --------------------------
 
         if txyxy:
-            x_str = 'i' * pts
-            x_dat_pos = y_dat_pos
-            x_dat_end = x_dat_pos + (4 * pts)
-
-            x_raw = np.array(struct.unpack(x_str.encode('utf8'), data[x_dat_pos:x_dat_end]))
+            x_raw = np.frombuffer(data, '<i4', pts, y_dat_pos)
             self.x = (2**(exp - 32)) * x_raw
 
-            y_dat_pos = x_dat_end
+            y_dat_pos += 4 * pts
 
         # --------------------------
         # extract y_data
         # --------------------------
 
+        # only decode the points in the window, if given
+        if window is not None and not txyxy:
+            y_dat_pos += 4 * window[0]
+            pts = window[1] - window[0]
+
         # assuming can't have 2 byte y-values, !! fix maybe
-        y_dat_end = y_dat_pos + (4 * pts)
         if yfloat:
             # floats are pretty straigtfoward
-            y_dat_str = '<' + 'f' * pts
-            y_raw = struct.unpack(y_dat_str.encode('utf8'), data[y_dat_pos:y_dat_end])
-            self.y = y_raw
+            self.y = np.frombuffer(data, '<f4', pts, y_dat_pos).astype(dtype)
         else:
-            # for old format, extract the entire array out as 1 bit unsigned
-            # integers, swap 1st and 2nd byte, as well as 3rd and 4th byte to get
-            # the final integer then scale by the exponent
-            y_dat_str = '>' + 'B' * 4 * pts
-            y_raw = struct.unpack(y_dat_str.encode('utf8'), data[y_dat_pos:y_dat_end])
-
-            y_int = []
-            for i in range(0, len(y_raw), 4):
-                y_int.append((
-                    y_raw[i + 1] * (256**3) + y_raw[i] * (256**2) +
-                    y_raw[i + 3] * (256) + y_raw[i + 2]))
-            # fix negative values by casting to np.int32 (signed int)
-            y_int = np.int32(y_int) / (2**(32 - exp))
-
-            self.y = y_int
+            # for old format, each value is stored as two little endian 16 bit
+            # words, the most significant first: swap them to get the 32 bit
+            # integer, then scale by the exponent
+            words = np.frombuffer(data, '<u2', 2 * pts, y_dat_pos).reshape(-1, 2).astype(np.uint32)
+            y_int = ((words[:, 0] << 16) | words[:, 1]).view(np.int32)
+
+            self.y = (y_int / (2**(32 - exp))).astype(dtype, copy=False)
 
         # do stuff if subflgs
         # if 1 subfile changed
         # if 8 if peak table should not be used
         # if 128 if subfile modified by arithmetic
+
+
+class subFileShimadzu(subHeader):
+    """
+    The single spectrum of a Shimadzu file, which has no subheader. The
+    subheader fields are given neutral values so it can stand in for a
+    subFile.
+
+    Data
+    ----
+    y: y-data
+    """
+
+    __slots__ = ()
+
+    def __init__(self, y, heads=None, index=0):
+        self.y = y
+
+        self._set_head(heads, index)
+        self.subnpts = len(y)
@@ -0,0 +1,229 @@
+"""
+Writer for new format (LSB) SPC files
+
+Subfiles are laid out as NumPy structured arrays (subheader + data) and
+written in bulk, so no data point is packed on its own.
+"""
+
+from __future__ import division, absolute_import, unicode_literals, print_function
+
+import time
+import struct
+import numpy as np
+
+from .spc import File
+from .global_fun import subhead_dtype
+
+head_siz = File.head_siz
+log_siz = File.log_siz
+
+# ftflg bits
+TSPREC = 0x01
+TMULTI = 0x04
+TXYXYS = 0x40
+TXVALS = 0x80
+
+dir_dtype = np.dtype([('ssfposn', '<i4'), ('ssfsize', '<i4'), ('ssftime', '<f4')])
+
+
+def _exponent(values):
+    """ Smallest exponent that keeps the scaled values inside a signed integer """
+    peak = float(np.nanmax(np.abs(values))) if np.size(values) else 0.
+    if peak == 0.:
+        return 0
+    return int(np.floor(np.log2(peak))) + 2
+
+
+def _encode(values, exp, ytype):
+    """ y (or x) values in their stored dtype """
+    if ytype == 'float':
+        return np.asarray(values, dtype='<f4')
+    if ytype == 'int16':
+        return np.round(np.ldexp(np.asarray(values, dtype=np.float64), 16 - exp)).astype('<i2')
+    return np.round(np.ldexp(np.asarray(values, dtype=np.float64), 32 - exp)).astype('<i4')
+
+
+def _bytes(text, size=None):
+    if not isinstance(text, bytes):
+        text = str(text).encode('latin-1', 'replace')
+    return text if size is None else text[:size]
+
+
+def _fdate(date):
+    """ Packed fdate field from a time.struct_time """
+    return ((date.tm_year << 20) | (date.tm_mon << 16) | (date.tm_mday << 11) |
+            (date.tm_hour << 6) | date.tm_min)
+
+
+def _is_even(x):
+    """ True if x can be regenerated from its first and last values """
+    if len(x) < 3:
+        return True
+    even = np.linspace(x[0], x[-1], num=len(x))
+    return np.allclose(x, even, rtol=0, atol=1e-6 * max(abs(x[-1] - x[0]), 1.))
+
+
+def _log_block(log):
+    """ Log structure followed by key=value text lines """
+    if isinstance(log, dict):
+        lines = [_bytes(k) + b'=' + _bytes(v) for k, v in log.items()]
+    else:
+        lines = [_bytes(line) for line in log]
+    text = b'\r\n'.join(lines) + b'\r\n'
+
+    # memory size is rounded up to 4096 bytes, as instrument software does
+    siz = log_siz + len(text)
+    logsizm = (siz + 4095) // 4096 * 4096
+    return struct.pack(File.logstc_str.encode('utf8'), len(text), logsizm, log_siz, 0, 0, b'') + text
+
+
+def encode(y, x=None, ytype='float', subtime=None, log=None, comment='',
+           fexper=10, fxtype=13, fytype=0, fztype=0, date=None, xvals=False):
+    """
+    Serialize spectra as a new format (LSB) SPC file
+
+    The layout follows the data: one spectrum gives a single subfile, a 2-D
+    y gives a multi-subfile file, and a list of x arrays (one per subfile)
+    gives an -xy file with a subfile directory. A shared x that is evenly
+    spaced is stored as ffirst/flast only, otherwise as a float x array
+    (txvals).
+
+    Arguments
+    ---------
+    y: array (n_points,) or (n_spectra, n_points), or list of arrays for -xy
+    x: array (n_points,), list of arrays for -xy, or None for 0..n_points-1
+    ytype: 'float', 'int32' or 'int16'
+        storage of the y data; integers are scaled by a per-subfile exponent
+    subtime: array (default=None)
+        z value of each subfile, 0, 1, 2, ... if not given
+    log: dict or list of str (default=None)
+        written to the log block as key=value lines
+    comment: str
+        fcmnt text
+    fexper, fxtype, fytype, fztype: int
+        experiment type and axis units, see header.fexper_op and axis_labels
+        (default: Raman spectrum, Raman shift, arbitrary intensity)
+    date: time.struct_time (default=None)
+        acquisition time, now if not given
+    xvals: bool (default=False)
+        store a shared x as a float array even if it is evenly spaced
+
+    Returns
+    -------
+    bytes
+    """
+    if ytype not in ('float', 'int32', 'int16'):
+        raise ValueError("ytype must be 'float', 'int32' or 'int16'")
+
+    xy = isinstance(x, (list, tuple)) or (x is not None and np.ndim(x) == 2)
+
+    if xy:
+        ys = [np.asarray(v, dtype=np.float64) for v in y]
+        xs = [np.asarray(v, dtype=np.float64) for v in x]
+        if len(xs) != len(ys) or any(len(a) != len(b) for a, b in zip(xs, ys)):
+            raise ValueError("every subfile needs x and y of the same length")
+    else:
+        ys = np.atleast_2d(np.asarray(y, dtype=np.float64))
+        npts = ys.shape[1]
+        x = np.arange(npts, dtype=np.float64) if x is None else np.asarray(x, dtype=np.float64)
+        if len(x) != npts:
+            raise ValueError("x has {} points, y has {}".format(len(x), npts))
+
+    nsub = len(ys)
+    subtime = np.arange(nsub, dtype=np.float64) if subtime is None else np.asarray(subtime)
+
+    flags = TSPREC if ytype == 'int16' else 0
+    if nsub > 1:
+        flags |= TMULTI
+
+    # --------------------------
+    # subfiles
+    # --------------------------
+    parts = []
+    if xy:
+        # each subfile carries its own x; the subfile exponent scales both
+        flags |= TXYXYS | TMULTI
+        fexp = 128 if ytype == 'float' else 0
+        subs = []
+        for i, (sx, sy) in enumerate(zip(xs, ys)):
+            head = np.zeros(1, dtype=subhead_dtype)
+            exp = 128 if ytype == 'float' else max(_exponent(sx), _exponent(sy))
+            head['subexp'] = exp
+            head['subindx'] = i
+            head['subtime'] = subtime[i]
+            head['subnpts'] = len(sy)
+            x_dat = _encode(sx, exp, 'float' if ytype == 'float' else 'int32')
+            subs.append(head.tobytes() + x_dat.tobytes() + _encode(sy, exp, ytype).tobytes())
+
+        # directory follows the subfiles, fnpts holds its offset
+        directory = np.zeros(nsub, dtype=dir_dtype)
+        directory['ssfsize'] = [len(s) for s in subs]
+        directory['ssfposn'] = head_siz + np.concatenate(([0], np.cumsum(directory['ssfsize'])[:-1]))
+        directory['ssftime'] = subtime
+        parts.extend(subs)
+        parts.append(directory.tobytes())
+
+        fnpts = head_siz + int(directory['ssfsize'].sum())
+        ffirst = float(min(a.min() for a in xs if len(a)))
+        flast = float(max(a.max() for a in xs if len(a)))
+    else:
+        if xvals or not _is_even(x):
+            flags |= TXVALS
+            parts.append(np.asarray(x, dtype='<f4').tobytes())
+
+        if ytype == 'float':
+            exps = np.full(nsub, 128)
+        else:
+            exps = np.array([_exponent(v) for v in ys])
+        # one exponent for the file unless subfiles have their own
+        fexp = int(exps.max()) if ytype != 'float' else 128
+        if not flags & TMULTI:
+            exps[:] = fexp
+
+        ydt = {'float': '<f4', 'int32': '<i4', 'int16': '<i2'}[ytype]
+        subs = np.zeros(nsub, dtype=np.dtype([('head', subhead_dtype), ('y', ydt, (npts,))]))
+        subs['head']['subexp'] = exps
+        subs['head']['subindx'] = np.arange(nsub)
+        subs['head']['subtime'] = subtime
+
+        if ytype == 'float':
+            subs['y'] = ys
+        else:
+            bits = 16 if ytype == 'int16' else 32
+            subs['y'] = np.round(np.ldexp(ys, (bits - exps)[:, None]))
+        parts.append(subs.tobytes())
+
+        fnpts = npts
+        ffirst = float(x[0]) if npts else 0.
+        flast = float(x[-1]) if npts else 0.
+
+    # --------------------------
+    # log and header
+    # --------------------------
+    body = b''.join(parts)
+    flogoff = 0
+    if log:
+        flogoff = head_siz + len(body)
+        body += _log_block(log)
+
+    date = time.localtime() if date is None else date
+    head = struct.pack(File.head_str.encode('utf8'),
+                       bytes([flags]), b'\x4b', bytes([fexper]), bytes([fexp]),
+                       fnpts, ffirst, flast, nsub,
+                       bytes([fxtype]), bytes([fytype]), bytes([fztype]), b'\x00',
+                       _fdate(date), b'', b'', 0, b'', _bytes(comment, 130), b'',
+                       flogoff, 0, b'\x00', b'\x00', 0, 0., b'', 0., 0, 0., b'\x00', b'')
+    return head + body
+
+
+def save(path, y, x=None, **kwargs):
+    """
+    Write spectra to a new format (LSB) SPC file, see encode() for arguments
+
+    Example
+    -------
+    >>> spc.save('/path/to/averaged.spc', y_ave, x)
+    >>> spc.save('/path/to/map.spc', stack, x, ytype='int16')
+    """
+    with open(path, 'wb') as f:
+        f.write(encode(y, x, **kwargs))
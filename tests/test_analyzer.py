@@ -0,0 +1,79 @@
+"""
+Folder runs of Analyze_RAMAN_Data on synthetic measurements
+"""
+
+from __future__ import division, absolute_import, unicode_literals, print_function
+
+import os
+import numpy as np
+
+import spc
+import Analyze_RAMAN_Data as analyzer
+
+
+def peak(x):
+    return 1. + np.exp(-((x - 520.) / 10.) ** 2)
+
+
+def read_output(path):
+    return np.genfromtxt(path, delimiter=',', skip_header=1)
+
+
+def test_union_grid_of_mismatched_axes(tmp_path):
+    x1, x2 = np.linspace(100., 1000., 46), np.linspace(300., 1200., 46)
+    spc.save(str(tmp_path / 'S_1_1.spc'), peak(x1), x1)
+    spc.save(str(tmp_path / 'S_1_2.spc'), peak(x2), x2)
+    spc.save(str(tmp_path / 'S_2_1.spc'), peak(x2), x2)
+    out = tmp_path / 'out'
+    out.mkdir()
+
+    peaks = analyzer.peak_settings('0.05', [(480., 560.)])
+    analyzer.analyze_folder(str(tmp_path), str(out), output_plot=False, grid='union', peaks=peaks)
+
+    # grain 1 covers 100 to 1200 between its two measurements, grain 2 only its own 300 to 1200
+    grain1 = read_output(str(out / 'Grain 1 - Averaged_RAMAN.csv'))
+    grain2 = read_output(str(out / 'Grain 2 - Averaged_RAMAN.csv'))
+    assert np.isfinite(grain1).all() and np.isfinite(grain2).all()
+    assert (grain1[0, 0], grain1[-1, 0]) == (100., 1200.)
+    assert (grain2[0, 0], grain2[-1, 0]) == (300., 1200.)
+
+    fits = np.genfromtxt(str(out / 'Peak Fits.csv'), delimiter=',', names=True, dtype=None, encoding='utf8')
+    np.testing.assert_allclose(fits['position'], 520., atol=0.5)
+    assert os.path.exists(str(out / 'Peaks.csv'))
+
+
+def test_bad_job_fields_are_error_events(tmp_path):
+    server = analyzer.AnalysisServer(port=0)
+    try:
+        for value in (None, 'high'):
+            events = []
+            server.run_job({'folder': str(tmp_path), 'normalized_to': value}, events.append)
+            assert [e['event'] for e in events] == ['error']
+    finally:
+        server.close()
+
+
+def test_watcher_settles_empty_vanished_and_failed_files(tmp_path):
+    out = tmp_path / 'out'
+    out.mkdir()
+    watcher = analyzer.GrainWatcher(str(tmp_path), str(out), output_plot=False, settle=2., debounce=100.)
+
+    empty, gone, bad = tmp_path / 'S_1_1.spc', tmp_path / 'S_1_2.spc', tmp_path / 'S_1_3.spc'
+    empty.write_bytes(b'')
+    gone.write_bytes(b'partial')
+    bad.write_bytes(b'not a spectrum')
+
+    assert watcher.poll_once(0.)
+    gone.unlink()
+    watcher.poll_once(3.)
+    assert str(bad) in watcher.skipped and str(empty) in watcher.skipped
+    assert not watcher.pending and not watcher.poll_once(4.)
+
+    # a skipped file is read again once it is rewritten
+    x = np.linspace(100., 1000., 46)
+    spc.save(str(bad), peak(x), x)
+    os.utime(str(bad), (10., 10.))
+    assert watcher.poll_once(10.)
+    watcher.poll_once(13.)
+    assert str(bad) in watcher.done and str(bad) not in watcher.skipped
+    assert watcher.grains[1][1].count == 1
@@ -0,0 +1,59 @@
+"""
+SPC files read out of zip and tar archives through spc.archive
+"""
+
+from __future__ import division, absolute_import, unicode_literals, print_function
+
+import os
+import tarfile
+import zipfile
+import numpy as np
+import pytest
+
+import spc
+from spc import archive
+
+
+@pytest.fixture
+def files(tmp_path):
+    """ A single spectrum and a map on disk, with their names; the map is over 1 MB, so it is memory mapped from disk """
+    rng = np.random.default_rng(3)
+    x = np.linspace(100., 1800., 300)
+    run = tmp_path / 'run'
+    run.mkdir()
+    spc.save(str(run / 'S_1_1.spc'), 50. + rng.normal(0., 5., 300), x)
+    spc.save(str(run / 'map.spc'), 50. + rng.normal(0., 5., (2000, 300)), x, ytype='int16')
+    return run, ['S_1_1.spc', 'map.spc']
+
+
+def decoded(source):
+    f = spc.File(source, verbose=False)
+    return [f.data_arrays(i) for i in range(f.fnsub)]
+
+
+@pytest.mark.parametrize('kind', ['zip', 'tar', 'tar.gz'])
+def test_member_decodes_like_the_file(files, kind):
+    run, names = files
+    path = str(run.parent / ('run.' + kind))
+    if kind == 'zip':
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as z:
+            for name in names:
+                z.write(str(run / name), 'run/' + name)
+    else:
+        with tarfile.open(path, 'w:gz' if kind.endswith('gz') else 'w') as t:
+            for name in names:
+                t.add(str(run / name), 'run/' + name)
+
+    members = archive.list_spc(path)
+    assert sorted(members) == sorted(os.path.join(path, 'run', name) for name in names)
+
+    for name in names:
+        member = os.path.join(path, 'run', name)
+        assert archive.read(member) == (run / name).read_bytes()
+        assert archive.stat(member).st_size == os.path.getsize(str(run / name))
+
+        on_disk, inside = decoded(str(run / name)), decoded(archive.source(member))
+        assert len(on_disk) == len(inside)
+        for (dx, dy), (ax, ay) in zip(on_disk, inside):
+            np.testing.assert_array_equal(ax, dx)
+            np.testing.assert_array_equal(ay, dy)
@@ -0,0 +1,28 @@
+"""
+Baselines of spc.baseline against known backgrounds
+"""
+
+from __future__ import division, absolute_import, unicode_literals, print_function
+
+import numpy as np
+
+import spc
+
+x = np.linspace(100., 1800., 1000)
+background = 50. + 0.03 * x
+peak = 100. * np.exp(-((x - 900.) / 15.) ** 2)
+
+
+def test_als_linear_background():
+    # a line has no second differences, so ALS follows it exactly
+    np.testing.assert_allclose(spc.baseline.als(background), background, atol=1e-6)
+
+    # under a peak it stays on the line, within 0.1% of the peak height
+    z = spc.baseline.als(background + peak, lam=1e6, p=0.001)
+    np.testing.assert_allclose(z, background, atol=0.1)
+
+    # and within 1% with the defaults, spectra of a stack each on their own
+    ys = np.stack([background + peak, 2. * background + peak])
+    method, params = spc.baseline.parse('als')
+    flat = spc.baseline.correct(ys, method, **params)
+    np.testing.assert_allclose(flat, np.stack([peak, peak]), atol=1.)
@@ -0,0 +1,62 @@
+"""
+SpectralCube loading and the despike shared by folder and map runs
+"""
+
+from __future__ import division, absolute_import, unicode_literals, print_function
+
+import os
+import tempfile
+import numpy as np
+import pytest
+
+import spc
+
+
+def make_map(path, n_sub=4, n_points=50):
+    x = np.linspace(100., 1000., n_points)
+    ys = 1. + np.exp(-((x - 520.) / 30.) ** 2) * np.arange(1., n_sub + 1)[:, None]
+    spc.save(str(path), ys, x)
+    return x, ys
+
+
+def test_despike_second_to_last_point():
+    # earlier folder runs left a spike on the second to last point alone
+    x = np.arange(10.)
+    y = np.ones(10)
+    y[[3, 8]] = 100.
+    spc.cube.despike(y, x)
+    np.testing.assert_array_equal(y, np.ones(10))
+
+    # a spike on the last point takes the value before it
+    y = np.ones(10)
+    y[-1] = 100.
+    spc.cube.despike(y, x)
+    np.testing.assert_array_equal(y, np.ones(10))
+
+
+def test_xrange_outside_the_data(tmp_path):
+    path = tmp_path / 'map.spc'
+    make_map(path)
+    with pytest.raises(ValueError, match='is outside the x data'):
+        spc.SpectralCube(str(path), xrange=(5000., 6000.))
+    with pytest.raises(ValueError, match='is outside the x data'):
+        spc.SpectralCube(spc.File(str(path), verbose=False), xrange=(5000., 6000.))
+
+
+def test_failed_load_removes_backing_file(tmp_path, monkeypatch):
+    path = tmp_path / 'map.spc'
+    make_map(path)
+    scratch = tmp_path / 'scratch'
+    scratch.mkdir()
+    monkeypatch.setattr(tempfile, 'tempdir', str(scratch))
+
+    f = spc.File(str(path), verbose=False)
+    f.sub[2].y = f.sub[2].y[:-1]
+    with pytest.raises(ValueError):
+        spc.SpectralCube(f)
+    assert os.listdir(str(scratch)) == []
+
+    cube = spc.SpectralCube(str(path))
+    assert len(os.listdir(str(scratch))) == 1
+    cube.close()
+    assert os.listdir(str(scratch)) == []
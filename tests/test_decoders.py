@@ -0,0 +1,200 @@
+"""
+Decoding of old format, MSB 1st and Shimadzu files built byte by byte
+"""
+
+from __future__ import division, absolute_import, unicode_literals, print_function
+
+import struct
+import numpy as np
+import pytest
+
+import spc
+from spc import header, writer
+from spc.global_fun import flag_bits
+
+
+# ------------------------------------------------------------------------
+# Old format (0x4D)
+# ------------------------------------------------------------------------
+
+def old_file(ys, first=100., last=3200., exp=12, yfloat=False):
+    """ Old format file of equal length subfiles, 32-bit integer y stored
+    as swapped 16-bit words unless yfloat """
+    npts = len(ys[0])
+    head = struct.pack(header.old_head_str.encode('utf8'), b'\x00', b'\x4d', exp, float(npts), first, last,
+                       b'\x01', b'\x00', 1990, b'\x05', b'\x06', b'\x07', b'\x08', b'res', 0, len(ys),
+                       b'', b'old comment', b'', b'')
+    out = bytearray(head[:header.old_head_siz - header.subhead_siz])
+
+    for i, y in enumerate(ys):
+        out += struct.pack('<cchfffiif4s', b'\x00', bytes([128 if yfloat else 0]), i,
+                           0., 0., 0., npts, 0, 0., b'')
+        if yfloat:
+            out += np.asarray(y, '<f4').tobytes()
+        else:
+            v = np.round(np.ldexp(y, 32 - exp)).astype(np.int64).astype(np.int32).view(np.uint32)
+            words = np.empty((npts, 2), '<u2')
+            words[:, 0] = v >> 16
+            words[:, 1] = v & 0xffff
+            out += words.tobytes()
+    return bytes(out)
+
+
+def old_spectra(n_sub=4, n_points=300):
+    return np.random.default_rng(1).normal(0, 50, (n_sub, n_points))
+
+
+@pytest.mark.parametrize('yfloat', (False, True))
+def test_old_format(yfloat):
+    ys = old_spectra()
+    f = spc.File(old_file(ys, yfloat=yfloat))
+
+    assert f.fnsub == len(ys)
+    np.testing.assert_allclose(f.x, np.linspace(100., 3200., ys.shape[1]))
+    for sub, y in zip(f.sub, ys):
+        np.testing.assert_allclose(sub.y, y, rtol=0, atol=1e-3)
+
+
+@pytest.mark.parametrize('cut', (100, 1210))
+def test_old_format_truncated(cut):
+    # ends inside the last subfile's data, or inside its subheader
+    content = old_file(old_spectra())
+
+    with pytest.raises(ValueError, match='truncated old format file'):
+        spc.File(content[:-cut])
+
+
+def test_old_format_trailing_bytes():
+    content = old_file(old_spectra())
+
+    with pytest.raises(ValueError, match='subheader 5 .* cut off after 3 of 32 bytes'):
+        spc.File(content + b'xyz')
+
+
+# ------------------------------------------------------------------------
+# New format MSB 1st (0x4C)
+# ------------------------------------------------------------------------
+
+def swap_struct(b, pos, fmt):
+    """ Re-pack the little-endian struct at pos as big-endian """
+    size = struct.calcsize('<' + fmt)
+    items = struct.unpack('<' + fmt, bytes(b[pos:pos + size]))
+    b[pos:pos + size] = struct.pack('>' + fmt, *items)
+    return items
+
+
+def swap_words(b, pos, n, size):
+    b[pos:pos + n * size] = np.frombuffer(bytes(b[pos:pos + n * size]), 'u{}'.format(size)).byteswap().tobytes()
+
+
+def to_msb(content):
+    """ The same data as a new format LSB 1st file, MSB 1st """
+    b = bytearray(content)
+    items = swap_struct(b, 0, header.head_str[1:])
+    b[1] = 0x4c
+    tsprec, _, _, _, _, _, txyxys, txvals = flag_bits(items[0])[::-1]
+    fnpts, fnsub, flogoff = items[4], items[7], items[19]
+    ybytes = 2 if tsprec else 4
+
+    def subfile(pos, pts):
+        head = swap_struct(b, pos, 'cchfffiif4s')
+        pos += header.subhead_siz
+        if txyxys:
+            pts = head[6]
+            swap_words(b, pos, pts, 4)
+            pos += 4 * pts
+        swap_words(b, pos, pts, ybytes)
+        return pos + ybytes * pts
+
+    if txyxys:
+        for i in range(fnsub):
+            subfile(swap_struct(b, fnpts + 12 * i, 'iif')[0], 0)
+    else:
+        pos = header.head_siz
+        if txvals:
+            swap_words(b, pos, fnpts, 4)
+            pos += 4 * fnpts
+        for i in range(fnsub):
+            pos = subfile(pos, fnpts)
+
+    if flogoff:
+        swap_struct(b, flogoff, header.logstc_str[1:])
+    return bytes(b)
+
+
+@pytest.mark.parametrize('ytype', ('float', 'int32', 'int16'))
+@pytest.mark.parametrize('layout', ('gx-y', 'x-y', '-xy'))
+def test_msb_matches_lsb(layout, ytype):
+    rng = np.random.default_rng(2)
+    x = np.linspace(100., 3200., 250)
+    ys = rng.normal(500., 50., (3, 250))
+    if layout == 'x-y':
+        x = x + 30. * np.sin(x / 500.)
+    if layout == '-xy':
+        x, ys = [x, x[:200] + 5.], [ys[0], ys[1][:200]]
+
+    lsb_content = writer.encode(ys, x, ytype=ytype, log={'Laser': '532 nm'})
+    lsb, msb = spc.File(lsb_content), spc.File(to_msb(lsb_content))
+
+    assert msb.fversn == b'\x4c'
+    assert msb.dat_fmt == lsb.dat_fmt == layout
+    assert msb.fnsub == lsb.fnsub
+    assert msb.log_dict == lsb.log_dict
+    for i in range(lsb.fnsub):
+        for a, b in zip(msb.data_arrays(i), lsb.data_arrays(i)):
+            np.testing.assert_array_equal(a, b)
+
+
+# ------------------------------------------------------------------------
+# Shimadzu (0xCF)
+# ------------------------------------------------------------------------
+
+def shimadzu_file(x, y, gap=6, tail=b'\x01\x02\x03trailer' * 5):
+    """ Shimadzu file: float64 y from byte 10240, a zero gap, float64 x """
+    head = bytearray(10240)
+    head[1] = 0xcf
+    return (bytes(head) + np.asarray(y, '<f8').tobytes() + b'\x00' * 8 * gap
+            + np.asarray(x, '<f8').tobytes() + tail)
+
+
+def shimadzu_spectrum(n_points=500):
+    x = np.linspace(100., 3000., n_points)
+    y = np.random.default_rng(3).normal(100., 10., n_points)
+    # a run of zeros longer than the gap inside the data, and zeros at the end
+    y[100:110] = 0.
+    y[-3:] = 0.
+    return x, y
+
+
+@pytest.mark.parametrize('tail', (b'\x01\x02\x03trailer' * 5, b'\x00' * 64, b''))
+def test_shimadzu(tail):
+    x, y = shimadzu_spectrum()
+    f = spc.File(shimadzu_file(x, y, tail=tail))
+
+    fx, fy = f.data_arrays()
+    np.testing.assert_array_equal(fx, x)
+    np.testing.assert_array_equal(fy, y)
+
+
+def test_shimadzu_descending_x():
+    x, y = shimadzu_spectrum()
+    fx, fy = spc.File(shimadzu_file(x[::-1], y)).data_arrays()
+
+    np.testing.assert_array_equal(fx, x[::-1])
+    np.testing.assert_array_equal(fy, y)
+
+
+def test_shimadzu_xrange():
+    x, y = shimadzu_spectrum()
+    fx, fy = spc.File(shimadzu_file(x, y), xrange=(300., 1200.)).data_arrays()
+
+    inside = (x >= 300.) & (x <= 1200.)
+    np.testing.assert_array_equal(fx, x[inside])
+    np.testing.assert_array_equal(fy, y[inside])
+
+
+def test_shimadzu_without_x_block():
+    x, y = shimadzu_spectrum()
+
+    with pytest.raises(ValueError, match='no y and x data blocks'):
+        spc.File(shimadzu_file(np.zeros_like(x), y))
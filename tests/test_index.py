@@ -0,0 +1,59 @@
+"""
+Indexing SPC files into spc.Index
+"""
+
+from __future__ import division, absolute_import, unicode_literals, print_function
+
+import json
+import numpy as np
+
+import spc
+
+
+def save_peak(path, lo=100., hi=1000.):
+    x = np.linspace(lo, hi, 91)
+    spc.save(str(path), 1. + 50. * np.exp(-((x - (lo + hi) / 2.) / 10.) ** 2), x)
+    return str(path)
+
+
+def test_missing_path_is_skipped(tmp_path, capsys):
+    save_peak(tmp_path / 'S_1_1.spc')
+    index = spc.Index(str(tmp_path / 'index.db'))
+
+    ids = index.add_files([str(tmp_path / 'S_1_1.spc'), str(tmp_path / 'S_1_2.spc')])
+
+    assert list(ids) == [str(tmp_path / 'S_1_1.spc')]
+    assert 'S_1_2.spc not indexed' in capsys.readouterr().out
+
+
+def test_add_and_query_round_trip(tmp_path):
+    quartz = [save_peak(tmp_path / 'Quartz_1_{}.spc'.format(k)) for k in (1, 2)]
+    feldspar = [save_peak(tmp_path / 'Feldspar_A_2_1.spc', 1200., 1800.)]
+    grains = [{'grain': 1, 'files': quartz, 'xmin': 100., 'xmax': 1000., 'data_path': 'Grain 1.csv', 'plot_path': None},
+              {'grain': 2, 'files': feldspar, 'xmin': 1200., 'xmax': 1800., 'data_path': 'Grain 2.csv', 'plot_path': 'Grain 2.png'}]
+
+    with spc.Index(str(tmp_path / 'index.db')) as index:
+        run = index.add_run(str(tmp_path), str(tmp_path / 'out'), {'normalize': 'max', 'normalized_to': 1.0}, grains)
+        ids = index.add_files(quartz + feldspar)
+
+    # queries of a reopened index
+    with spc.Index(str(tmp_path / 'index.db')) as index:
+        assert [r['id'] for r in index.runs()] == [run]
+        assert json.loads(index.runs()[0]['params']) == {'normalize': 'max', 'normalized_to': 1.0}
+
+        assert [(g['sample'], g['grain'], g['n_files']) for g in index.grains()] == [('Quartz', 1, 2), ('Feldspar_A', 2, 1)]
+        assert [g['grain'] for g in index.grains(sample='Feld*')] == [2]
+        assert [g['grain'] for g in index.grains(x=(1500., 1600.))] == [2]
+        assert [g['grain'] for g in index.grains(x=(900., 1300.), run=run)] == [1, 2]
+        assert index.grains(sample='Quartz', x=(1500., 1600.)) == []
+
+        quartz_grain = index.grains(sample='Quartz')[0]
+        assert quartz_grain['data_path'] == 'Grain 1.csv' and quartz_grain['plot_path'] is None
+        members = index.files(grain_id=quartz_grain['id'])
+        assert [f['path'] for f in members] == sorted(quartz)
+        assert [(f['grain'], f['measurement'], f['fnpts']) for f in members] == [(1, 1, 91), (1, 2, 91)]
+        np.testing.assert_allclose([members[0]['xmin'], members[0]['xmax']], [100., 1000.])
+
+        # unchanged files keep their rows
+        assert index.add_files(quartz + feldspar) == ids
+        assert len(index.files()) == 3
@@ -0,0 +1,53 @@
+"""
+Normalization modes of spc.normalize
+"""
+
+from __future__ import division, absolute_import, unicode_literals, print_function
+
+import numpy as np
+import pytest
+
+import spc
+
+x = np.linspace(100., 1000., 91)
+ys = np.stack([1. + np.exp(-((x - 520.) / 20.) ** 2), 2. + np.sin(x / 50.)])
+
+
+def test_modes():
+    y, scale, offset = spc.normalize.normalize(ys, 'max', 2.)
+    np.testing.assert_allclose(y.max(axis=1), 2.)
+    np.testing.assert_allclose(y, ys * scale[:, None])
+    np.testing.assert_array_equal(offset, 0.)
+
+    y = spc.normalize.normalize(ys, 'area', x=x).y
+    np.testing.assert_allclose(((y[:, 1:] + y[:, :-1]) / 2 * np.diff(x)).sum(axis=1), 1.)
+
+    y = spc.normalize.normalize(ys, 'band', x=x, band=(500., 540.)).y
+    np.testing.assert_allclose(y[:, (x >= 500.) & (x <= 540.)].max(axis=1), 1.)
+
+    y = spc.normalize.normalize(ys, 'l2').y
+    np.testing.assert_allclose(np.linalg.norm(y, axis=1), 1.)
+
+    y, scale, offset = spc.normalize.normalize(ys, 'snv')
+    np.testing.assert_allclose(y.mean(axis=1), 0., atol=1e-12)
+    np.testing.assert_allclose(y.std(axis=1, ddof=1), 1.)
+    np.testing.assert_allclose(offset, ys.mean(axis=1))
+
+    # a single spectrum gives scalars
+    y, scale, offset = spc.normalize.normalize(ys[0])
+    assert y.shape == x.shape and np.ndim(scale) == 0
+
+
+@pytest.mark.parametrize('mode', spc.normalize.modes)
+def test_zero_statistic(mode):
+    flat = np.vstack([ys[0], np.zeros_like(x)])
+    with pytest.raises(ValueError, match='S_1_2.spc'):
+        spc.normalize.normalize(flat, mode, x=x, band=(500., 540.), names=['S_1_1.spc', 'S_1_2.spc'])
+
+
+def test_negative_statistic():
+    # below zero after a baseline was removed, the scale would flip the spectrum
+    with pytest.raises(ValueError, match='spectrum 1: its area is -'):
+        spc.normalize.normalize(np.vstack([ys[0], ys[1] - 5.]), 'area', x=x)
+    with pytest.raises(ValueError, match='spectrum 0: its maximum is nan'):
+        spc.normalize.normalize(np.full((1, 5), np.nan))
@@ -0,0 +1,51 @@
+"""
+Peak finding and fitting of spc.peaks on synthetic Lorentzians
+"""
+
+from __future__ import division, absolute_import, unicode_literals, print_function
+
+import numpy as np
+
+import spc
+
+x = np.linspace(400., 700., 601)
+
+
+def lorentzian(centre, fwhm, height, offset=2.):
+    return offset + height / (1. + ((x - centre) / (fwhm / 2.)) ** 2)
+
+
+def test_fit_recovers_lorentzian():
+    # centres off the grid, two spectra fitted as one batch
+    truth = np.array([(521.3, 7.5, 40.), (518.8, 12., 15.)])
+    ys = np.stack([lorentzian(*t) for t in truth])
+
+    table = spc.peaks.fit(x, ys, [(480., 560.)])
+
+    assert list(table.grain) == [0, 1] and table.converged.all()
+    np.testing.assert_allclose(table.position, truth[:, 0], atol=1e-6)
+    np.testing.assert_allclose(table.fwhm, truth[:, 1], rtol=1e-6)
+    np.testing.assert_allclose(table.height, truth[:, 2], rtol=1e-6)
+    np.testing.assert_allclose(table.offset, 2., atol=1e-6)
+    np.testing.assert_allclose(table.area, np.pi / 2. * truth[:, 1] * truth[:, 2], rtol=1e-6)
+
+
+def test_fit_with_noise_is_within_its_errors():
+    rng = np.random.default_rng(7)
+    sem = np.full_like(x, 0.2)
+    y = lorentzian(521.3, 7.5, 40.) + rng.normal(0., 0.2, len(x))
+
+    table = spc.peaks.fit(x, y, [(480., 560.)], sem=sem, max_peaks=1)
+
+    for name, value in (('position', 521.3), ('fwhm', 7.5), ('height', 40.)):
+        fitted, err = getattr(table, name)[0], getattr(table, name + '_err')[0]
+        assert 0 < err and abs(fitted - value) < 4 * err, name
+
+
+def test_find_lorentzian():
+    found = spc.peaks.find(lorentzian(550., 10., 20.), x)
+    assert len(found.grain) == 1
+    np.testing.assert_allclose(found.position, 550.)
+    np.testing.assert_allclose(found.height, 22.)
+    # the flanks are not quite down to the offset at the ends, so the prominence is a little short of the height
+    np.testing.assert_allclose(found.width, 10., rtol=0.05)
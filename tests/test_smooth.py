@@ -0,0 +1,33 @@
+"""
+Savitzky-Golay filters of spc.smooth against the published tables
+"""
+
+from __future__ import division, absolute_import, unicode_literals, print_function
+
+import numpy as np
+import pytest
+
+import spc
+
+# centre point convolution coefficients of Savitzky and Golay (1964), as
+# (window, order, deriv): (coefficients, normalization)
+tables = {
+    (5, 2, 0): ([-3, 12, 17, 12, -3], 35),
+    (7, 2, 0): ([-2, 3, 6, 7, 6, 3, -2], 21),
+    (5, 3, 0): ([-3, 12, 17, 12, -3], 35),
+    (7, 3, 0): ([-2, 3, 6, 7, 6, 3, -2], 21),
+    (5, 2, 1): ([-2, -1, 0, 1, 2], 10),
+    (7, 2, 1): ([-3, -2, -1, 0, 1, 2, 3], 28),
+    (5, 3, 1): ([1, -8, 0, 8, -1], 12),
+    (7, 3, 1): ([22, -67, -58, 0, 58, 67, -22], 252),
+    (5, 2, 2): ([2, -1, -2, -1, 2], 7),
+    (7, 2, 2): ([5, 0, -3, -4, -3, 0, 5], 42),
+}
+
+
+@pytest.mark.parametrize('key', sorted(tables))
+def test_published_tables(key):
+    window, order, deriv = key
+    coefficients, norm = tables[key]
+    centre = spc.smooth.filters(window, order, deriv)[window // 2]
+    np.testing.assert_allclose(centre, np.array(coefficients) / norm, atol=1e-12)
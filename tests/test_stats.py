@@ -0,0 +1,104 @@
+"""
+Streaming mean and variance of spc.Accumulator
+"""
+
+from __future__ import division, absolute_import, unicode_literals, print_function
+
+import numpy as np
+
+import spc
+
+
+def test_mismatched_axes():
+    # a grid spanning both spectra: each covers only part of it
+    x1, x2 = np.linspace(100., 1000., 46), np.linspace(300., 1200., 46)
+    grid = spc.common_grid([x1, x2], 'union')
+    stack = spc.resample([x1, x2], [np.full(46, 1.), np.full(46, 3.)], grid)
+    assert np.isnan(stack).any()
+
+    acc = spc.Accumulator()
+    acc.add_stack(stack)
+
+    assert np.isfinite(acc.mean).all()
+    only1, only2, both = grid < 300., grid > 1000., (grid >= 300.) & (grid <= 1000.)
+    np.testing.assert_array_equal(acc.n, only1 + only2 + 2 * both)
+    np.testing.assert_allclose(acc.mean[only1], 1.)
+    np.testing.assert_allclose(acc.mean[only2], 3.)
+    np.testing.assert_allclose(acc.mean[both], 2.)
+    np.testing.assert_allclose(acc.sem()[both], 1.)
+    np.testing.assert_array_equal(acc.sem()[only1 | only2], 0.)
+
+
+def test_nan_points_merged():
+    rng = np.random.default_rng(4)
+    ys = rng.normal(10., 2., (9, 30))
+    ys[rng.random(ys.shape) < 0.2] = np.nan
+    ys[:, 0] = np.nan
+
+    parts = [spc.Accumulator() for _ in range(3)]
+    for k, acc in enumerate(parts):
+        for y in ys[k::3]:
+            acc.add(y)
+    acc = parts[0].merge(parts[1]).merge(parts[2])
+
+    assert np.isnan(acc.mean[0]) and acc.n[0] == 0
+    np.testing.assert_array_equal(acc.n, (~np.isnan(ys)).sum(axis=0))
+    np.testing.assert_allclose(acc.mean[1:], np.nanmean(ys[:, 1:], axis=0))
+    np.testing.assert_allclose(acc.std()[1:], np.nanstd(ys[:, 1:], axis=0, ddof=1))
+
+
+def test_matches_numpy():
+    rng = np.random.default_rng(1)
+    ys = rng.normal(5., 3., (17, 40))
+
+    one = spc.Accumulator()
+    for y in ys:
+        one.add(y)
+    stack = spc.Accumulator()
+    stack.add_stack(ys)
+
+    for acc in (one, stack):
+        assert acc.count == 17
+        np.testing.assert_allclose(acc.mean, np.mean(ys, axis=0))
+        np.testing.assert_allclose(acc.std(), np.std(ys, axis=0, ddof=1))
+        np.testing.assert_allclose(acc.variance(0), np.var(ys, axis=0))
+        np.testing.assert_allclose(acc.sem(), np.std(ys, axis=0, ddof=1) / np.sqrt(17))
+
+
+def test_merge():
+    rng = np.random.default_rng(2)
+    ys = rng.normal(-2., 0.5, (23, 12)) + np.linspace(0., 100., 12)
+
+    # Chan's combination of uneven parts gives the statistics of the whole
+    parts = [spc.Accumulator() for _ in range(3)]
+    parts[0].add(ys[0])
+    parts[1].add_stack(ys[1:9])
+    parts[2].add_stack(ys[9:])
+    acc = spc.Accumulator().merge(parts[0]).merge(parts[1]).merge(parts[2]).merge(spc.Accumulator())
+
+    assert acc.count == 23
+    np.testing.assert_array_equal(acc.n, 23)
+    np.testing.assert_allclose(acc.mean, np.mean(ys, axis=0))
+    np.testing.assert_allclose(acc.std(), np.std(ys, axis=0, ddof=1))
+
+
+def test_empty():
+    acc = spc.Accumulator()
+    assert acc.count == 0 and acc.mean is None
+    assert acc.variance().shape == acc.sem().shape == (0,)
+
+    acc = spc.Accumulator(5)
+    acc.add_stack(np.empty((0, 5)))
+    assert acc.count == 0 and np.isnan(acc.mean).all()
+    np.testing.assert_array_equal(acc.sem(), np.zeros(5))
+
+
+def test_single_sample():
+    y = np.arange(8.)
+    acc = spc.Accumulator(dtype=np.float32)
+    acc.add(y)
+
+    assert acc.count == 1 and acc.mean.dtype == np.float32
+    np.testing.assert_array_equal(acc.mean, y)
+    np.testing.assert_array_equal(acc.std(), np.zeros(8))
+    np.testing.assert_array_equal(acc.sem(), np.zeros(8))
@@ -0,0 +1,104 @@
+"""
+Round trips of spc.writer output through spc.File
+"""
+
+from __future__ import division, absolute_import, unicode_literals, print_function
+
+import numpy as np
+import pytest
+
+import spc
+from spc import writer
+
+YTYPES = ('float', 'int32', 'int16')
+
+
+def spectra(n_sub, n_points=200, seed=0):
+    """ x and y of Raman-like spectra: background, two peaks and noise """
+    rng = np.random.default_rng(seed)
+    x = np.linspace(100., 3200., n_points)
+    peaks = 1000. / (1 + ((x - 520.) / 4.) ** 2) + 400. / (1 + ((x - 1580.) / 12.) ** 2)
+    ys = 50. + 0.02 * x + peaks * rng.uniform(0.5, 1.5, (n_sub, 1)) + rng.normal(0, 5, (n_sub, n_points))
+    return x, ys
+
+
+def tolerance(y, ytype):
+    """ Largest rounding error of the stored y values """
+    if ytype == 'float':
+        return np.abs(y).max() * 2. ** -23
+    bits = 16 if ytype == 'int16' else 32
+    return np.abs(y).max() * 2. ** (2 - bits)
+
+
+def check(f, xs, ys, ytype):
+    assert f.fnsub == len(ys)
+    for i, (x, y) in enumerate(zip(xs, ys)):
+        fx, fy = f.data_arrays(i)
+        assert len(fx) == len(fy) == len(y)
+        np.testing.assert_allclose(fx, x, rtol=0, atol=np.abs(x).max() * 2. ** -22)
+        # -xy subfiles scale x and y by one exponent
+        scale = np.concatenate((x, y)) if f.dat_fmt == '-xy' else y
+        np.testing.assert_allclose(fy, y, rtol=0, atol=tolerance(scale, ytype))
+
+
+@pytest.mark.parametrize('ytype', YTYPES)
+@pytest.mark.parametrize('n_sub', (1, 3))
+def test_gxy(ytype, n_sub):
+    x, ys = spectra(n_sub)
+    f = spc.File(writer.encode(ys[0] if n_sub == 1 else ys, x, ytype=ytype))
+
+    assert f.dat_fmt == 'gx-y'
+    assert not f.txvals
+    check(f, [x] * n_sub, ys, ytype)
+
+
+@pytest.mark.parametrize('ytype', YTYPES)
+@pytest.mark.parametrize('n_sub', (1, 3))
+def test_xy(ytype, n_sub):
+    x, ys = spectra(n_sub)
+    x = x + 30. * np.sin(x / 500.)
+    f = spc.File(writer.encode(ys[0] if n_sub == 1 else ys, x, ytype=ytype))
+
+    assert f.dat_fmt == 'x-y'
+    check(f, [x] * n_sub, ys, ytype)
+
+
+@pytest.mark.parametrize('ytype', YTYPES)
+@pytest.mark.parametrize('n_sub', (1, 3))
+def test_subfile_xy(ytype, n_sub):
+    xs, ys = [], []
+    for i in range(n_sub):
+        x, y = spectra(1, 150 + 25 * i, seed=i)
+        xs.append(x + 10. * i)
+        ys.append(y[0])
+    f = spc.File(writer.encode(ys, xs, ytype=ytype))
+
+    assert f.dat_fmt == '-xy'
+    check(f, xs, ys, ytype)
+
+
+def test_evenly_spaced_stored_as_xvals():
+    x, ys = spectra(2)
+    f = spc.File(writer.encode(ys, x, xvals=True))
+
+    assert f.dat_fmt == 'x-y'
+    check(f, [x, x], ys, 'float')
+
+
+def test_header_and_log():
+    x, ys = spectra(1)
+    f = spc.File(writer.encode(ys[0], x, comment='quartz grain 1', subtime=[2.5],
+                               log={'Laser': '532 nm'}))
+
+    assert f.fversn == b'\x4b'
+    assert 'quartz grain 1' in f.fcmnt
+    assert f.sub[0].subtime == 2.5
+    assert f.log_dict[b'Laser'] == b'532 nm'
+
+
+def test_save(tmp_path):
+    x, ys = spectra(2)
+    path = str(tmp_path / 'stack.spc')
+    spc.save(path, ys, x, ytype='int16')
+
+    check(spc.File(path), [x, x], ys, 'int16')